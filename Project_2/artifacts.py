@@ -0,0 +1,121 @@
+"""
+filename:     artifacts.py
+description:  On-demand emission of the compiler's artifacts (console
+              dumps and .dot/labeled files), streamed to their files
+              line by line, optionally by a background writer thread.
+              Created for CS 554 (Compiler Construction) at UNM.
+"""
+
+import queue
+import threading
+
+# The artifacts the compiler can emit, in the order it produces them:
+# console dumps of the source, tokens, parse tree (PT), AST and
+# assembly code, the .dot files of the PT, AST, decorated AST and the
+# CFG before and after optimization, the labeled source, the live
+# variable analysis equations (and their solution), and the snapshot of
+# the optimized CFG and its analysis (see snapshot.py).
+artifact_names = ['source', 'tokens', 'pt', 'ast', 'pt-dot', 'ast-dot',
+                  'decorated-dot', 'labeled', 'cfg-dot', 'equations',
+                  'optimized-cfg-dot', 'cfg-snapshot', 'assembly']
+
+def write_file(filename, lines):
+    '''
+    Write lines (an iterable of strings) to the named file, separated
+    by newlines (with none after the last line), one at a time.
+    '''
+    with open(filename, "w") as f:
+        separator = ""
+        for line in lines:
+            f.write(separator)
+            f.write(line)
+            separator = "\n"
+
+class ArtifactWriter:
+    '''
+    ArtifactWriter(requested, background=False) keeps track of the
+    artifacts requested for a compile (see artifact_names), so that
+    the compiler can skip all the work for the others:
+
+        artifacts = ArtifactWriter(['ast-dot', 'equations'])
+        if 'ast-dot' in artifacts:
+            generate_dot_from_tree(ast, filename, artifacts.write_file)
+        ...
+        artifacts.close()
+
+    Its write_file() streams the lines of a file as they are generated.
+    With background=True, it only joins them into chunks, and a writer
+    thread writes the chunks (in order), so the compile goes on while
+    the files are written; the lines are still generated in the
+    calling thread, since they describe trees and graphs the compile
+    goes on to change. close() waits for the writer thread, and raises
+    any error it ran into; the files are complete only after close().
+    '''
+
+    # lines per chunk handed to the writer thread
+    chunk_lines = 4096
+
+    def __init__(self, requested=(), background=False):
+        self.requested = set(requested)
+        self.queue = None
+        self.thread = None
+        self.error = None
+        if background:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._writer, daemon=True)
+            self.thread.start()
+
+    def __contains__(self, name):
+        return name in self.requested
+
+    def write_file(self, filename, lines):
+        '''
+        Write lines to the named file, as write_file() does, in the
+        writer thread if there is one.
+        '''
+        if self.thread is None:
+            write_file(filename, lines)
+            return
+        self.queue.put(('open', filename))
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == self.chunk_lines:
+                self.queue.put(('lines', chunk))
+                chunk = []
+        self.queue.put(('lines', chunk))
+        self.queue.put(('close', None))
+
+    def _writer(self):
+        f = None
+        separator = ""
+        while True:
+            action, argument = self.queue.get()
+            if action is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                if action == 'open':
+                    f = open(argument, "w")
+                    separator = ""
+                elif action == 'lines':
+                    if argument:
+                        f.write(separator)
+                        f.write("\n".join(argument))
+                        separator = "\n"
+                else:
+                    f.close()
+            except OSError as error:
+                self.error = error
+
+    def close(self):
+        '''
+        Finish writing the files and stop the writer thread (if any).
+        '''
+        if self.thread is not None:
+            self.queue.put((None, None))
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
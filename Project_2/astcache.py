@@ -0,0 +1,173 @@
+"""
+filename:     astcache.py
+description:  A compact binary file format for abstract syntax trees
+              (ASTs) stored in an AstArena, and an on-disk cache of
+              them keyed by a hash of the source text, so that an
+              unchanged program need not be scanned and parsed again.
+              Created for CS 554 (Compiler Construction) at UNM.
+"""
+
+from array import array
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from trees import AstArena, AstNode, ast_kinds
+
+# The format of an AST file: a fixed header, then the typed columns of
+# the arena (see AstArena.columns) plus a value_ids column, each as raw
+# native-order machine words starting at a multiple of 8 bytes, then a
+# JSON trailer with ast_kinds and the pool of distinct node values, so
+# that the value of a node is pool[value_ids[node]].
+# Bump FORMAT_VERSION whenever the layout changes.
+FORMAT_MAGIC = b'WAST'
+FORMAT_VERSION = 1
+
+# magic, version, byte order (1 = little-endian), size of an 'i' item,
+# flags (1 = contiguous), number of nodes, number of edges, handle of
+# the root, size of the trailer, SHA-256 of the source text
+_header = struct.Struct('<4sHBBIQQqQ32s')
+
+_CONTIGUOUS = 1
+
+def source_digest(code):
+    '''
+    The SHA-256 digest of the source text code, as bytes.
+    '''
+    return hashlib.sha256(code.encode()).digest()
+
+def cache_file(directory, name, code):
+    '''
+    The path of the cache file for the program name with source text
+    code, in directory: the name plus a hash of the text, so that an
+    edited program never finds the AST of its old text.
+    '''
+    return os.path.join(directory,
+                        f"{name}-{source_digest(code).hex()[:16]}.ast")
+
+class _PooledValues:
+    '''
+    The values column of a frozen arena: the value of each node looked
+    up in the pool of distinct values as it is asked for.
+    '''
+
+    __slots__ = ('pool', 'ids')
+
+    def __init__(self, pool, ids):
+        self.pool = pool
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, handle):
+        return self.pool[self.ids[handle]]
+
+    def __iter__(self):
+        pool = self.pool
+        return (pool[i] for i in self.ids)
+
+def _sections(num_nodes, num_edges):
+    '''
+    The (column name, type code, offset, size in bytes) of each column
+    of a file with the given numbers of nodes and edges, and the offset
+    of the trailer.
+    '''
+    int_size = struct.calcsize('i')
+    sections = []
+    offset = _header.size
+    for name, code in AstArena.columns + [('value_ids', 'i')]:
+        size = (num_edges if name == 'edges' else num_nodes) * (
+                1 if code == 'B' else int_size)
+        sections.append((name, code, offset, size))
+        offset += size + (-size % 8)
+    return sections, offset
+
+def save_ast(filename, root, code):
+    '''
+    Write the AST at root (an AstNode) to filename, as the AST of the
+    source text code. The file is written under a temporary name and
+    then renamed, so a reader never sees a partly written file.
+    '''
+    arena = root.arena
+    pool, value_ids, ids = [], array('i'), {}
+    for value in arena.values:
+        key = (type(value), value)
+        if key not in ids:
+            ids[key] = len(pool)
+            pool.append(value)
+        value_ids.append(ids[key])
+    columns = {name: getattr(arena, name) for name, _ in AstArena.columns}
+    columns['value_ids'] = value_ids
+    trailer = json.dumps({'kinds': ast_kinds, 'values': pool}).encode()
+
+    sections, trailer_offset = _sections(len(arena), len(arena.edges))
+    buffer = bytearray(trailer_offset + len(trailer))
+    _header.pack_into(buffer, 0, FORMAT_MAGIC, FORMAT_VERSION,
+                      sys.byteorder == 'little', struct.calcsize('i'),
+                      _CONTIGUOUS if arena.contiguous else 0,
+                      len(arena), len(arena.edges), root.handle,
+                      len(trailer), source_digest(code))
+    for name, _, offset, size in sections:
+        buffer[offset:offset + size] = columns[name].tobytes()
+    buffer[trailer_offset:] = trailer
+
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(buffer)
+    os.replace(temporary, filename)
+
+def load_ast(filename, code):
+    '''
+    Load the AST saved in filename for the source text code, and return
+    its root, an AstNode in a frozen AstArena whose columns are views
+    of a copy-on-write memory map of the file, so nothing is copied or
+    parsed but the small trailer. Return None if there is no such file,
+    or if it was written for another text, by another version of the
+    format, or on a machine with another byte order or word size.
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        return None
+    if len(data) < _header.size:
+        return None
+    (magic, version, little, int_size, flags, num_nodes, num_edges, root,
+     trailer_size, digest) = _header.unpack_from(data, 0)
+    if (magic != FORMAT_MAGIC or version != FORMAT_VERSION
+            or little != (sys.byteorder == 'little')
+            or int_size != struct.calcsize('i')
+            or digest != source_digest(code)):
+        return None
+    sections, trailer_offset = _sections(num_nodes, num_edges)
+    if len(data) != trailer_offset + trailer_size:
+        return None
+    trailer = json.loads(data[trailer_offset:].decode())
+    if trailer['kinds'] != ast_kinds:
+        return None
+
+    buffer = memoryview(data)
+    columns = {name: buffer[offset:offset + size].cast(type_code)
+               for name, type_code, offset, size in sections}
+    arena = AstArena()
+    for name, _ in AstArena.columns:
+        setattr(arena, name, columns[name])
+    arena.values = _PooledValues(trailer['values'], columns['value_ids'])
+    arena.contiguous = bool(flags & _CONTIGUOUS)
+    arena.frozen = True
+    return AstNode(arena, root)
+
+def remove_stale(directory, name, keep):
+    '''
+    Remove the cache files of the program name in directory other than
+    keep (those of its earlier texts).
+    '''
+    pattern = glob.escape(name) + "-" + "[0-9a-f]" * 16 + ".ast"
+    for filename in glob.glob(os.path.join(glob.escape(directory), pattern)):
+        if os.path.abspath(filename) != os.path.abspath(keep):
+            os.remove(filename)
@@ -1,9 +1,48 @@
+from artifacts import write_file
+from dominance import Dominators, LoopForest
+from frequency import Frequencies
+from traversal import Rewriter
+
+class _ContentWriter(Rewriter):
+    """
+    The Rewriter behind CFG.cfg_content_from_ast(), which turns each
+    node of an assignment or a condition into its .while code.
+    """
+    ops = ["=", "<", ">", "<=", ">=", "and", "add", "sub", "mult", "or", "assign"]
+
+    def rewrite_default(self, node, results):
+        return None
+
+    def _leaf(self, node, results):
+        return f"{node.value}"
+
+    rewrite_int = rewrite_var = rewrite_true = rewrite_false = _leaf
+    rewrite_skip = _leaf
+
+    def _binary(self, node, results):
+        left, right = results
+        if node.type != "assign":
+            if node.children[0].type in self.ops:
+                left = f"({left})"
+            if node.children[1].type in self.ops:
+                right = f"({right})"
+        return f"{left} {node.value} {right}"
+
+    rewrite_eq = rewrite_lt = rewrite_gt = rewrite_le = rewrite_ge = _binary
+    rewrite_and = rewrite_or = _binary
+    rewrite_add = rewrite_sub = rewrite_mult = rewrite_assign = _binary
+
+    def rewrite_not(self, node, results):
+        return f"NOT[{results[0]}]"
+
 class CFG_Node:
     """
     A CFG node containing the AST node associated with its block of code,
     the type of CFG node it is ("entry", "exit", "condition", or "other"),
     its associated label, the content from the AST, and a list of
-    successors and predecessors in the graph.
+    successors and predecessors in the graph. Its id is its position
+    in the list of all nodes of its CFG (see CFG.nodes), which the
+    analyses index their lists of sets by.
 
     """
     def __init__(self, label, ast=None, type=None, content=None):
@@ -11,35 +50,232 @@ class CFG_Node:
         self.type = type
         self.label = label
         self.content = content
+        self.id = None
 
         self.succ = []
         self.pred = []
     
     def get_all_predecessors(self):
-        def get_preds(predecessor, visited):
-            if predecessor not in visited: 
-                visited.append(predecessor)
-                for pred in predecessor.pred:
-                    get_preds(pred, visited)
-        
-        predecessors = []
-        for pred in self.pred:
-            get_preds(pred, predecessors)
-
-        return predecessors
+        """
+        All the nodes this node can be reached from, in depth-first
+        order. For many queries on the same CFG, CFG.reachability()
+        answers them from an index instead.
+        """
+        return _depth_first(self.pred, lambda node: node.pred)
     
     def get_all_successors(self):
-        def get_succs(successor, visited):
-            if successor not in visited: 
-                visited.append(successor)
-                for succ in successor.succ:
-                    get_succs(succ, visited)
-        
-        successors = []
-        for succ in self.succ:
-            get_succs(succ, successors)
+        """
+        All the nodes reachable from this node, in depth-first order.
+        For many queries on the same CFG, CFG.reachability() answers
+        them from an index instead.
+        """
+        return _depth_first(self.succ, lambda node: node.succ)
+
+def _depth_first(start, neighbors):
+    """
+    The nodes reached from the list of nodes start by following
+    neighbors(node), in depth-first preorder, with an explicit stack
+    and a set of the nodes visited.
+    """
+    visited = []
+    seen = set()
+    stack = list(reversed(start))
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            visited.append(node)
+            stack.extend(reversed(neighbors(node)))
+    return visited
+
+class Reachability:
+    """
+    An index of which nodes of a CFG are reachable from which, built
+    once (see CFG.reachability()) and answering each query without
+    searching the graph. The strongly connected components of the CFG
+    (its loops) are found with Tarjan's algorithm, and the transitive
+    closure of the graph of components (which has no cycles) is kept
+    as one Python int per component, a bitset with bit i set when the
+    node whose id is i is reachable (by at least one edge). Nodes of a
+    component share its bitsets, for their successors and for their
+    predecessors.
+
+    Args:
+        nodes: list of CFG nodes, each with its position in the list as
+            its id (as CFG.nodes)
+    """
+    def __init__(self, nodes):
+        self.nodes = nodes
+        succ = [[s.id for s in node.succ] for node in nodes]
+        pred = [[p.id for p in node.pred] for node in nodes]
+        self.component, components = self._components(succ)
+        self.succ_bits = self._closure(components, succ)
+        self.pred_bits = self._closure(list(reversed(components)), pred)
+
+    def _components(self, succ):
+        """
+        Find the strongly connected components of the graph (Tarjan's
+        algorithm, with an explicit stack), in the order the algorithm
+        completes them: every component comes after all those it
+        reaches. Returns the component of each node and the list of
+        components (lists of node ids).
+        """
+        n = len(succ)
+        index = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        component = [-1] * n
+        components = []
+        stack = []
+        counter = 0
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, i = work.pop()
+                if i == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                else:
+                    # back from the successor before position i
+                    low[v] = min(low[v], low[succ[v][i - 1]])
+                while i < len(succ[v]):
+                    w = succ[v][i]
+                    if index[w] == -1:
+                        break
+                    if on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                    i += 1
+                if i < len(succ[v]):
+                    work.append((v, i + 1))
+                    work.append((succ[v][i], 0))
+                    continue
+                if low[v] == index[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component[w] = len(components)
+                        members.append(w)
+                        if w == v:
+                            break
+                    components.append(members)
+        return component, components
+
+    def _closure(self, components, edges):
+        """
+        The bitset of the nodes reachable from each component along
+        edges, given the components in an order where every component
+        comes after all those it reaches along edges.
+        """
+        component = self.component
+        bits = [0] * len(components)
+        for members in components:
+            c = component[members[0]]
+            reach = 0
+            cyclic = len(members) > 1
+            for v in members:
+                for w in edges[v]:
+                    d = component[w]
+                    if d == c:
+                        cyclic = True
+                    else:
+                        reach |= bits[d]
+                    reach |= 1 << w
+            if cyclic:
+                for v in members:
+                    reach |= 1 << v
+            bits[c] = reach
+        return bits
+
+    def _nodes(self, bits):
+        nodes = []
+        while bits:
+            low = bits & -bits
+            nodes.append(self.nodes[low.bit_length() - 1])
+            bits ^= low
+        return nodes
+
+    def reaches(self, source, target):
+        """
+        True if target can be reached from source (by at least one edge).
+        """
+        return (self.succ_bits[self.component[source.id]] >> target.id) & 1 == 1
+
+    def successors(self, node):
+        """
+        All the nodes reachable from node, in the order of the CFG.
+        """
+        return self._nodes(self.succ_bits[self.component[node.id]])
+
+    def predecessors(self, node):
+        """
+        All the nodes node can be reached from, in the order of the CFG.
+        """
+        return self._nodes(self.pred_bits[self.component[node.id]])
+
+    def in_loop(self, node):
+        """
+        True if node is on a cycle of the CFG (in a loop).
+        """
+        return self.reaches(node, node)
+
+class BasicBlock:
+    """
+    A basic block of the CFG: a maximal run of CFG nodes that control
+    only enters at the first node and only leaves after the last one
+    (which may be a condition), in the order they are laid out in the
+    code. Its label is the label of its first node, its id is its
+    position in the list of blocks, and its successors and
+    predecessors are blocks (see basic_blocks()).
+    """
+    def __init__(self, nodes, id=None):
+        self.nodes = nodes
+        self.id = id
+        self.label = nodes[0].label
+        self.type = nodes[-1].type
 
-        return successors
+        self.succ = []
+        self.pred = []
+
+def basic_blocks(nodes, single=False):
+    """
+    Group a list of CFG nodes, in the order they are laid out in the
+    code (as CFG.nodes), into basic blocks: a node joins the block of
+    the node before it when that is a statement whose only successor
+    is this node, and this node has no other predecessor. The entry
+    and exit nodes are always blocks of their own.
+
+    Args:
+        nodes: list of CFG nodes, each with its position in the list as
+            its id (as CFG.nodes)
+        single: if True, make every node a block of its own (as the
+            CFG was handled before it had basic blocks)
+
+    Returns: list of BasicBlocks, in the same order
+    """
+    blocks = []
+    block_of = [None] * len(nodes)
+    previous = None
+    for node in nodes:
+        if (not single and previous is not None
+                and previous.type == "other" and node.type != "exit"
+                and len(previous.succ) == 1 and previous.succ[0] is node
+                and len(node.pred) == 1):
+            blocks[-1].nodes.append(node)
+            blocks[-1].type = node.type
+        else:
+            blocks.append(BasicBlock([node], len(blocks)))
+        block_of[node.id] = blocks[-1]
+        previous = node
+    for block in blocks:
+        for succ in block.nodes[-1].succ:
+            block.succ.append(block_of[succ.id])
+            block_of[succ.id].pred.append(block)
+    return blocks
 
 class CFG:
     """
@@ -47,10 +283,22 @@ class CFG:
 
     Args:
         ast: decorated AST root node
+        context: optional CompilationContext (see context.py) the CFG
+            is recorded in, and reports its messages through
     """
-    def __init__(self, ast):
+    def __init__(self, ast, context=None):
+        self.context = context
+        self.log = print
+        if context is not None:
+            context.passes['cfg'] = self
+            self.log = context.log
+
         # list of all nodes
         self.nodes = []
+        # the number of times the CFG has been changed, and the analyses
+        # of it as it is now, by name (see _analysis())
+        self.version = 0
+        self._analyses = {}
         # set up entry and exit nodes
         self.entry = CFG_Node(label="entry", ast=ast, type='entry', content='ENTRY')
         self.exit = CFG_Node(label="exit", type='exit', content='EXIT')
@@ -64,12 +312,42 @@ class CFG:
         # add the entry and exit nodes to the list of all nodes
         self.nodes.insert(0, self.entry)
         self.nodes.append(self.exit)
+        self._number()
 
         # retroactively add nodes to their successor's predecessors
         for node in self.nodes:
             for succ in node.succ:
                 succ.pred.append(node)
     
+    @classmethod
+    def from_nodes(cls, nodes, context=None):
+        """
+        A CFG made of nodes already linked together (e.g. loaded from a
+        snapshot, see snapshot.py) instead of built from an AST: nodes
+        is the list of all its nodes, with the entry node first and
+        the exit node last, and they are numbered by their position.
+        """
+        cfg = cls.__new__(cls)
+        cfg.context = context
+        cfg.log = print
+        if context is not None:
+            context.passes['cfg'] = cfg
+            cfg.log = context.log
+        cfg.nodes = list(nodes)
+        cfg.version = 0
+        cfg._analyses = {}
+        cfg.entry = cfg.nodes[0]
+        cfg.exit = cfg.nodes[-1]
+        cfg._number()
+        return cfg
+
+    def _number(self):
+        """
+        Give every node its position in self.nodes as its id.
+        """
+        for id, node in enumerate(self.nodes):
+            node.id = id
+
     def node_from_cfg(self, ast, next_node):
         """
             Generates CFG node from the decorated AST.
@@ -77,26 +355,110 @@ class CFG:
             Args:
                 ast: the decorated AST node associated with this CFG node
                 next_node: the successor of the CFG node currently being created
+
+            Rather than recursing into seq, while and if nodes, this keeps
+            an explicit stack of work, so long or deeply nested programs
+            do not reach Python's recursion limit. Each item on the stack
+            is either ("visit", ast, next_node), which builds the CFG for
+            ast and pushes its first node onto the results stack, or a
+            (kind, ...) continuation that pops the results it waits for.
+        """
+        results = []
+        work = [("visit", ast, next_node)]
+        while work:
+            item = work.pop()
+            if item[0] == "seq":
+                # the rest of the sequence is built, so build its head
+                _, ast = item
+                work.append(("visit", ast.children[0], results.pop()))
+            elif item[0] == "while":
+                _, node, next_node = item
+                node.succ.append(results.pop())
+                node.succ.append(next_node)
+                results.append(node)
+            elif item[0] == "if":
+                _, node = item
+                else_node = results.pop()
+                node.succ.append(results.pop())
+                node.succ.append(else_node)
+                results.append(node)
+            else:
+                _, ast, next_node = item
+                if ast.type == "seq":
+                    work.append(("seq", ast))
+                    work.append(("visit", ast.children[1], next_node))
+                elif ast.type in ["assign", "skip"]:
+                    node = CFG_Node(label=ast.l, ast=ast, type="other", content=self.cfg_content_from_ast(ast))
+                    self.nodes.append(node)
+                    node.succ.append(next_node)
+                    results.append(node)
+                elif ast.type == "while":
+                    node = CFG_Node(label=ast.children[0].l, ast=ast.children[0], type="condition", content=self.cfg_content_from_ast(ast))
+                    self.nodes.append(node)
+                    work.append(("while", node, next_node))
+                    work.append(("visit", ast.children[1], node))
+                elif ast.type == "if":
+                    node = CFG_Node(label=ast.children[0].l, ast=ast.children[0], type="condition", content=self.cfg_content_from_ast(ast))
+                    self.nodes.append(node)
+                    work.append(("if", node))
+                    work.append(("visit", ast.children[2], next_node))
+                    work.append(("visit", ast.children[1], next_node))
+                else:
+                    results.append(None)
+        return results.pop()
+
+    def _analysis(self, name, build):
+        """
+        The analysis of the CFG as it is now kept under name, built by
+        calling build() the first time it is asked for, and kept until
+        the CFG is changed (see remove_nodes()).
+        """
+        if name not in self._analyses:
+            self._analyses[name] = build()
+        return self._analyses[name]
+
+    def reachability(self):
+        """
+        The Reachability index of the CFG as it is now.
+        """
+        return self._analysis('reachability', lambda: Reachability(self.nodes))
+
+    def dominators(self):
         """
-        if ast.type == "seq":
-            return self.node_from_cfg(ast.children[0], self.node_from_cfg(ast.children[1], next_node))
-        elif ast.type in ["assign", "skip"]:
-            node = CFG_Node(label=ast.l, ast=ast, type="other", content=self.cfg_content_from_ast(ast))
-            self.nodes.append(node)
-            node.succ.append(next_node)
-            return node
-        elif ast.type == "while":
-            node = CFG_Node(label=ast.children[0].l, ast=ast.children[0], type="condition", content=self.cfg_content_from_ast(ast))
-            self.nodes.append(node)
-            node.succ.append(self.node_from_cfg(ast.children[1], node))
-            node.succ.append(next_node)
-            return node
-        elif ast.type == "if":
-            node = CFG_Node(label=ast.children[0].l, ast=ast.children[0], type="condition", content=self.cfg_content_from_ast(ast))
-            self.nodes.append(node)
-            node.succ.append(self.node_from_cfg(ast.children[1], next_node))
-            node.succ.append(self.node_from_cfg(ast.children[2], next_node))
-            return node
+        The dominator tree of the CFG as it is now (see dominance.py).
+        """
+        return self._analysis('dominators',
+                              lambda: Dominators(self.nodes, self.entry))
+
+    def post_dominators(self):
+        """
+        The post-dominator tree of the CFG as it is now, rooted at its
+        exit node (see dominance.py).
+        """
+        return self._analysis('post_dominators',
+                              lambda: Dominators(self.nodes, self.exit, post=True))
+
+    def loops(self):
+        """
+        The loop nesting forest of the CFG as it is now (see
+        dominance.py), e.g. loops().depth(node) is the number of while
+        loops node is in.
+        """
+        return self._analysis('loops',
+                              lambda: LoopForest(self.nodes, self.dominators()))
+
+    def frequencies(self):
+        """
+        The estimated execution frequencies of the nodes and edges of
+        the CFG as it is now (see frequency.py).
+        """
+        return self._analysis('frequencies', lambda: Frequencies(self))
+
+    def basic_blocks(self, single=False):
+        """
+        The basic blocks of the CFG as it is now (see basic_blocks()).
+        """
+        return basic_blocks(self.nodes, single)
 
     def cfg_content_from_ast(self, ast):
         """
@@ -107,37 +469,20 @@ class CFG:
 
         Returns: string
         """
-        ops = ["=", "<", ">", "<=", ">=", "and", "add", "sub", "mult", "or", "assign"]
-        if ast.type in ["int", "var", "true", "false", "skip"]:
-            return f"{ast.value}"
-        elif ast.type in ops:
-            left = ""
-            if ast.children[0].type in ops and ast.type != "assign":
-                left = f"({self.cfg_content_from_ast(ast.children[0])})"
-            else:
-                left = f"{self.cfg_content_from_ast(ast.children[0])}"
-            right = ""
-            if ast.children[1].type in ops and ast.type != "assign":
-                right = f"({self.cfg_content_from_ast(ast.children[1])})"
-            else:
-                right = f"{self.cfg_content_from_ast(ast.children[1])}"
-            return f"{left} {ast.value} {right}"
-        elif ast.type == "not":
-            return f"NOT[{self.cfg_content_from_ast(ast.children[0])}]"
-        elif ast.type in ["if", "while"]:
-            return f"{ast.type} {self.cfg_content_from_ast(ast.children[0])}"
+        if ast.type in ["if", "while"]:
+            # just the condition
+            return f"{ast.type} {_ContentWriter().rewrite(ast.children[0])}"
+        return _ContentWriter().rewrite(ast)
 
-    def generate_cfg_dot(self, filename="cfg.dot"):
+    def dot_lines(self):
         """
-        Generate a Graphviz DOT file for visualizing the Control Flow Graph.
-        
-        Args:
-            filename: Output filename for the DOT file
+        Generate the lines of the Graphviz DOT description of the
+        Control Flow Graph, one at a time.
         """
-        dot_content = ["digraph CFG {"]
-        dot_content.append("    rankdir=TB;")  # Top to bottom layout
-        dot_content.append("    node [shape=box, style=rounded];")
-        dot_content.append("")
+        yield "digraph CFG {"
+        yield "    rankdir=TB;"  # Top to bottom layout
+        yield "    node [shape=box, style=rounded];"
+        yield ""
         
         # Add all nodes
         for node in self.nodes:
@@ -154,9 +499,9 @@ class CFG:
                 color = "white"
             
             node_id = f"node_{node.label}"
-            dot_content.append(f'    "{node_id}" [label="{label_str}", fillcolor={color}, style="rounded,filled"];')
+            yield f'    "{node_id}" [label="{label_str}", fillcolor={color}, style="rounded,filled"];'
         
-        dot_content.append("")
+        yield ""
         
         # Add all edges
         for node in self.nodes:
@@ -165,25 +510,116 @@ class CFG:
                 suc = node.succ[s]
                 succ_id = f"node_{suc.label}"
                 if len(node.succ) > 1:
-                    dot_content.append(f'    "{node_id}" -> "{succ_id}"[color="{"green" if s==0 else "red"}"];')
+                    yield f'    "{node_id}" -> "{succ_id}"[color="{"green" if s==0 else "red"}"];'
                 else:
-                    dot_content.append(f'    "{node_id}" -> "{succ_id}";')
+                    yield f'    "{node_id}" -> "{succ_id}";'
         
-        dot_content.append("}")
+        yield "}"
+
+    def generate_cfg_dot(self, filename="cfg.dot", write=write_file):
+        """
+        Generate a Graphviz DOT file for visualizing the Control Flow Graph.
         
-        # Write to file
-        with open(filename, "w") as f:
-            f.write("\n".join(dot_content))
+        Args:
+            filename: Output filename for the DOT file
+            write: Function write(filename, lines) streaming the lines
+                to the file (e.g. ArtifactWriter.write_file)
+        """
+        write(filename, self.dot_lines())
         
-        print(f"CFG DOT file '{filename}' generated successfully!")
+        if self.log:
+            self.log(f"CFG DOT file '{filename}' generated successfully!")
     
     def remove_node(self, node):
-        """"""
+        """
+        Remove a node from the CFG (see remove_nodes()).
+        """
+        self.remove_nodes([node])
+
+    def remove_nodes(self, nodes):
+        """
+        Remove a batch of nodes from the CFG, one after another in the
+        order given: each node's predecessors are connected to its
+        successors, and then any node left as an unnecessary branch or
+        an emptied loop is removed too (those nodes are kept on a stack
+        instead of being removed recursively). The removed nodes are
+        only marked (by id) while the edges are rewired, and self.nodes
+        is compacted and renumbered once at the end, so removing many
+        nodes takes time linear in the size of the CFG, where removing
+        them one at a time (each with a list removal) is quadratic.
+
+        Args:
+            nodes: iterable of nodes of the CFG (nodes removed earlier
+                in the batch, e.g. as trimmed branches, are skipped)
+
+        Returns: the number of nodes removed
+        """
+        removed = bytearray(len(self.nodes))
+        count = 0
+        for node in nodes:
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                if removed[node.id]:
+                    continue
+                removed[node.id] = 1
+                count += 1
+                stack.extend(reversed(list(self._unlink_node(node))))
+        if count:
+            self.nodes = [node for node in self.nodes if not removed[node.id]]
+            self._number()
+            self.version += 1
+            self._analyses = {}
+        return count
+
+    def insert_nodes(self, insertions):
+        """
+        Insert a batch of chains of new nodes on edges of the CFG, each
+        between a node and one of its successors, keeping the order of
+        the successors of the node and of the predecessors of the
+        successor (so that the n-th predecessor of a node is still on
+        its n-th incoming edge). Each chain is laid out right before
+        the successor, and self.nodes is renumbered once at the end.
+
+        Args:
+            insertions: iterable of (pred, index, chain), with chain a
+                list of new nodes (with no edges yet) to insert on the
+                edge from pred to pred.succ[index]
+
+        Returns: the number of nodes inserted
+        """
+        before = {}
+        count = 0
+        for pred, index, chain in insertions:
+            succ = pred.succ[index]
+            pred.succ[index] = chain[0]
+            chain[0].pred.append(pred)
+            for node, next_node in zip(chain, chain[1:]):
+                node.succ.append(next_node)
+                next_node.pred.append(node)
+            chain[-1].succ.append(succ)
+            succ.pred[succ.pred.index(pred)] = chain[-1]
+            before.setdefault(succ.id, []).extend(chain)
+            count += len(chain)
+        if count:
+            nodes = []
+            for node in self.nodes:
+                nodes.extend(before.get(node.id, ()))
+                nodes.append(node)
+            self.nodes = nodes
+            self._number()
+            self.version += 1
+            self._analyses = {}
+        return count
+
+    def _unlink_node(self, node):
+        """
+        Disconnect a single node from the CFG (see remove_nodes()), and
+        return the set of nodes that should be removed because of it.
+        """
         preds = node.pred
         succs = node.succ
 
-        self.nodes.remove(node)
-
         trim = set()
         for succ in succs:
             succ.pred.remove(node)
@@ -204,7 +640,6 @@ class CFG:
                 else:
                     # eliminated the content of a while loop
                     trim.add(pred)
-        
-        for node in trim:
-            self.remove_node(node)
+
+        return trim
     
\ No newline at end of file
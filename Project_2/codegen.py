@@ -9,22 +9,184 @@ description:  Implements the RISC_V_CodeGenerator class to convert a
               Created for CS 554 (Compiler Construction) at UNM.
 """
 
+from traversal import Visitor
+from cfg import basic_blocks
+
+class _ExpressionGenerator(Visitor):
+    """
+    Visitor generating the code for an expression, for
+    RISC_V_CodeGenerator._generate_expression(). The register wanted
+    for the result of each node is pushed on self.targets before the
+    node is entered, and the register actually holding its result is
+    pushed on self.results once it is done.
+    """
+
+    # instructions for each binary operation, on registers
+    # {result}, {left} and {right}
+    operations = {
+        "add":  ["add {result}, {left}, {right}"],
+        "sub":  ["sub {result}, {left}, {right}"],
+        "mult": ["mul {result}, {left}, {right}"],
+        "=":    ["sub {result}, {left}, {right}",
+                 "seqz {result}, {result}"],
+        "<":    ["slt {result}, {left}, {right}"],
+        "<=":   ["slt {result}, {right}, {left}",
+                 "xori {result}, {result}, 1"],
+        ">":    ["slt {result}, {right}, {left}"],
+        ">=":   ["slt {result}, {left}, {right}",
+                 "xori {result}, {result}, 1"],
+        "and":  ["and {result}, {left}, {right}"],
+        "or":   ["or {result}, {left}, {right}"],
+    }
+
+    def __init__(self, codegen, result_reg):
+        self.codegen = codegen
+        self.targets = [result_reg]
+        self.results = []
+        # [result_reg, need_to_pop] for each operation being generated
+        self.frames = []
+
+    def enter_int(self, node):
+        # Integer constant
+        codegen = self.codegen
+        result_reg = self.targets.pop()
+        if node.value == 0:
+            self.results.append("x0")
+        else:
+            codegen.gen(f"    li {result_reg}, {node.value}")
+            codegen.temp_in_use[result_reg] = True
+            self.results.append(result_reg)
+
+    def enter_var(self, node):
+        # Variable - get its register or memory location
+        codegen = self.codegen
+        result_reg = self.targets.pop()
+        var_name = node.value
+        var_reg = codegen.var_map.get(var_name)
+        if var_reg and var_reg.endswith("(a0)"):
+            # Variable is spilled to memory, load it into result register
+            codegen.gen(f"    ld {result_reg}, {var_reg}")
+            self.results.append(result_reg)
+        elif var_reg:
+            # Variable is in a register
+            self.results.append(var_reg)
+        else:
+            # Variable not found (shouldn't happen, but handle gracefully)
+            raise ValueError(f"Variable {var_name} not found in var_map")
+
+    def enter_true(self, node):
+        # Boolean constant
+        result_reg = self.targets.pop()
+        self.codegen.gen(f"    li {result_reg}, 1")
+        self.results.append(result_reg)
+
+    def enter_false(self, node):
+        self.targets.pop()
+        self.results.append("x0")     # x0 always contains 0
+
+    def _enter_binary(self, node):
+        # Binary operation
+        # Evaluate left expression into the result register
+        result_reg = self.targets.pop()
+        self.frames.append([result_reg, False])
+        self.targets.append(result_reg)
+
+    def _between_binary(self, node, i):
+        # Evaluate right expression
+        codegen = self.codegen
+        frame = self.frames[-1]
+        result_reg = frame[0]
+        left_reg = self.results[-1]
+        right_reg = result_reg
+        # determine which register to potentially store
+        # result of evaluated right expression
+        if left_reg == result_reg:
+            next_idx = codegen.temp_reg.index(left_reg) + 1
+            next_idx = next_idx if next_idx < len(codegen.temp_reg) else 0
+            right_reg = codegen.temp_reg[next_idx]
+            if codegen.temp_in_use[right_reg]:
+                # if temporary register is already in use,
+                # store value in register in the stack
+                codegen._push(right_reg)
+                # mark for popping back after operation
+                frame[1] = True
+        self.targets.append(right_reg)
+
+    def _leave_binary(self, node):
+        # Perform operation
+        codegen = self.codegen
+        result_reg, need_to_pop = self.frames.pop()
+        right_reg = self.results.pop()
+        left_reg = self.results.pop()
+        for instruction in self.operations[node.type]:
+            codegen.gen("    " + instruction.format(
+                    result=result_reg, left=left_reg, right=right_reg))
+
+        if need_to_pop:
+            # return previous value to the temporary register used
+            # to hold the right side of the expression
+            codegen._pop(right_reg)
+            codegen.temp_in_use[right_reg] = True
+
+        if result_reg in ["t0", "t1"]:
+            codegen.temp_in_use[result_reg] = True
+
+        self.results.append(result_reg)
+
+    enter_add = enter_sub = enter_mult = _enter_binary
+    enter_eq = enter_lt = enter_gt = enter_le = enter_ge = _enter_binary
+    enter_and = enter_or = _enter_binary
+    between_default = _between_binary
+    leave_add = leave_sub = leave_mult = _leave_binary
+    leave_eq = leave_lt = leave_gt = leave_le = leave_ge = _leave_binary
+    leave_and = leave_or = _leave_binary
+
+    def enter_not(self, node):
+        # Logical NOT (Unary Operator), with its operand in t0
+        self.frames.append([self.targets.pop(), False])
+        self.targets.append("t0")
+
+    def leave_not(self, node):
+        result_reg, _ = self.frames.pop()
+        operand_reg = self.results.pop()
+        self.codegen.gen(f"    seqz {result_reg}, {operand_reg}")
+        self.results.append(result_reg)
+
+    def enter_default(self, node):
+        # Unknown type
+        raise ValueError("Unknown type")
+
 class RISC_V_CodeGenerator:
     """
     RISC-V Code Generator
     Uses register allocation strategy and stack machine when necessary
     """
     
-    def __init__(self, name="generated_function"):
+    def __init__(self, name=None, context=None):
         """
         Initialize RISC-V code generator
+
+        Args:
+            name: name of the generated function (by default, the name
+                of the context, or "generated_function")
+            context: optional CompilationContext (see context.py) the
+                code generator is recorded in, and reports its
+                messages through
         """
         self.code = []
-        self.name = name
+        self.context = context
+        self.log = print
+        if context is not None:
+            context.passes['codegen'] = self
+            self.log = context.log
+            if name is None:
+                name = context.name
+        self.name = name if name is not None else "generated_function"
 
         self.pointer = 0
         self.max_stack = 0
 
+        self.frequencies = None # Estimated execution frequencies (see generate())
         self.var_map = {}       # Map variable names to s registers (s1, s2, s3, ...)
         self.variables = []     # List of all variables in order
 
@@ -37,22 +199,29 @@ class RISC_V_CodeGenerator:
         """
         self.code.append(instruction)
     
-    def generate(self, nodes, optimizer) -> str:
+    def generate(self, nodes, optimizer, frequencies=None) -> str:
         """
         Main code generation function - generates code from CFG
         
         Args:
             nodes: list of control flow graph nodes
             optimizer: Optimizer instance with liveness analysis results
+            frequencies: optional Frequencies of the CFG (see
+                frequency.py, e.g. cfg.frequencies() after the
+                optimizer); with them, the s registers go to the
+                variables used most often (the others are spilled
+                first), and the basic blocks are laid out so the
+                most frequent edges fall through
             
         Returns:
             String containing RISC-V assembly code
         """
         # Store optimizer for later use
         self.optimizer = optimizer
+        self.frequencies = frequencies
         
         # Collect variables from Optimizer
-        self._collect_variables_from_optimizer(optimizer)
+        self._collect_variables_from_optimizer(optimizer, nodes)
         
         # Generate code from CFG nodes
         self._generate_from_cfg(nodes)
@@ -67,10 +236,11 @@ class RISC_V_CodeGenerator:
         
         return "\n".join(self.code)
     
-    def _collect_variables_from_optimizer(self, optimizer):
+    def _collect_variables_from_optimizer(self, optimizer, nodes=()):
         """
         Collect variables using Live Variable Analysis and Interference Graph coloring.
-        Prioritizes entry-live variables and uses graph coloring for register allocation.
+        Prioritizes entry-live variables and uses graph coloring for register allocation,
+        or, with frequencies, the colors whose variables are used most often.
         """
         # Get entry-live variables (variables that are live at function entry)
         entry_live_vars = optimizer.IN.get("entry", set())
@@ -113,6 +283,13 @@ class RISC_V_CodeGenerator:
         all_colors = set(coloring.values())
         # Sort colors: entry-live colors first, then others
         sorted_colors = sorted(entry_colors) + sorted(all_colors - entry_colors)
+        if self.frequencies is not None:
+            # Sort colors by the estimated uses of their variables instead
+            weights = self.frequencies.variable_weights(nodes)
+            color_weights = {color: 0.0 for color in all_colors}
+            for var, color in coloring.items():
+                color_weights[color] += weights.get(var, 0.0)
+            sorted_colors.sort(key=lambda color: -color_weights[color])
         
         for color in sorted_colors:
             if register_count < MAX_REGISTERS:
@@ -147,14 +324,16 @@ class RISC_V_CodeGenerator:
             if not self.var_map[var].endswith("(a0)"):
                 s_registers.add(self.var_map[var])
 
-        print(f"Register allocation: {len(self.vars_in_registers)} variables in {len(s_registers)} registers, "
-              f"{len(self.vars_in_memory)} variables spilled to memory\n{self.var_map}")
+        if self.log:
+            self.log(f"Register allocation: {len(self.vars_in_registers)} variables in {len(s_registers)} registers, "
+                     f"{len(self.vars_in_memory)} variables spilled to memory\n{self.var_map}")
         
         # Allow unused s registers to be used for temporary register
         for i in range(len(s_registers)+1, MAX_REGISTERS):
             self.temp_reg.append(f"s{i}")
             self.temp_in_use[f"s{i}"] = False
-        print(f"Temporary Registers: {self.temp_reg}")
+        if self.log:
+            self.log(f"Temporary Registers: {self.temp_reg}")
     
     def _emit_function_prologue(self):
         """
@@ -241,18 +420,32 @@ class RISC_V_CodeGenerator:
         
         Args:
             nodes: CFGNodes to process
+
+        The nodes are grouped into basic blocks (see cfg.basic_blocks()),
+        and only the first node of each block gets a label, since
+        control only reaches the others by falling through to them.
         """
-        for n in range(len(nodes)):
-            node = nodes[n]
-            self.gen(f"label_{node.label}:")
-            self.gen(f"    # {node.content}")
-            if node.type in ["entry", "exit"]:
-                pass
-            else:
-                self._generate_from_ast(node.ast)
+        blocks = basic_blocks(nodes)
+        if self.frequencies is not None:
+            blocks = self.frequencies.layout(blocks)
+        for b in range(len(blocks)):
+            block = blocks[b]
+            self.gen(f"label_{block.label}:")
+            for node in block.nodes:
+                self.gen(f"    # {node.content}")
+                if node.type not in ["entry", "exit"]:
+                    self._generate_from_ast(node.ast)
+            node = block.nodes[-1]
+            if node.type not in ["entry", "exit"]:
+                following = blocks[b+1].nodes[0]
+                if (node.type == "condition" and self.frequencies is not None
+                        and node.succ[1] is following):
+                    # laid out with the false branch falling through
+                    self.gen(f"    bnez t0, label_{node.succ[0].label}")
+                    continue
                 if node.type == "condition":
                     self.gen(f"    beqz t0, label_{node.succ[1].label}")
-                if node.succ[0].label != nodes[n+1].label:
+                if node.succ[0] is not following:
                     self.gen(f"    j label_{node.succ[0].label}")
     
     def _generate_from_ast(self, ast):
@@ -289,101 +482,4 @@ class RISC_V_CodeGenerator:
         Returns:
             String name of register containing the result
         """
-
-        if node.type == "int":
-            # Integer constant
-            value = node.value
-            if node.value == 0:
-                return "x0"
-            else:
-                self.gen(f"    li {result_reg}, {value}")
-                self.temp_in_use[result_reg] = True
-                return result_reg
-        elif node.type == "var":
-            # Variable - get its register or memory location
-            var_name = node.value
-            var_reg = self.var_map.get(var_name)
-            if var_reg and var_reg.endswith("(a0)"):
-                # Variable is spilled to memory, load it into result register
-                self.gen(f"    ld {result_reg}, {var_reg}")
-                return result_reg
-            elif var_reg:
-                # Variable is in a register
-                return var_reg
-            else:
-                # Variable not found (shouldn't happen, but handle gracefully)
-                raise ValueError(f"Variable {var_name} not found in var_map")
-        elif node.type in ["true", "false"]:
-            # Boolean constant
-            if node.type == "true":
-                self.gen(f"    li {result_reg}, 1")
-                return result_reg
-            else:
-                return "x0"     # x0 always contains 0
-        elif node.type in ["add", "sub", "mult", "=", "<", ">", "<=", ">=", "and", "or"]:
-            # Binary operation
-            # Evaluate left expression
-            left_reg = self._generate_expression(node.children[0], result_reg)
-
-            # Evaluate right expression
-            need_to_pop = False
-            right_reg = result_reg
-            # determine which register to potentially store
-            # result of evaluated right expression
-            if left_reg == result_reg:
-                next_idx = self.temp_reg.index(left_reg) + 1
-                next_idx = next_idx if next_idx < len(self.temp_reg) else 0
-                right_reg = self.temp_reg[next_idx]
-                if self.temp_in_use[right_reg]:
-                    # if temporary register is already in use,
-                    # store value in register in the stack
-                    self._push(right_reg)
-                    # mark for popping back after operation
-                    need_to_pop = True
-
-            right_reg = self._generate_expression(node.children[1], right_reg)
-
-            # Perform operation
-            if node.type == "add":
-                self.gen(f"    add {result_reg}, {left_reg}, {right_reg}")
-            elif node.type == "sub":
-                self.gen(f"    sub {result_reg}, {left_reg}, {right_reg}")
-            elif node.type == "mult":
-                self.gen(f"    mul {result_reg}, {left_reg}, {right_reg}")
-            elif node.type == "=":
-                self.gen(f"    sub {result_reg}, {left_reg}, {right_reg}")
-                self.gen(f"    seqz {result_reg}, {result_reg}")
-            elif node.type == "<":
-                self.gen(f"    slt {result_reg}, {left_reg}, {right_reg}")
-            elif node.type == "<=":
-                self.gen(f"    slt {result_reg}, {right_reg}, {left_reg}")
-                self.gen(f"    xori {result_reg}, {result_reg}, 1")
-            elif node.type == ">":
-                self.gen(f"    slt {result_reg}, {right_reg}, {left_reg}")
-            elif node.type == ">=":
-                self.gen(f"    slt {result_reg}, {left_reg}, {right_reg}")
-                self.gen(f"    xori {result_reg}, {result_reg}, 1")
-            elif node.type == "and":
-                self.gen(f"    and {result_reg}, {left_reg}, {right_reg}")
-            elif node.type == "or":
-                self.gen(f"    or {result_reg}, {left_reg}, {right_reg}")
-
-            if need_to_pop:
-                # return previous value to the temporary register used
-                # to hold the right side of the expression
-                self._pop(right_reg)
-                self.temp_in_use[right_reg] = True
-
-            if result_reg in ["t0", "t1"]:
-                self.temp_in_use[result_reg] = True
-
-            return result_reg
-        elif node.type == "not":
-            # Logical NOT (Unary Operator)
-            operand_reg = self._generate_expression(node.children[0])
-            self.gen(f"    seqz {result_reg}, {operand_reg}")
-            return result_reg
-        else:
-            # Unknown type
-            raise ValueError("Unknown type")
-    
\ No newline at end of file
+        return _ExpressionGenerator(self, result_reg).visit(node).results[-1]
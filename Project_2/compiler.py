@@ -14,12 +14,19 @@ import os
 import argparse
 import subprocess
 
-from parser import Parser
-from scanner import Tokenize
+from parser import Parser, build_parse_tree
+from scanner import Tokenize, TokenBuffer, TokenizeFile, LineIndex
 from codegen import RISC_V_CodeGenerator
-from trees import decorate_ast, insert_labels, generate_dot_from_tree
+from trees import insert_labels, generate_dot_from_tree
+from trees import AstArena
+from artifacts import ArtifactWriter, artifact_names
+from context import CompilationContext
+from astcache import cache_file, load_ast, save_ast, remove_stale
+from hashcons import ExpressionTable
 from cfg import CFG
 from optimizer import Optimizer
+from ssa import SSA
+from snapshot import snapshot_lines
 
 if __name__ == "__main__":
 
@@ -29,12 +36,91 @@ if __name__ == "__main__":
     argparser.add_argument("-v", "--verbose", action="store_true",
                            help="increase output verbosity"
                            )
+    argparser.add_argument("-b", "--token-buffer", action="store_true",
+                           help="store tokens in a columnar TokenBuffer "
+                                "instead of a list of Tokens"
+                           )
+    argparser.add_argument("-j", "--jobs", type=int, default=None,
+                           help="scan the file in chunks in a pool of JOBS "
+                                "processes (implies --token-buffer)"
+                           )
+    argparser.add_argument("-s", "--stream", action="store_true",
+                           help="feed the tokens straight from the scanner "
+                                "to the parser without storing them (the "
+                                "tokens are not printed)"
+                           )
+    argparser.add_argument("-a", "--ast-only", action="store_true",
+                           help="build only the abstract syntax tree, "
+                                "skipping the parse tree"
+                           )
+    argparser.add_argument("--pt-dot", action="store_true",
+                           help="write the parse tree .dot file (with "
+                                "--ast-only, rebuilt from the tokens); "
+                                "same as --emit pt-dot"
+                           )
+    argparser.add_argument("-e", "--emit", action="append", default=[],
+                           metavar="ARTIFACT[,ARTIFACT...]",
+                           help="print or write the given artifacts, or "
+                                "'all' of them (by default, only the "
+                                "assembly and C files are written): "
+                                + ", ".join(artifact_names)
+                           )
+    argparser.add_argument("--background-writer", action="store_true",
+                           help="write the artifact files in a background "
+                                "thread"
+                           )
+    argparser.add_argument("--arena", action="store_true",
+                           help="store the abstract syntax tree in a flat "
+                                "AstArena of typed columns"
+                           )
+    argparser.add_argument("--cache", action="store_true",
+                           help="reuse the AST saved under trees/cache/ "
+                                "by an earlier run on the same source text, "
+                                "skipping the scanner and parser (implies "
+                                "--arena)"
+                           )
+    argparser.add_argument("--hash-cons", action="store_true",
+                           help="share structurally equal expressions in "
+                                "the AST (after the labeled code is saved)"
+                           )
+    argparser.add_argument("--ssa", action="store_true",
+                           help="put the CFG in SSA form and translate it "
+                                "back out of SSA form (with the copies of "
+                                "its phi-functions) before the optimizer"
+                           )
+    argparser.add_argument("--frequencies", action="store_true",
+                           help="give the s registers to the variables used "
+                                "most often and lay out the code for the "
+                                "most frequent paths, by static estimates of "
+                                "how often each statement runs"
+                           )
+    argparser.add_argument("--scanner", choices=["re", "dfa"], default="re",
+                           help="scanning engine: the 'master' regular "
+                                "expression (re) or the table-driven "
+                                "DFA compiled from it (dfa)"
+                           )
     args = argparser.parse_args()
 
+    requested = set()
+    for names in args.emit:
+        for name in names.split(','):
+            if name == 'all':
+                requested.update(artifact_names)
+            elif name in artifact_names:
+                requested.add(name)
+            else:
+                argparser.error(f"unknown artifact '{name}'")
+    if args.pt_dot:
+        requested.add('pt-dot')
+    artifacts = ArtifactWriter(requested, args.background_writer)
+
     # function, file, and directory names
     file_name = args.filename.split('/')[-1].replace('.while', '')
     function_name = file_name.replace('-', '_').replace(' ', '')
 
+    # the ids, labels and symbols of this compilation
+    context = CompilationContext(function_name)
+
     idx = args.filename.rfind('/')+1
 
     tree_path = args.filename[:idx] + "trees/"
@@ -46,11 +132,16 @@ if __name__ == "__main__":
     cfg_path = args.filename[:idx] + "trees/cfg/"
     os.makedirs(os.path.dirname(cfg_path), exist_ok=True)
 
+    cache_path = args.filename[:idx] + "trees/cache/"
+    if args.cache:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
     ast_file = tree_path+file_name+"_ast_tree.dot"
     parse_file = tree_path+file_name+"_parse_tree.dot"
     decorated_ast_file = decorated_tree_path+file_name+"_ast_tree.dot"
     cfg_file = cfg_path+file_name+"_cfg.dot"
     cfg_optimized_file = cfg_path+file_name+"_optimized_cfg.dot"
+    cfg_snapshot_file = cfg_path+file_name+"_optimized_cfg.jsonl"
 
     labeled_path = args.filename[:idx] + "labeled/"
     os.makedirs(os.path.dirname(labeled_path), exist_ok=True)
@@ -68,100 +159,180 @@ if __name__ == "__main__":
     with open(args.filename, "r") as f:
         whileCode = f.read()
 
-    print("\nInput code:")
-    print("-" * 70)
-    print(whileCode)
-    print("-" * 70)
+    if 'source' in artifacts:
+        print("\nInput code:")
+        print("-" * 70)
+        print(whileCode)
+        print("-" * 70)
 
-    # ---text---> scanner --tokens-->
-    print("\nGenerated tokens:")
-    print("-" * 70)
-    tokens = []
-    for token in Tokenize(whileCode):
-        print(token)
-        tokens.append(token)
+    # an AST saved by an earlier run on the same text, if any
+    if args.cache:
+        ast_cache_file = cache_file(cache_path, file_name, whileCode)
+        cached_ast = load_ast(ast_cache_file, whileCode)
+    else:
+        ast_cache_file = cached_ast = None
 
-    print("-" * 70)
+    # ---text---> scanner --tokens-->
+    print_tokens = 'tokens' in artifacts
+    if print_tokens:
+        print("\nGenerated tokens:")
+        print("-" * 70)
+    if cached_ast is not None:
+        tokens = None
+        if print_tokens:
+            print(f"(skipped: AST loaded from {ast_cache_file})")
+    elif args.jobs:
+        tokens = TokenizeFile(args.filename, args.jobs, args.scanner)
+        if print_tokens:
+            for token in tokens:
+                print(token)
+    elif args.stream:
+        tokens = Tokenize(whileCode, args.scanner)
+        if print_tokens:
+            print("(streamed to the parser)")
+    elif args.token_buffer:
+        tokens = TokenBuffer(whileCode, args.scanner)
+        if print_tokens:
+            for token in tokens:
+                print(token)
+    elif print_tokens:
+        tokens = []
+        for token in Tokenize(whileCode, args.scanner):
+            print(token)
+            tokens.append(token)
+    else:
+        tokens = list(Tokenize(whileCode, args.scanner))
+
+    if print_tokens:
+        print("-" * 70)
 
     # ================================ #
     #  Init a Parser with tokens       #
     # ================================ #
-    parser = Parser(tokens)
+    if cached_ast is None:
+        parser = Parser(tokens, LineIndex(whileCode), context)
 
     # ================================ #
     #  Generate and display the        #
     #  parse tree (PT) and abstract    #
     #  syntax tree (AST)               #
     # ================================ #
-    parse_tree, ast = parser.parse()
-    parse_tree = parse_tree.root
-    ast = ast.root
-
-    print("\nParse Tree (PT):")
-    print("-" * 70)
-    print(f"{parse_tree}")
-    print("-" * 70)
-
-    print("\nAbstract Syntax Tree (AST):")
-    print("-" * 70)
-    print(f"{ast}")
-    print("-" * 70)
-    print("\n")
+    if cached_ast is not None:
+        parse_tree, ast = None, cached_ast
+    else:
+        use_arena = args.arena or args.cache
+        build_pt = not args.ast_only and ('pt' in artifacts
+                                          or 'pt-dot' in artifacts)
+        parse_tree, ast = parser.parse(build_pt=build_pt,
+                                       arena=AstArena() if use_arena else None)
+        parse_tree = parse_tree.root
+        ast = ast.root
+        if args.cache:
+            save_ast(ast_cache_file, ast, whileCode)
+            remove_stale(cache_path, file_name, ast_cache_file)
+
+    if parse_tree is not None and 'pt' in artifacts:
+        print("\nParse Tree (PT):")
+        print("-" * 70)
+        print(f"{parse_tree}")
+        print("-" * 70)
+
+    if 'ast' in artifacts:
+        print("\nAbstract Syntax Tree (AST):")
+        print("-" * 70)
+        print(f"{ast}")
+        print("-" * 70)
+        print("\n")
 
     # ============================ #
     #  Generate graphic rep of PT  #
     # ============================ #
 
-    generate_dot_from_tree(parse_tree, filename=parse_file)
+    if 'pt-dot' in artifacts:
+        if parse_tree is None:
+            # the streamed tokens are used up (or the code was never
+            # scanned), so scan the code again
+            if args.stream or tokens is None:
+                tokens = Tokenize(whileCode, args.scanner)
+            parse_tree = build_parse_tree(tokens, LineIndex(whileCode),
+                                          context).root
+        generate_dot_from_tree(parse_tree, parse_file, artifacts.write_file)
 
     # ============================ #
     # Generate graphic rep of AST  #
     # ============================ #
-    generate_dot_from_tree(ast, filename=ast_file)
-
-    decorate_ast(ast)
-    generate_dot_from_tree(ast, filename=decorated_ast_file)
-
-    print(f"View the '.dot' files in Graphviz or VSCode to see the "
-           "resulting abstract syntax tree (AST).")
-
-    labeled_code = insert_labels(ast, whileCode)[0]
-    print(labeled_code)
-    with open(labeled_source, 'w') as f:
-        f.write(labeled_code)
-    print(f"\nLabeled code saved to: {labeled_source}\n")
+    if 'ast-dot' in artifacts:
+        generate_dot_from_tree(ast, ast_file, artifacts.write_file)
+
+    context.decorate(ast)
+    if 'decorated-dot' in artifacts:
+        generate_dot_from_tree(ast, decorated_ast_file, artifacts.write_file)
+
+    if 'ast-dot' in artifacts or 'decorated-dot' in artifacts:
+        print(f"View the '.dot' files in Graphviz or VSCode to see the "
+               "resulting abstract syntax tree (AST).")
+
+    if 'labeled' in artifacts:
+        labeled_code = insert_labels(ast, whileCode)[0]
+        print(labeled_code)
+        artifacts.write_file(labeled_source, [labeled_code])
+        print(f"\nLabeled code saved to: {labeled_source}\n")
+
+    if args.hash_cons:
+        # the source indexes of shared expressions are no longer
+        # accurate, but nothing after this point uses them
+        table = ExpressionTable()
+        ast = table.intern(ast)
+        print(f"Hash-consing shared {table.hits} expression node(s).\n")
 
     # ======================================== #
     # Generate Control Flow Graph (CFG)        #
     # ======================================== #
-    print("\nGenerating Control Flow Graph (CFG)...")
-    print("-" * 70)
-    cfg = CFG(ast)
-    cfg.generate_cfg_dot(filename=cfg_file)
-    print("-" * 70)
-    print()
+    cfg = CFG(ast, context)
+    if 'cfg-dot' in artifacts:
+        print("\nGenerating Control Flow Graph (CFG)...")
+        print("-" * 70)
+        cfg.generate_cfg_dot(cfg_file, artifacts.write_file)
+        print("-" * 70)
+        print()
+
+    if args.ssa:
+        ssa = SSA(cfg, context=context)
+        phis = sum(len(phis) for phis in ssa.phis.values())
+        copies = ssa.destruct()
+        print(f"SSA form: {len(ssa.definitions)} version(s), {phis} "
+              f"phi-function(s), translated back with {copies} copies.\n")
 
     # ======================================== #
     # Create and run optimizer                 #
     # (Live Variable Analysis)                 #
     # ======================================== #
-    print("\nLive Analysis Equations:")
-    print("-" * 70)
-    optimizer = Optimizer(cfg)
-    print("-" * 70)
+    if 'equations' in artifacts:
+        print("\nLive Analysis Equations:")
+        print("-" * 70)
+        optimizer = Optimizer(cfg, context=context)
+        print("-" * 70)
+    else:
+        optimizer = Optimizer(cfg, report=None, context=context)
+
+    if 'optimized-cfg-dot' in artifacts:
+        cfg.generate_cfg_dot(cfg_optimized_file, artifacts.write_file)
 
-    cfg.generate_cfg_dot(filename=cfg_optimized_file)
+    if 'cfg-snapshot' in artifacts:
+        artifacts.write_file(cfg_snapshot_file, snapshot_lines(cfg, optimizer))
 
     # ======================================== #
     # Generate, display, and save to .s file   #
     # the RISC-V assembly code                 #
     # ======================================== #
-    codegen = RISC_V_CodeGenerator(function_name)
-    assembly = codegen.generate(cfg.nodes, optimizer)  # Generate from CFG instead of AST
-    print("\nRISC-V Assembly Code:")
-    print("-" * 70)
-    print(assembly)
-    print("-" * 70)
+    codegen = RISC_V_CodeGenerator(context=context)
+    frequencies = cfg.frequencies() if args.frequencies else None
+    assembly = codegen.generate(cfg.nodes, optimizer, frequencies)  # Generate from CFG instead of AST
+    if 'assembly' in artifacts:
+        print("\nRISC-V Assembly Code:")
+        print("-" * 70)
+        print(assembly)
+        print("-" * 70)
 
     # Save assembly to file
     with open(risc_v_file, 'w') as f:
@@ -235,6 +406,9 @@ if __name__ == "__main__":
         f.write(c_code)
     print(f"\nC code saved to: {c_file_name}\n")
 
+    # finish writing the requested artifact files
+    artifacts.close()
+
     try:
         subprocess.run(["gcc", "-o", compiled_file, c_file_name, risc_v_file], check=True, capture_output=True)
         print(f"Compiled Assembly and C files successfully.\nExecutable saved to: {compiled_file}\n")
@@ -0,0 +1,87 @@
+"""
+filename:     context.py
+description:  The CompilationContext class, which owns the state of one
+              compilation (node ids, labels, interned symbols and the
+              state of its passes), so that many programs can be
+              compiled in one process, even concurrently (one thread
+              per compilation). Created for CS 554 (Compiler
+              Construction) at UNM.
+"""
+
+from trees import TreeNode, VAR, decorate_ast
+
+class CompilationContext:
+    '''
+    CompilationContext(name, log=print) holds everything that belongs
+    to the compilation of one program, instead of class-level or
+    module-level state shared by all compilations:
+
+        ids       the TreeNode ids given out (see tree_node()), which
+                  start from 0 in every compilation, so the .dot files
+                  of a program do not depend on what was compiled
+                  before it in the same process
+        labels    the decorate_ast labels given out (see decorate())
+        symbols   the interned variable names (see intern())
+        passes    the state of the passes run so far, by pass name
+                  ('parser', 'cfg', 'optimizer', 'codegen'), so a
+                  later pass can find the results of earlier ones
+        log       the function the passes report their messages
+                  through (None for no messages), instead of printing
+                  them to the shared sys.stdout
+
+    The Parser, CFG, Optimizer and RISC_V_CodeGenerator each take an
+    optional context (they use the shared defaults without one):
+
+        context = CompilationContext("factorial")
+        ast = Parser(tokens, context=context).parse()[1].root
+        context.decorate(ast)
+        cfg = CFG(ast, context)
+        optimizer = Optimizer(cfg, report=None, context=context)
+        assembly = RISC_V_CodeGenerator(context=context).generate(
+                cfg.nodes, optimizer)
+
+    A context is not meant to be shared between threads; concurrent
+    compilations each have their own.
+    '''
+
+    def __init__(self, name="generated_function", log=print):
+        self.name = name
+        self.log = log
+        self.num_ids = 0
+        self.num_labels = 0
+        self.symbols = {}
+        self.passes = {}
+
+    def new_id(self):
+        '''
+        The next unused TreeNode id of this compilation.
+        '''
+        id = self.num_ids
+        self.num_ids += 1
+        return id
+
+    def tree_node(self, **kwargs):
+        '''
+        A new TreeNode (see TreeNode) with the next id of this
+        compilation, and its value interned if it is a variable.
+        '''
+        if kwargs.get('type') == VAR and isinstance(kwargs.get('value'), str):
+            kwargs['value'] = self.intern(kwargs['value'])
+        return TreeNode(id=self.new_id(), **kwargs)
+
+    def intern(self, name):
+        '''
+        The one copy of the symbol name kept by this compilation, so
+        that equal names are the same string object (which makes their
+        comparisons and the set operations of the analyses cheaper).
+        '''
+        return self.symbols.setdefault(name, name)
+
+    def decorate(self, ast):
+        '''
+        decorate_ast() with the labels of this compilation, going on
+        from the last label given out, and return the number of labels
+        given out so far.
+        '''
+        self.num_labels = decorate_ast(ast, self.num_labels)
+        return self.num_labels
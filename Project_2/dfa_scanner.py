@@ -0,0 +1,515 @@
+"""
+filename:     dfa_scanner.py
+description:  Compiles the scanner's token_specification into a
+              minimized deterministic finite automaton (regex -> NFA
+              -> DFA -> Hopcroft minimization) and scans code with the
+              resulting transition tables, as an alternative engine to
+              the 'master' regular expression in scanner.py.
+              Created for CS 554 (Compiler Construction) at UNM.
+"""
+
+from array import array
+import re
+
+from scanner import token_specification, keywords, skip_comment, _mismatch
+
+# ======================== #
+#   Character classes      #
+# ======================== #
+
+class CharSet:
+    '''
+    CharSet(ascii, flags) is a set of characters as it appears in one
+    of our regular expressions: the ASCII characters it contains, plus
+    flags describing which non-ASCII characters it contains ('d', 'w'
+    and 's' for Unicode digits, word characters and white space, as
+    matched by \\d, \\w and \\s, and 'any' for the '.' wildcard).
+    '''
+
+    def __init__(self, ascii=(), flags=()):
+        self.ascii = frozenset(ascii)
+        self.flags = frozenset(flags)
+
+    def contains_non_ascii(self, char_flags):
+        '''
+        Whether this set contains a non-ASCII character that has the
+        given Unicode flags.
+        '''
+        return 'any' in self.flags or bool(self.flags & char_flags)
+
+def _ascii_matching(pattern):
+    return [c for c in range(128) if re.fullmatch(pattern, chr(c))]
+
+# Escapes we understand, with the same meaning they have in re
+_ESCAPE_SETS = {
+    'd': lambda: CharSet(_ascii_matching(r'\d'), ['d']),
+    'w': lambda: CharSet(_ascii_matching(r'\w'), ['w']),
+    's': lambda: CharSet(_ascii_matching(r'\s'), ['s']),
+}
+_ESCAPE_CHARS = {'n': '\n', 'r': '\r', 't': '\t'}
+
+def _unicode_flags(char):
+    '''
+    The set of Unicode flags ('d', 'w', 's') satisfied by a character.
+    '''
+    flags = set()
+    if re.fullmatch(r'\d', char):
+        flags.add('d')
+    if re.fullmatch(r'\w', char):
+        flags.add('w')
+    if re.fullmatch(r'\s', char):
+        flags.add('s')
+    return frozenset(flags)
+
+# ======================== #
+#   Regular expressions    #
+# ======================== #
+
+class RegexParser:
+    '''
+    A small recursive descent parser for the subset of the re syntax
+    used in token_specification: literals and escapes, character
+    classes [...], the '.' wildcard, groups (...), alternation |, and
+    the quantifiers *, +, ? and the lazy *?. A regex is parsed into
+    nested tuples:
+        ('set', CharSet)   ('cat', r1, r2)   ('alt', r1, r2)
+        ('star', r, lazy)  ('opt', r)        ('eps',)
+    '''
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def parse(self):
+        regex = self.alternation()
+        if self.pos != len(self.pattern):
+            raise ValueError(f"Unsupported regex syntax in {self.pattern!r} "
+                             f"at position {self.pos}")
+        return regex
+
+    def _peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def alternation(self):
+        regex = self.concatenation()
+        while self._peek() == '|':
+            self.pos += 1
+            regex = ('alt', regex, self.concatenation())
+        return regex
+
+    def concatenation(self):
+        regex = ('eps',)
+        while self._peek() not in (None, '|', ')'):
+            item = self.quantified()
+            regex = item if regex == ('eps',) else ('cat', regex, item)
+        return regex
+
+    def quantified(self):
+        regex = self.atom()
+        while self._peek() in ('*', '+', '?'):
+            op = self._peek()
+            self.pos += 1
+            if op == '*':
+                lazy = self._peek() == '?'
+                if lazy:
+                    self.pos += 1
+                regex = ('star', regex, lazy)
+            elif op == '+':
+                regex = ('cat', regex, ('star', regex, False))
+            else:
+                regex = ('opt', regex)
+        return regex
+
+    def atom(self):
+        char = self._peek()
+        self.pos += 1
+        if char == '(':
+            regex = self.alternation()
+            if self._peek() != ')':
+                raise ValueError(f"Unbalanced group in {self.pattern!r}")
+            self.pos += 1
+            return regex
+        elif char == '[':
+            return ('set', self.char_class())
+        elif char == '.':
+            return ('set', CharSet(set(range(128)) - {ord('\n')}, ['any']))
+        elif char == '\\':
+            return ('set', self.escape())
+        return ('set', CharSet([ord(char)]))
+
+    def escape(self):
+        char = self.pattern[self.pos]
+        self.pos += 1
+        if char in _ESCAPE_SETS:
+            return _ESCAPE_SETS[char]()
+        return CharSet([ord(_ESCAPE_CHARS.get(char, char))])
+
+    def char_class(self):
+        ascii, flags = set(), set()
+        while self._peek() != ']':
+            if self._peek() == '\\':
+                self.pos += 1
+                item = self.escape()
+            else:
+                item = CharSet([ord(self._peek())])
+                self.pos += 1
+            # a range such as A-Z
+            if (self._peek() == '-' and self.pos + 1 < len(self.pattern)
+                    and self.pattern[self.pos + 1] != ']'):
+                self.pos += 1
+                high = self.pattern[self.pos]
+                self.pos += 1
+                low = min(item.ascii)
+                item = CharSet(range(low, ord(high) + 1))
+            ascii |= item.ascii
+            flags |= item.flags
+        self.pos += 1
+        return CharSet(ascii, flags)
+
+def _branches(regex):
+    '''
+    Split a regex into its top-level alternatives.
+    '''
+    if regex[0] == 'alt':
+        return _branches(regex[1]) + _branches(regex[2])
+    return [regex]
+
+def _is_lazy(regex):
+    if regex[0] == 'star' and regex[2]:
+        return True
+    return any(_is_lazy(part) for part in regex[1:] if isinstance(part, tuple))
+
+def _charsets(regex, found):
+    if regex[0] == 'set':
+        found.append(regex[1])
+    for part in regex[1:]:
+        if isinstance(part, tuple):
+            _charsets(part, found)
+    return found
+
+# ======================== #
+#   Automata               #
+# ======================== #
+
+class ScannerDFA:
+    '''
+    ScannerDFA(specification, keywords) compiles an ordered token
+    specification (a list of (name, regex) pairs, earlier pairs taking
+    priority) into a minimized DFA. Keywords are folded into the
+    automaton as literal rules ahead of the 'var' rule, so that no
+    separate keyword lookup is needed while scanning.
+
+    Characters are first mapped to equivalence classes (characters
+    that no regex can tell apart share a class): ASCII characters
+    through the bytes table ascii_classes, other characters through
+    their Unicode flags. The DFA itself is then stored as
+
+        transitions  bytes or array('H') of num_states * num_classes
+                     entries, transitions[state * num_classes + class]
+                     being the next state (state 0 is the dead state)
+        accepts      bytes or array('H'), accepts[state] being 1 + the
+                     index of the rule accepted in that state (0 if
+                     the state is not accepting)
+
+    A top-level alternative of a rule that contains a lazy quantifier
+    (e.g. r"<!(.|\\n)*?>") accepts the shortest match, so its
+    accepting states have no outgoing transitions.
+    '''
+
+    def __init__(self, specification, keywords=()):
+        rules = []
+        for name, pattern in specification:
+            if name == 'var':
+                rules.extend((kw, re.escape(kw)) for kw in sorted(keywords))
+            rules.append((name, pattern))
+        self.rule_names = [name for name, _ in rules]
+        regexes = [RegexParser(pattern).parse() for _, pattern in rules]
+
+        self._build_classes(regexes)
+        nfa_start, nfa = self._build_nfa(regexes)
+        dfa_trans, dfa_accept, dfa_stop = self._build_dfa(nfa_start, nfa)
+        self._minimize(dfa_trans, dfa_accept, dfa_stop)
+
+    # --- alphabet --- #
+
+    def _build_classes(self, regexes):
+        charsets = []
+        for regex in regexes:
+            _charsets(regex, charsets)
+        self.charsets = charsets
+        signatures = {}
+
+        def class_of(signature):
+            if signature not in signatures:
+                signatures[signature] = len(signatures)
+            return signatures[signature]
+
+        self.ascii_classes = bytes(
+                class_of(tuple(c in cs.ascii for cs in charsets))
+                for c in range(128))
+        # every combination of Unicode flags a non-ASCII char might have
+        self._flag_classes = {}
+        for d in (False, True):
+            for w in (False, True):
+                for s in (False, True):
+                    flags = frozenset(f for f, on in
+                                      (('d', d), ('w', w), ('s', s)) if on)
+                    self._flag_classes[flags] = class_of(tuple(
+                            cs.contains_non_ascii(flags) for cs in charsets))
+        self.num_classes = len(signatures)
+        self._class_members = {}
+        for signature, cls in signatures.items():
+            self._class_members[cls] = signature
+        self._non_ascii_cache = {}
+
+    def char_class(self, char):
+        '''
+        The equivalence class of a (non-ASCII) character.
+        '''
+        cls = self._non_ascii_cache.get(char)
+        if cls is None:
+            cls = self._flag_classes[_unicode_flags(char)]
+            self._non_ascii_cache[char] = cls
+        return cls
+
+    def _classes_in(self, charset):
+        index = self.charsets.index(charset)
+        return frozenset(cls for cls, signature in self._class_members.items()
+                         if signature[index])
+
+    # --- regex -> NFA (Thompson's construction) --- #
+
+    def _build_nfa(self, regexes):
+        # nfa[state] = [epsilon targets, [(classes, target), ...], accept]
+        # where accept is None or (rule index, stop)
+        nfa = []
+
+        def new_state():
+            nfa.append([[], [], None])
+            return len(nfa) - 1
+
+        def build(regex):
+            # returns (start, end) states of a fragment
+            kind = regex[0]
+            start = new_state()
+            if kind == 'eps':
+                return (start, start)
+            elif kind == 'set':
+                end = new_state()
+                nfa[start][1].append((self._classes_in(regex[1]), end))
+                return (start, end)
+            elif kind == 'cat':
+                s1, e1 = build(regex[1])
+                s2, e2 = build(regex[2])
+                nfa[start][0].append(s1)
+                nfa[e1][0].append(s2)
+                return (start, e2)
+            elif kind == 'alt':
+                end = new_state()
+                for part in regex[1:]:
+                    s, e = build(part)
+                    nfa[start][0].append(s)
+                    nfa[e][0].append(end)
+                return (start, end)
+            elif kind == 'star':
+                end = new_state()
+                s, e = build(regex[1])
+                nfa[start][0].extend([s, end])
+                nfa[e][0].extend([s, end])
+                return (start, end)
+            elif kind == 'opt':
+                end = new_state()
+                s, e = build(regex[1])
+                nfa[start][0].extend([s, end])
+                nfa[e][0].append(end)
+                return (start, end)
+
+        nfa_start = new_state()
+        for rule, regex in enumerate(regexes):
+            for branch in _branches(regex):
+                s, e = build(branch)
+                nfa[nfa_start][0].append(s)
+                nfa[e][2] = (rule, _is_lazy(branch))
+        return (nfa_start, nfa)
+
+    # --- NFA -> DFA (subset construction) --- #
+
+    def _build_dfa(self, nfa_start, nfa):
+        def closure(states):
+            stack = list(states)
+            seen = set(states)
+            while stack:
+                for target in nfa[stack.pop()][0]:
+                    if target not in seen:
+                        seen.add(target)
+                        stack.append(target)
+            return frozenset(seen)
+
+        def accept_of(states):
+            best = None
+            for state in states:
+                accept = nfa[state][2]
+                if accept is not None and (best is None or accept[0] < best[0]):
+                    best = accept
+            return best
+
+        # state 0 is the dead state
+        dead = frozenset()
+        start = closure([nfa_start])
+        ids = {dead: 0, start: 1}
+        order = [dead, start]
+        trans, accepts, stops = [], [], []
+        i = 0
+        while i < len(order):
+            states = order[i]
+            accept = accept_of(states)
+            stop = accept is not None and accept[1]
+            row = [0] * self.num_classes
+            if not stop:
+                for cls in range(self.num_classes):
+                    targets = [target for state in states
+                               for classes, target in nfa[state][1]
+                               if cls in classes]
+                    if not targets:
+                        continue
+                    nxt = closure(targets)
+                    if nxt not in ids:
+                        ids[nxt] = len(order)
+                        order.append(nxt)
+                    row[cls] = ids[nxt]
+            trans.append(row)
+            accepts.append(0 if accept is None else accept[0] + 1)
+            stops.append(stop)
+            i += 1
+        return (trans, accepts, stops)
+
+    # --- DFA minimization (Hopcroft's algorithm) --- #
+
+    def _minimize(self, trans, accepts, stops):
+        num_states = len(trans)
+        # inverse transitions: inverse[cls][state] = predecessors
+        inverse = [[[] for _ in range(num_states)]
+                   for _ in range(self.num_classes)]
+        for state, row in enumerate(trans):
+            for cls, target in enumerate(row):
+                inverse[cls][target].append(state)
+
+        groups = {}
+        for state in range(num_states):
+            groups.setdefault((accepts[state], stops[state]), set()).add(state)
+        partition = list(groups.values())
+        block_of = [0] * num_states
+        for b, block in enumerate(partition):
+            for state in block:
+                block_of[state] = b
+        worklist = list(range(len(partition)))
+        in_worklist = set(worklist)
+
+        while worklist:
+            b = worklist.pop()
+            in_worklist.discard(b)
+            splitter = set(partition[b])
+            for cls in range(self.num_classes):
+                preds = set()
+                for state in splitter:
+                    preds.update(inverse[cls][state])
+                if not preds:
+                    continue
+                touched = {}
+                for state in preds:
+                    touched.setdefault(block_of[state], set()).add(state)
+                for b, inside in touched.items():
+                    block = partition[b]
+                    if len(inside) == len(block):
+                        continue
+                    outside = block - inside
+                    partition[b] = inside
+                    partition.append(outside)
+                    nb = len(partition) - 1
+                    for state in outside:
+                        block_of[state] = nb
+                    if b in in_worklist:
+                        worklist.append(nb)
+                        in_worklist.add(nb)
+                    else:
+                        smaller = nb if len(outside) <= len(inside) else b
+                        worklist.append(smaller)
+                        in_worklist.add(smaller)
+
+        # renumber the blocks so the dead state is 0 and the start is 1
+        numbering = {block_of[0]: 0, block_of[1]: 1}
+        for state in range(num_states):
+            numbering.setdefault(block_of[state], len(numbering))
+        self.num_states = len(numbering)
+        self.start = 1
+        rows = [None] * self.num_states
+        accept_col = [0] * self.num_states
+        for state in range(num_states):
+            new = numbering[block_of[state]]
+            if rows[new] is None:
+                rows[new] = [numbering[block_of[t]] for t in trans[state]]
+                accept_col[new] = accepts[state]
+        flat = [target for row in rows for target in row]
+        if self.num_states < 256:
+            self.transitions = bytes(flat)
+            self.accepts = bytes(accept_col)
+        else:
+            self.transitions = array('H', flat)
+            self.accepts = array('H', accept_col)
+
+    # --- scanning --- #
+
+    def lexemes(self, code, pos=0):
+        '''
+        Scan code from offset pos by maximal munch over the DFA,
+        yielding a tuple (kind, start, end) for every token other than
+        ignored text (comments and white space); block comments are
+        skipped by scanner.skip_comment once the DFA sees their '{-'.
+        Raises the same RuntimeError as Tokenize for an unexpected
+        character.
+        '''
+        transitions = self.transitions
+        accepts = self.accepts
+        ascii_classes = self.ascii_classes
+        char_class = self.char_class
+        num_classes = self.num_classes
+        names = self.rule_names
+        start = self.start
+        n = len(code)
+        while pos < n:
+            state = start
+            i = pos
+            rule = 0
+            end = pos
+            while i < n:
+                o = ord(code[i])
+                cls = ascii_classes[o] if o < 128 else char_class(code[i])
+                state = transitions[state * num_classes + cls]
+                if state == 0:
+                    break
+                i += 1
+                if accepts[state]:
+                    rule = accepts[state]
+                    end = i
+            kind = names[rule - 1] if rule else 'mismatch'
+            if kind == 'comment':
+                end = skip_comment(code, pos)
+            elif kind == 'mismatch':
+                _mismatch(code, pos)
+            elif kind != 'ignore':
+                yield (kind, pos, end)
+            pos = end
+
+_scanner_dfa = None
+
+def scanner_dfa():
+    '''
+    The ScannerDFA for our token_specification, built on first use
+    and then shared by every later scan.
+    '''
+    global _scanner_dfa
+    if _scanner_dfa is None:
+        _scanner_dfa = ScannerDFA(token_specification, keywords)
+    return _scanner_dfa
@@ -0,0 +1,346 @@
+"""
+filename:     dominance.py
+description:  Dominator trees (and post-dominator trees), dominance
+              frontiers and the loop nesting forest of a CFG, so that
+              later passes can tell which statements are in which
+              loops, and how deeply nested. Created for CS 554
+              (Compiler Construction) at UNM.
+"""
+
+def reverse_postorder(forward, root):
+    '''
+    The ids of the nodes reached from root, in reverse postorder of a
+    depth-first search (with an explicit stack, and the next neighbor
+    to visit of each node on it), where forward[v] is the list of
+    neighbors of the node with id v (nodes or basic blocks, anything
+    with an id), e.g. the successors of each CFG node. With the
+    predecessors instead, from the exit node, it is the order in
+    which backward analyses (such as liveness) converge fastest.
+    '''
+    visited = bytearray(len(forward))
+    visited[root] = 1
+    next_edge = [0] * len(forward)
+    order = []
+    stack = [root]
+    while stack:
+        v = stack[-1]
+        i = next_edge[v]
+        if i < len(forward[v]):
+            next_edge[v] = i + 1
+            w = forward[v][i].id
+            if not visited[w]:
+                visited[w] = 1
+                stack.append(w)
+        else:
+            stack.pop()
+            order.append(v)
+    order.reverse()
+    return order
+
+class Dominators:
+    '''
+    Dominators(nodes, root, post=False) is the dominator tree of a CFG
+    (see CFG.dominators()): node a dominates node b when every path
+    from the root (the entry node) to b goes through a. With post=True
+    it is the post-dominator tree instead, of the reversed CFG rooted
+    at the exit node (see CFG.post_dominators()).
+
+    The immediate dominators are found with the iterative algorithm of
+    Cooper, Harvey and Kennedy ("A Simple, Fast Dominance Algorithm"),
+    over the nodes in reverse postorder, which takes one or two passes
+    on the CFGs of structured programs. The tree is then numbered in
+    preorder and postorder, so dominates() is two comparisons, and the
+    dominance frontiers are found from the immediate dominators in one
+    pass over the join nodes.
+
+    nodes is the list of nodes of the CFG, each with its position in
+    the list as its id (as CFG.nodes). Nodes the root does not reach
+    have no immediate dominator, and dominate nothing.
+    '''
+
+    def __init__(self, nodes, root, post=False):
+        self.nodes = nodes
+        self.root = root
+        self.post = post
+        # the lists of neighbors of the nodes (no new lists are made per
+        # node, which keeps the garbage collector out of the way on
+        # large CFGs)
+        if post:
+            forward = [node.pred for node in nodes]
+            backward = [node.succ for node in nodes]
+        else:
+            forward = [node.succ for node in nodes]
+            backward = [node.pred for node in nodes]
+        self.order = reverse_postorder(forward, root.id)
+        self.idoms = self._immediate_dominators(backward)
+        self._number_tree()
+        self.frontiers = self._frontiers(backward)
+
+    def _immediate_dominators(self, backward):
+        '''
+        The id of the immediate dominator of each node (the root is its
+        own, and nodes not reached have -1).
+        '''
+        rpo = [-1] * len(backward)
+        for number, v in enumerate(self.order):
+            rpo[v] = number
+        root = self.order[0]
+        idoms = [-1] * len(backward)
+        idoms[root] = root
+        changed = True
+        while changed:
+            changed = False
+            for v in self.order[1:]:
+                new = -1
+                for pred in backward[v]:
+                    p = pred.id
+                    if idoms[p] == -1:
+                        continue
+                    if new == -1:
+                        new = p
+                        continue
+                    # intersect the paths of p and new up the tree
+                    while p != new:
+                        while rpo[p] > rpo[new]:
+                            p = idoms[p]
+                        while rpo[new] > rpo[p]:
+                            new = idoms[new]
+                if idoms[v] != new:
+                    idoms[v] = new
+                    changed = True
+        return idoms
+
+    def _number_tree(self):
+        '''
+        The children (as first child and next sibling, by id), depth,
+        and preorder and postorder numbers of each node in the
+        dominator tree.
+        '''
+        n = len(self.idoms)
+        self.first_child = [-1] * n
+        self.next_sibling = [-1] * n
+        for v in reversed(self.order[1:]):
+            idom = self.idoms[v]
+            self.next_sibling[v] = self.first_child[idom]
+            self.first_child[idom] = v
+        self.depths = [-1] * n
+        self.pre = [-1] * n
+        self.post_number = [-1] * n
+        root = self.order[0]
+        self.depths[root] = 0
+        self.pre[root] = 0
+        counter = 0
+        # the next child to visit of each node on the stack
+        next_child = self.first_child[:]
+        stack = [root]
+        while stack:
+            v = stack[-1]
+            w = next_child[v]
+            if w != -1:
+                next_child[v] = self.next_sibling[w]
+                counter += 1
+                self.pre[w] = counter
+                self.depths[w] = self.depths[v] + 1
+                stack.append(w)
+            else:
+                stack.pop()
+                counter += 1
+                self.post_number[v] = counter
+
+    def _frontiers(self, backward):
+        '''
+        The dominance frontier of each node that has one (as a list of
+        ids, by id): the join nodes it does not strictly dominate, but
+        dominates a predecessor of.
+        '''
+        idoms = self.idoms
+        frontiers = {}
+        for v in self.order:
+            if len(backward[v]) < 2:
+                continue
+            for pred in backward[v]:
+                runner = pred.id
+                if idoms[runner] == -1:
+                    continue
+                while runner != idoms[v]:
+                    frontier = frontiers.setdefault(runner, [])
+                    if not frontier or frontier[-1] != v:
+                        frontier.append(v)
+                    runner = idoms[runner]
+        return frontiers
+
+    def idom(self, node):
+        '''
+        The immediate dominator of node (None for the root, and for
+        nodes the root does not reach).
+        '''
+        idom = self.idoms[node.id]
+        if idom == -1 or node is self.root:
+            return None
+        return self.nodes[idom]
+
+    def dominates(self, a, b):
+        '''
+        True if a dominates b (every node dominates itself).
+        '''
+        if self.pre[a.id] == -1 or self.pre[b.id] == -1:
+            return False
+        return (self.pre[a.id] <= self.pre[b.id]
+                and self.post_number[b.id] <= self.post_number[a.id])
+
+    def children(self, node):
+        '''
+        The nodes node is the immediate dominator of.
+        '''
+        children = []
+        v = self.first_child[node.id]
+        while v != -1:
+            children.append(self.nodes[v])
+            v = self.next_sibling[v]
+        return children
+
+    def depth(self, node):
+        '''
+        The depth of node in the dominator tree (0 for the root, -1 for
+        nodes the root does not reach).
+        '''
+        return self.depths[node.id]
+
+    def frontier(self, node):
+        '''
+        The dominance frontier of node.
+        '''
+        return [self.nodes[v] for v in self.frontiers.get(node.id, [])]
+
+class Loop:
+    '''
+    A natural loop of a CFG (see LoopForest): its header (the while
+    condition), the loop it is nested in (its parent, None for an
+    outermost loop), the loops nested in it, and its depth (1 for an
+    outermost loop). Its own nodes are those in no inner loop.
+    '''
+
+    def __init__(self, header):
+        self.header = header
+        self.parent = None
+        self.children = []
+        self.depth = 1
+        self.own = []
+
+    def body(self):
+        '''
+        All the nodes of the loop, including those of its inner loops
+        and its header, in the order of the CFG.
+        '''
+        nodes = []
+        stack = [self]
+        while stack:
+            loop = stack.pop()
+            nodes.extend(loop.own)
+            stack.extend(loop.children)
+        nodes.sort(key=lambda node: node.id)
+        return nodes
+
+    def exits(self):
+        '''
+        The nodes outside the loop that control leaves it to, as pairs
+        (node in the loop, node after it), in the order of the CFG.
+        '''
+        body = self.body()
+        inside = {node.id for node in body}
+        return [(node, succ) for node in body for succ in node.succ
+                if succ.id not in inside]
+
+class LoopForest:
+    '''
+    LoopForest(nodes, dominators) is the loop nesting forest of a CFG
+    (see CFG.loops()): a natural loop for each header that dominates
+    the source of an edge to it (a back edge), made of the nodes that
+    reach a back edge without going through its header. The loops are
+    found innermost first, by going through the headers in reverse
+    preorder of the dominator tree; walking back from a back edge,
+    nodes of an inner loop are skipped by jumping to the header of its
+    outermost loop found so far (kept with path compression, as in
+    Tarjan's and Havlak's loop finding), which becomes a child of the
+    new loop. This takes time about linear in the size of the CFG.
+
+    loops is the list of loops, outermost first, and roots the list of
+    outermost loops.
+    '''
+
+    def __init__(self, nodes, dominators):
+        self.nodes = nodes
+        n = len(nodes)
+        pre = dominators.pre
+        headers = []
+        tails = {}
+        for node in nodes:
+            for succ in node.succ:
+                if dominators.dominates(succ, node):
+                    if succ.id not in tails:
+                        headers.append(succ.id)
+                        tails[succ.id] = []
+                    tails[succ.id].append(node.id)
+        headers.sort(key=lambda h: pre[h], reverse=True)
+
+        # innermost loop of each node, and outermost loop found so far
+        # of each loop, by index in the order the loops are found
+        loop_of = [-1] * n
+        outer = []
+        found = []
+
+        def outermost(l):
+            root = l
+            while outer[root] != root:
+                root = outer[root]
+            while outer[l] != root:
+                outer[l], l = root, outer[l]
+            return root
+
+        for h in headers:
+            index = len(found)
+            loop = Loop(nodes[h])
+            found.append(loop)
+            outer.append(index)
+            loop_of[h] = index
+            loop.own.append(nodes[h])
+            work = [t for t in tails[h] if t != h]
+            while work:
+                v = work.pop()
+                if loop_of[v] == -1:
+                    loop_of[v] = index
+                    loop.own.append(nodes[v])
+                    work.extend(pred.id for pred in nodes[v].pred
+                                if pre[pred.id] != -1)
+                    continue
+                inner = outermost(loop_of[v])
+                if inner == index:
+                    continue
+                outer[inner] = index
+                found[inner].parent = loop
+                loop.children.append(found[inner])
+                work.extend(pred.id for pred in found[inner].header.pred
+                            if pre[pred.id] != -1)
+
+        self.loops = list(reversed(found))
+        for loop in self.loops:
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+            loop.own.sort(key=lambda node: node.id)
+            loop.children.sort(key=lambda child: child.header.id)
+        self.roots = [loop for loop in self.loops if loop.parent is None]
+        self._loop_of = [None if l == -1 else found[l] for l in loop_of]
+
+    def loop(self, node):
+        '''
+        The innermost loop node is in (None if it is in no loop).
+        '''
+        return self._loop_of[node.id]
+
+    def depth(self, node):
+        '''
+        The number of loops node is in (0 if it is in no loop), e.g. to
+        weight the uses of variables by.
+        '''
+        loop = self._loop_of[node.id]
+        return 0 if loop is None else loop.depth
@@ -0,0 +1,192 @@
+"""
+filename:     frequency.py
+description:  Static estimates of how often each node and edge of a
+              CFG is executed (per run of the program), from branch
+              probabilities predicted by heuristics and the loop
+              nesting of the CFG, for register allocation, spilling
+              and block layout to favor the hot code. Created for
+              CS 554 (Compiler Construction) at UNM.
+"""
+
+from trees import ASSIGN, VAR
+from traversal import preorder
+
+class Frequencies:
+    '''
+    Frequencies(cfg) estimates the execution frequency of every node and
+    edge of the CFG (see CFG.frequencies()), with the entry node
+    executed once.
+
+    The probability of each branch is predicted as Ball and Larus do
+    ("Branch Prediction for Free"): a while condition goes back into
+    its body with probability loop_probability (their loop branch
+    heuristic, with the back edges assumed taken), an if condition
+    comparing for equality is predicted false with probability
+    equality_probability (their opcode heuristic), and any other if
+    condition goes either way with the same probability.
+
+    The frequencies are then propagated as Wu and Larus do ("Static
+    Branch Frequency and Program Profile Analysis"): innermost loop
+    first, the frequencies of the nodes of each loop are found relative
+    to its header (in reverse postorder, a topological order of the
+    forward edges of these CFGs), which gives the probability of going
+    around the loop again, and so the number of times the header runs
+    each time the loop is entered; the same propagation over the whole
+    CFG from the entry node then scales every loop by its count.
+
+    frequency(), edge_frequency() and probability() give the
+    estimates, variable_weights() weighs the variables of a list of
+    nodes by them (for register allocation and spilling), and layout()
+    orders basic blocks so that the hot edges fall through.
+    '''
+
+    # probability of a while condition going into its body
+    loop_probability = 0.88
+    # probability of an if condition comparing for equality being false
+    equality_probability = 0.84
+    # cap on the probability of going around a loop again
+    max_cyclic_probability = 1 - 1e-6
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        nodes = cfg.nodes
+        dominators = cfg.dominators()
+        rpo = [0] * len(nodes)
+        for number, v in enumerate(dominators.order):
+            rpo[v] = number
+        self.probabilities = [self._branch_probabilities(node)
+                              for node in nodes]
+        # back edges (by the ids of their source and target: edges to a
+        # loop header from inside its loop), and the probability of each
+        # of them, relative to its loop header
+        self._back_edges = {(node.id, succ.id) for node in nodes
+                            for succ in node.succ
+                            if dominators.dominates(succ, node)}
+        self._back_probability = {}
+        self.node_freqs = [0.0] * len(nodes)
+        self.edge_freqs = [[0.0] * len(node.succ) for node in nodes]
+        for loop in reversed(cfg.loops().loops):
+            region = sorted((node.id for node in loop.body()),
+                            key=rpo.__getitem__)
+            self._propagate(loop.header.id, region)
+        self._propagate(cfg.entry.id, dominators.order)
+
+    def _branch_probabilities(self, node):
+        '''
+        The predicted probability of each successor edge of node.
+        '''
+        if len(node.succ) < 2:
+            return [1.0] * len(node.succ)
+        if node.content.startswith("while"):
+            taken = self.loop_probability
+        elif node.ast.type == "=":
+            taken = 1 - self.equality_probability
+        else:
+            taken = 0.5
+        return [taken, 1 - taken]
+
+    def _propagate(self, head, region):
+        '''
+        Propagate frequencies over region (the ids of the nodes of a
+        loop, or of the whole CFG, in reverse postorder) from head,
+        which is given frequency 1.
+        '''
+        nodes = self.cfg.nodes
+        back_edges = self._back_edges
+        for v in region:
+            node = nodes[v]
+            if v == head:
+                freq = 1.0
+            else:
+                freq = 0.0
+                cyclic = 0.0
+                for pred in node.pred:
+                    if (pred.id, v) in back_edges:
+                        cyclic += self._back_probability.get((pred.id, v), 0.0)
+                    else:
+                        freq += self.edge_freqs[pred.id][pred.succ.index(node)]
+                cyclic = min(cyclic, self.max_cyclic_probability)
+                freq /= 1 - cyclic
+            self.node_freqs[v] = freq
+            for i, succ in enumerate(node.succ):
+                edge = freq * self.probabilities[v][i]
+                self.edge_freqs[v][i] = edge
+                if succ.id == head:
+                    self._back_probability[(v, head)] = edge
+
+    def frequency(self, node):
+        '''
+        The estimated number of times node runs per run of the program.
+        '''
+        return self.node_freqs[node.id]
+
+    def edge_frequency(self, node, index):
+        '''
+        The estimated number of times control goes from node to
+        node.succ[index].
+        '''
+        return self.edge_freqs[node.id][index]
+
+    def probability(self, node, index):
+        '''
+        The predicted probability of node going to node.succ[index].
+        '''
+        return self.probabilities[node.id][index]
+
+    def variable_weights(self, nodes=None):
+        '''
+        The estimated number of times each variable is used or assigned
+        per run of the program, by the statements and conditions of
+        nodes (by default, all the nodes of the CFG).
+        '''
+        weights = {}
+        for node in self.cfg.nodes if nodes is None else nodes:
+            if node.type in ["entry", "exit"]:
+                continue
+            freq = self.node_freqs[node.id]
+            ast = node.ast
+            if ast.type == ASSIGN:
+                var = ast.children[0].value
+                weights[var] = weights.get(var, 0.0) + freq
+                ast = ast.children[1]
+            for leaf in preorder(ast):
+                if leaf.type == VAR:
+                    weights[leaf.value] = weights.get(leaf.value, 0.0) + freq
+        return weights
+
+    def layout(self, blocks):
+        '''
+        Order basic blocks (see cfg.basic_blocks()) for code layout,
+        keeping the first (entry) and last (exit) in place: blocks are
+        chained along their most frequent outgoing edges (each chain
+        falling through from one block to the next), starting a new
+        chain at the first block not laid out yet, in the order given.
+        '''
+        if len(blocks) < 3:
+            return list(blocks)
+        placed = {blocks[0].id, blocks[-1].id}
+        order = [blocks[0]]
+        block_of = {block.nodes[0].id: block for block in blocks}
+        pending = list(reversed(blocks[1:-1]))
+        current = blocks[0]
+        while True:
+            last = current.nodes[-1]
+            candidates = sorted(range(len(last.succ)),
+                                key=lambda i: -self.edge_freqs[last.id][i])
+            following = None
+            for i in candidates:
+                block = block_of.get(last.succ[i].id)
+                if block is not None and block.id not in placed:
+                    following = block
+                    break
+            while following is None and pending:
+                block = pending.pop()
+                if block.id not in placed:
+                    following = block
+            if following is None:
+                break
+            placed.add(following.id)
+            order.append(following)
+            current = following
+        order.append(blocks[-1])
+        return order
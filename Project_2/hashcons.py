@@ -0,0 +1,74 @@
+"""
+filename:     hashcons.py
+description:  Hash-consing of the expressions in an abstract syntax
+              tree (AST), so that structurally equal expressions share
+              a single node. Created for CS 554 (Compiler Construction)
+              at UNM.
+"""
+
+import hashlib
+
+from traversal import Rewriter
+
+class ExpressionTable(Rewriter):
+    '''
+    ExpressionTable interns the expression subtrees of ASTs, turning
+    them into a DAG in which structurally equal expressions are one
+    and the same node:
+
+        table = ExpressionTable()
+        ast = table.intern(ast)
+
+    Each expression node is looked up by the key (type, value, label,
+    ids of its interned children), so after interning two expressions
+    are equal exactly when they are the same node, an O(1) check. The
+    label is part of the key so that the labeled conditions of if and
+    while statements stay distinct (their operands are still shared).
+    Statement nodes (seq, assign, skip, if, while) are never shared;
+    only their expression children are replaced by interned ones.
+    The table also gives each interned expression a structural hash
+    (see digest()), which is stable from run to run, unlike Python's
+    hash() of strings.
+    A shared node keeps the source index of its first occurrence, so
+    insert_labels(), which needs the index of every token, should be
+    run before interning. One table can intern several trees, sharing
+    expressions between them.
+    '''
+
+    def __init__(self):
+        self.nodes = {}         # key -> interned node
+        self.digests = {}       # node id -> structural hash
+        self.hits = 0           # expressions replaced by a shared node
+
+    def intern(self, node):
+        '''
+        Intern the expressions of the tree at node, and return its
+        root (the interned node itself if node is an expression).
+        '''
+        return self.rewrite(node)
+
+    def digest(self, node):
+        '''
+        The stable 64-bit structural hash of an interned expression.
+        '''
+        return self.digests[node.id]
+
+    def rewrite_default(self, node, results):
+        # an expression, whose children are already interned
+        key = (node.type, node.value, node.l,
+               tuple(child.id for child in results))
+        interned = self.nodes.get(key)
+        if interned is not None:
+            self.hits += 1
+            return interned
+        node = Rewriter.rewrite_default(self, node, results)
+        text = repr((node.type, node.value, node.l,
+                     [self.digests[child.id] for child in results]))
+        self.digests[node.id] = int.from_bytes(
+                hashlib.blake2b(text.encode(), digest_size=8).digest(),
+                'big')
+        self.nodes[key] = node
+        return node
+
+    rewrite_seq = rewrite_assign = rewrite_skip = Rewriter.rewrite_default
+    rewrite_if = rewrite_while = Rewriter.rewrite_default
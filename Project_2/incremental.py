@@ -0,0 +1,339 @@
+"""
+filename:     incremental.py
+description:  Incremental re-scanning and re-parsing of a WHILE
+              program after small edits, for editor and watch
+              workflows. Created for CS 554 (Compiler Construction)
+              at UNM.
+"""
+
+from bisect import bisect_left, bisect_right
+from scanner import Token, Tokenize, LineIndex
+from parser import Parser, ast_type_to_value, FI, IF, OD, SEQ, WHILE
+from trees import decorate_ast
+
+class IncrementalParser:
+    '''
+    IncrementalParser(code) scans, parses and decorates a program once,
+    keeping its tokens and its (decorated) AST, and then updates them
+    after each edit, like this:
+
+        front_end = IncrementalParser(code)
+        front_end.edit(start, end, text)   # code[start:end] = text
+        ast = front_end.ast
+
+    The program is treated as its sequence of top-level statements.
+    An edit re-scans only from the start of the top-level statement it
+    falls in until the new tokens line up with the old ones again, and
+    re-parses only the statements from there on until the parser
+    reaches the start of an old statement past the re-scanned tokens.
+    Every other statement keeps its tokens and AST subtree.
+    The statements after an edit also have to move: their source
+    offsets, their token positions and (if the number of labels before
+    them changed) their decorate_ast labels. Rather than updating them
+    all on every edit, the statements from a boundary statement on
+    share one pending shift of each of these, which only has to be
+    applied to the statements between one edit and the next (and to
+    all of them when the ast, statements or tokens are read). So the
+    time an edit takes depends on the size of the edit and on how far
+    it is from the previous edit, not on the size of the program.
+    The tokens and AST read back are always identical (apart from node
+    ids) to those of a full parse of the edited code. If an edit makes
+    the program invalid, edit() raises the error a full parse would
+    raise, and the next edit starts over with a full parse.
+    Given a CompilationContext (see context.py), all the TreeNodes
+    made, in the first parse and after each edit, get their ids from
+    it.
+    '''
+
+    def __init__(self, code, engine='re', context=None):
+        self.engine = engine
+        self.context = context
+        self.reparse(code)
+
+    def reparse(self, code):
+        '''
+        Scan, parse and decorate code from scratch.
+        '''
+        self.code = code
+        self._tokens = None             # marks an invalid program
+        tokens = list(Tokenize(code, self.engine))
+        ast = Parser(tokens, LineIndex(code), self.context).parse(
+                build_pt=False)[1]
+
+        # split the AST along its right spine of seq nodes
+        self._spine = []
+        self._statements = []
+        node = ast.root
+        while node.type == SEQ:
+            self._spine.append(node)
+            self._statements.append(node.children[0])
+            node = node.children[1]
+        self._statements.append(node)
+
+        # the index of the first token of each top-level statement
+        self._starts = [0]
+        depth = 0
+        for i, token in enumerate(tokens):
+            if token.type in [IF, WHILE]:
+                depth += 1
+            elif token.type in [FI, OD]:
+                depth -= 1
+            elif token.type == SEQ and depth == 0:
+                self._starts.append(i + 1)
+
+        # the first decorate_ast label of each top-level statement
+        self._first_labels = []
+        label = 0
+        for statement in self._statements:
+            self._first_labels.append(label)
+            label = decorate_ast(statement, label)
+        self.num_labels = label
+        self._tokens = tokens
+
+        # No shift is pending: statements from self._pending on would
+        # be short by self._offset_shift in their source offsets, by
+        # self._token_shift in their token positions and by
+        # self._label_shift in their labels, and so would the tokens
+        # from self._pending_token on in their offsets.
+        self._pending = len(self._statements)
+        self._pending_token = len(tokens)
+        self._offset_shift = self._token_shift = self._label_shift = 0
+
+    # --- the program, with any pending shift applied --- #
+
+    @property
+    def ast(self):
+        '''
+        The root of the decorated AST of the current program (None
+        if it is invalid).
+        '''
+        if self._tokens is None:
+            return None
+        self._rebase(len(self._statements))
+        return self._spine[0] if self._spine else self._statements[0]
+
+    @property
+    def statements(self):
+        '''
+        The AST of each top-level statement of the current program
+        (None if it is invalid).
+        '''
+        if self._tokens is None:
+            return None
+        self._rebase(len(self._statements))
+        return self._statements
+
+    @property
+    def tokens(self):
+        '''
+        The list of Tokens of the current program (None if it is
+        invalid).
+        '''
+        if self._tokens is None:
+            return None
+        self._rebase(len(self._statements))
+        return self._tokens
+
+    # --- access to statements and tokens, pending shift included --- #
+
+    def _start(self, s):
+        '''
+        The position of the first token of statement s.
+        '''
+        if s >= self._pending:
+            return self._starts[s] + self._token_shift
+        return self._starts[s]
+
+    def _first_label(self, s):
+        '''
+        The first label of statement s.
+        '''
+        if s >= self._pending:
+            return self._first_labels[s] + self._label_shift
+        return self._first_labels[s]
+
+    def _token(self, k):
+        '''
+        The Token at position k.
+        '''
+        token = self._tokens[k]
+        if k >= self._pending_token and self._offset_shift:
+            shift = self._offset_shift
+            return Token(token.type, token.value,
+                         token.start + shift, token.index + shift)
+        return token
+
+    def _rebase(self, s):
+        '''
+        Move the pending shift boundary to statement s, applying the
+        pending shift to the statements it passes over (when moving
+        forward) or taking it away from them (when moving back).
+        '''
+        if s == self._pending:
+            return
+        lo, hi = sorted([self._pending, s])
+        sign = 1 if s > self._pending else -1
+        offset_shift = sign * self._offset_shift
+        token_shift = sign * self._token_shift
+        label_shift = sign * self._label_shift
+        first_token = self._start(lo)
+        last_token = (self._start(hi) if hi < len(self._statements)
+                      else len(self._tokens))
+        if offset_shift:
+            for k in range(first_token, last_token):
+                token = self._tokens[k]
+                self._tokens[k] = Token(token.type, token.value,
+                                        token.start + offset_shift,
+                                        token.index + offset_shift)
+        for t in range(lo, hi):
+            self._starts[t] += token_shift
+            self._first_labels[t] += label_shift
+            if offset_shift or label_shift:
+                _shift(self._statements[t], offset_shift, label_shift)
+        self._pending = s
+        self._pending_token = (self._starts[s] + self._token_shift
+                               if s < len(self._statements)
+                               else len(self._tokens))
+
+    # --- editing --- #
+
+    def edit(self, start, end, text):
+        '''
+        Replace code[start:end] with text and update the tokens and
+        the decorated AST.
+        '''
+        code = self.code[:start] + text + self.code[end:]
+        if self._tokens is None:
+            self.reparse(code)
+            return
+        try:
+            self._update(code, start, end, len(text) - (end - start))
+        except (SyntaxError, RuntimeError):
+            # the edited program may be invalid, so let a full parse
+            # either succeed or raise the proper error
+            self.reparse(code)
+
+    def _update(self, code, start, end, delta):
+        '''
+        The incremental part of edit(): code is the edited program, in
+        which the old code[start:end] became new text delta characters
+        longer.
+        '''
+        tokens = self._tokens
+        num_statements = len(self._statements)
+
+        # The damaged statements start with statement i, the last one
+        # whose preceding ';' ends at or before the edit (nothing before
+        # such a ';' can change, and no token can grow out of one).
+        def _separator_end(s):
+            return self._token(self._start(s) - 1).index if s else 0
+        i = bisect_right(range(num_statements), start,
+                         key=_separator_end) - 1
+        self._rebase(i)
+        first = self._start(i)
+        restart = _separator_end(i)
+
+        # Re-scan until a new token starts where an old token (from
+        # after the edit) started; from there on the code is the same,
+        # so the rest of the tokens are the old ones, shifted by delta.
+        new_end = end + delta
+        m = bisect_left(range(len(tokens)), end,
+                        key=lambda k: self._token(k).start)
+        new_tokens = []
+        for token in Tokenize(code, self.engine, restart):
+            if token.start >= new_end:
+                while (m < len(tokens)
+                       and self._token(m).start + delta < token.start):
+                    m += 1
+                if (m < len(tokens)
+                        and self._token(m).start + delta == token.start):
+                    break
+            new_tokens.append(token)
+        else:
+            m = len(tokens)
+
+        def _stream():
+            yield from new_tokens
+            for k in range(m, len(tokens)):
+                token = self._token(k)
+                yield Token(token.type, token.value,
+                            token.start + delta, token.index + delta)
+
+        # Re-parse top-level statements until one ends just before the
+        # first token of an old statement that lies past the re-scan;
+        # it and the statements after it are the same as before.
+        parser = Parser(_stream(), context=self.context)
+        parser.build_pt = False
+        new_statements, new_starts = [], []
+        j = num_statements
+        while True:
+            new_starts.append(first + parser.current_token_index)
+            new_statements.append(parser.statement()[1])
+            if not parser.peek(SEQ):
+                # as in Parser.parse(), the program must end here
+                if parser._has(parser.current_token_index + 1):
+                    raise SyntaxError("Parsing ended prematurely.")
+                break
+            parser.consume(SEQ)
+            k = parser.current_token_index - len(new_tokens) + m
+            if k >= m:
+                s = bisect_left(range(num_statements), k, key=self._start)
+                if s < num_statements and self._start(s) == k:
+                    j = s
+                    break
+
+        # Decorate the new statements.
+        labels = self._first_label(i)
+        new_first_labels = []
+        for statement in new_statements:
+            new_first_labels.append(labels)
+            labels = decorate_ast(statement, labels)
+        label_delta = labels - (self._first_label(j) if j < num_statements
+                                else self.num_labels)
+
+        # Splice in the new tokens and statements, which need no shift,
+        # and add this edit's shifts to the pending ones of the reused
+        # statements after them.
+        # (The old tokens the parser read past the re-scan belong to the
+        # new statements, so they get their shift now too.)
+        reused = self._start(j) if j < num_statements else len(tokens)
+        token_delta = len(new_tokens) - (m - first)
+        for k in range(m, reused):
+            token = self._token(k)
+            new_tokens.append(Token(token.type, token.value,
+                                    token.start + delta, token.index + delta))
+        tokens[first:reused] = new_tokens
+        self._statements[i:j] = new_statements
+        self._starts[i:j] = new_starts
+        self._first_labels[i:j] = new_first_labels
+        self._pending = i + len(new_statements)
+        self._offset_shift += delta
+        self._token_shift += token_delta
+        self._label_shift += label_delta
+        self._pending_token = first + len(new_tokens)
+        self.num_labels += label_delta
+
+        # Link the new statements into the right spine of seq nodes.
+        last = len(self._statements) - 1
+        spine = self._spine
+        spine[i:min(j, len(spine))] = [
+                parser._tree_node(type=SEQ, value=ast_type_to_value[SEQ])
+                for p in range(i, min(i + len(new_statements), last))]
+        for p in range(max(i - 1, 0), min(i + len(new_statements), last)):
+            rest = spine[p + 1] if p + 1 < last else self._statements[last]
+            spine[p].children = [self._statements[p], rest]
+        self.code = code
+
+def _shift(node, offset_shift, label_shift):
+    '''
+    Add offset_shift to the source index and label_shift to the label
+    of every node of the subtree at node that has one.
+    '''
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.index is not None:
+            node.index += offset_shift
+        if node.l is not None:
+            node.l += label_shift
+        stack.extend(node.children)
@@ -1,3 +1,31 @@
+from dominance import reverse_postorder
+from traversal import Visitor
+
+class _UsedVariables(Visitor):
+    """
+    Visitor collecting the variables used (read) by a statement or a
+    condition, for Optimizer.gen().
+    """
+    def __init__(self):
+        self.used = set()
+
+    def enter_assign(self, node):
+        # the variable assigned to is not used
+        return [node.children[1]]
+
+    def enter_var(self, node):
+        self.used.add(node.value)
+
+    def _operator(self, node):
+        pass
+
+    enter_eq = enter_lt = enter_gt = enter_le = enter_ge = _operator
+    enter_and = enter_or = enter_not = _operator
+    enter_add = enter_sub = enter_mult = _operator
+
+    def enter_default(self, node):
+        return False
+
 class InterferenceGraph:
     def __init__(self):
         self.nodes = set()
@@ -18,11 +46,14 @@ class InterferenceGraph:
         else:
             self.edges[node2] = {node1}
     
-    def greedyColor(self):
+    def greedyColor(self, report=print):
         """
         Function for creating a coloring of the Interference Graph.
         Adapted from Greedy Color Algorithm referenced on
         Wikipedia: https://en.wikipedia.org/wiki/Greedy_coloring
+
+        Args:
+            report: Function reporting the coloring (None for no report).
         """
         def firstColor(colors):
             color = 0
@@ -37,10 +68,12 @@ class InterferenceGraph:
                                  if nbr in self.coloring}
             self.coloring[node] = firstColor(usedColors)
         
-        print(f"Coloring: {self.coloring}")
+        if report:
+            report(f"Coloring: {self.coloring}")
 
 class Optimizer:
-    def __init__(self, cfg, outVars={'output'}):
+    def __init__(self, cfg, outVars={'output'}, report=print, context=None,
+                 basic_blocks=True, solver="worklist"):
         """
         Class for optimizing code from a CFG,
         utilizes Live Variable Analysis.
@@ -48,31 +81,132 @@ class Optimizer:
         Args:
             cfg: A Control Flow Graph object.
             outVars: A set of variables assumed to be live on exit.
+            report: Function called with each line of the report on the
+                analysis (its equations, their solution, and the dead
+                code removed), or None for no report; the lines are
+                only built when they are reported.
+            context: Optional CompilationContext (see context.py) the
+                Optimizer is recorded in, and whose symbols the
+                variable names are interned in.
+            basic_blocks: If True, solve the equations per basic block
+                of the CFG, and then find the sets of the statements
+                in each block in one pass over it; if False, solve
+                them per statement (the sets are the same either way).
+            solver: "worklist" to solve the equations with a worklist
+                (see solve_worklist()), or "round-robin" to sweep over
+                all the blocks until nothing changes (see
+                solve_blocks()); the sets are the same either way.
         """
+        if solver not in ["worklist", "round-robin"]:
+            raise ValueError(f"unknown liveness solver '{solver}'")
         self.cfg = cfg
+        self.report = report
+        self.context = context
+        if context is not None:
+            context.passes['optimizer'] = self
+            outVars = {context.intern(var) for var in outVars}
 
-        # Initialize LV_in set, and LV_out set
-        self.IN = {}
-        self.OUT = {}
-        self.GEN = {}
-        self.KILL = {}
-        for node in self.cfg.nodes:
-            self.IN[node.label] = set()
-            if node.label == "exit":
-                self.OUT[node.label] = outVars
-            else:
-                self.OUT[node.label] = set()
-            self.GEN[node.label] = self.gen(node)
-            self.KILL[node.label] = self.kill(node)
+        # gen and kill sets, and the LV_in and LV_out sets once they are
+        # solved, of each node, indexed by its id (see CFG_Node)
+        nodes = self.cfg.nodes
+        self.gen_sets = [self.gen(node) for node in nodes]
+        self.kill_sets = [self.kill(node) for node in nodes]
 
         # Print Live Variable Analysis Equations
-        print(f"LV_in(l)  = gen(l) ∪ (LV_out(l) / kill(l))")
-        print(f"LV_out(l) = U LV_in(l') | l' ∈ l's successors\n")
+        if report:
+            self.report_equations()
+
+        # Solve Live Variable Analysis of CFG
+        self.blocks = self.cfg.basic_blocks(single=not basic_blocks)
+        if solver == "worklist":
+            iteration = self.solve_worklist(outVars)
+        else:
+            iteration = self.solve_blocks(outVars)
+        self.iterations = iteration
+        self.refine_blocks()
+
+        # The sets by node label, which stay valid when nodes are removed
+        # (and the rest renumbered)
+        self.IN = {node.label: self.live_in[node.id] for node in nodes}
+        self.OUT = {node.label: self.live_out[node.id] for node in nodes}
+        self.GEN = {node.label: self.gen_sets[node.id] for node in nodes}
+        self.KILL = {node.label: self.kill_sets[node.id] for node in nodes}
+        
+        # Print Live Variable In and Out sets for each node in the CFG
+        if report:
+            report(f"Live variable analysis completed in {iteration} iteration(s) "
+                   f"over {len(self.blocks)} basic block(s), with "
+                   f"{self.evaluations} block evaluation(s).")
+
+        # Eliminate dead code using Live Variable sets
+        self.eliminate_dead_code()
+
+        if report:
+            report("Results:\n")
+            for node in self.cfg.nodes:
+                report(f"label_{node.label}: {node.content}")
+                _in = self.IN[node.label] if len(self.IN[node.label]) > 0 else "∅"
+                _out = self.OUT[node.label] if len(self.OUT[node.label]) > 0 else "∅"
+                report(f"LV_in({node.label})  = {_in}")
+                report(f"LV_out({node.label}) = {_out}")
+                report("")
+        
+        # Generate Interference Graph
+        self.create_interference_graph()
+
+    @classmethod
+    def from_sets(cls, cfg, IN, OUT, GEN, KILL, coloring=None, report=None,
+                  context=None):
+        """
+        An Optimizer for a CFG that was already optimized, with the
+        Live Variable sets found then (e.g. loaded from a snapshot, see
+        snapshot.py) instead of solving the equations again: nothing
+        is removed from the CFG, and only the interference graph is
+        built from the sets.
+
+        Args:
+            cfg: The optimized Control Flow Graph object.
+            IN, OUT, GEN, KILL: The LV_in, LV_out, gen and kill sets of
+                the nodes of the CFG, by node label.
+            coloring: The coloring of the interference graph found with
+                the sets (by variable), or None to color it again.
+            report: As for Optimizer() (only the interference graph is
+                reported).
+            context: As for Optimizer().
+        """
+        optimizer = cls.__new__(cls)
+        optimizer.cfg = cfg
+        optimizer.report = report
+        optimizer.context = context
+        if context is not None:
+            context.passes['optimizer'] = optimizer
+        nodes = cfg.nodes
+        optimizer.IN = {node.label: IN[node.label] for node in nodes}
+        optimizer.OUT = {node.label: OUT[node.label] for node in nodes}
+        optimizer.GEN = {node.label: GEN[node.label] for node in nodes}
+        optimizer.KILL = {node.label: KILL[node.label] for node in nodes}
+        optimizer.live_in = [IN[node.label] for node in nodes]
+        optimizer.live_out = [OUT[node.label] for node in nodes]
+        optimizer.gen_sets = [GEN[node.label] for node in nodes]
+        optimizer.kill_sets = [KILL[node.label] for node in nodes]
+        optimizer.blocks = cfg.basic_blocks()
+        optimizer.iterations = 0
+        optimizer.evaluations = 0
+        optimizer.create_interference_graph(coloring)
+        return optimizer
+
+    def report_equations(self):
+        """
+        Report the Live Variable Analysis equations of each node.
+        """
+        report = self.report
+        report(f"LV_in(l)  = gen(l) ∪ (LV_out(l) / kill(l))")
+        report(f"LV_out(l) = U LV_in(l') | l' ∈ l's successors\n")
         for node in self.cfg.nodes:
-            gen = self.GEN[node.label] if len(self.GEN[node.label]) > 0 else "∅"
-            kill = self.KILL[node.label] if len(self.KILL[node.label]) > 0 else "∅"
-            print(f"label_{node.label}: {node.content}")
-            print(f"LV_in({node.label})  = {gen} ∪ (LV_out({node.label}) / {kill})")
+            gen = self.gen_sets[node.id] if len(self.gen_sets[node.id]) > 0 else "∅"
+            kill = self.kill_sets[node.id] if len(self.kill_sets[node.id]) > 0 else "∅"
+            report(f"label_{node.label}: {node.content}")
+            report(f"LV_in({node.label})  = {gen} ∪ (LV_out({node.label}) / {kill})")
             if node.label == "exit":
                 lv_out = f"LV_out({node.label}) = "+"{'output'}"
             else:
@@ -80,49 +214,154 @@ class Optimizer:
             for s in range(len(node.succ)):
                 if s!=0: lv_out = lv_out + " ∪"
                 lv_out = lv_out + f" LV_in({node.succ[s].label})"
-            print(lv_out)
-            print("")
+            report(lv_out)
+            report("")
 
-        # Solve Live Variable Analysis of CFG
+    def block_transfers(self):
+        """
+        The gen and kill sets of each basic block in self.blocks (in two
+        lists, by the id of the block), composed from those of their
+        statements.
+        """
+        block_gen = []
+        block_kill = []
+        for block in self.blocks:
+            gen = set()
+            kill = set()
+            for node in reversed(block.nodes):
+                gen = self.gen_sets[node.id] | (gen - self.kill_sets[node.id])
+                kill |= self.kill_sets[node.id]
+            block_gen.append(gen)
+            block_kill.append(kill)
+        return block_gen, block_kill
+
+    def solve_blocks(self, outVars):
+        """
+        Solve the Live Variable Analysis equations of the basic blocks
+        in self.blocks, whose gen and kill sets are composed from those
+        of their statements, sweeping over the blocks backwards until
+        nothing changes. The sets of each block are kept (by the id of
+        the block) in the lists self.block_IN and self.block_OUT, and
+        the number of blocks evaluated in self.evaluations.
+
+        Returns: the number of sweeps (iterations)
+        """
+        block_gen, block_kill = self.block_transfers()
+        successors = [[succ.id for succ in block.succ] for block in self.blocks]
+
+        block_IN = [set() for block in self.blocks]
+        block_OUT = [set() for block in self.blocks]
+        exits = {block.id for block in self.blocks if block.label == "exit"}
+        for id in exits:
+            block_OUT[id] = outVars
         iteration = 0
         changed = True
         while changed:
             changed = False
-            for n in range(len(self.cfg.nodes)-1, -1, -1):
-                node = self.cfg.nodes[n]
-                old_out = self.OUT[node.label]
-                old_in = self.IN[node.label]
-                self.LVA_out(node)
-                self.LVA_in(node)
-                if old_out != self.OUT[node.label] or old_in != self.IN[node.label]:
+            for id in range(len(self.blocks) - 1, -1, -1):
+                if id not in exits:
+                    out = block_OUT[id]
+                    for succ in successors[id]:
+                        out = out | block_IN[succ]
+                    if out != block_OUT[id]:
+                        block_OUT[id] = out
+                        changed = True
+                _in = block_gen[id] | (block_OUT[id] - block_kill[id])
+                if _in != block_IN[id]:
+                    block_IN[id] = _in
                     changed = True
             iteration = iteration + 1
-        
-        # Print Live Variable In and Out sets for each node in the CFG
-        print(f"Live variable analysis completed in {iteration} iteration(s).")
+        self.block_IN = block_IN
+        self.block_OUT = block_OUT
+        self.evaluations = iteration * len(self.blocks)
+        return iteration
 
-        # Eliminate dead code using Live Variable sets
-        self.eliminate_dead_code()
+    def solve_worklist(self, outVars):
+        """
+        Solve the same equations as solve_blocks() (with the same
+        results) with a worklist of the blocks whose sets may change:
+        the blocks are ordered by reverse postorder of the reversed CFG
+        from the exit block (so a block comes before the blocks that
+        flow into it, but for loops), then any blocks the search does
+        not reach, backwards. Each block taken
+        off the worklist has its LV_out and LV_in sets recomputed, and
+        only if its LV_in set changed are its predecessors put back on
+        the worklist: they are evaluated in this iteration if they come
+        later in the order, and in the next one if they come earlier
+        (around a loop). Unlike a sweep, an iteration evaluates only the
+        blocks on the worklist, and there is no last iteration finding
+        that nothing changed. The number of blocks evaluated is kept in
+        self.evaluations.
 
-        print("Results:\n")
-        for node in self.cfg.nodes:
-            print(f"label_{node.label}: {node.content}")
-            _in = self.IN[node.label] if len(self.IN[node.label]) > 0 else "∅"
-            _out = self.OUT[node.label] if len(self.OUT[node.label]) > 0 else "∅"
-            print(f"LV_in({node.label})  = {_in}")
-            print(f"LV_out({node.label}) = {_out}")
-            print("")
-        
-        # Generate Interference Graph
-        self.create_interference_graph()
+        Returns: the number of iterations
+        """
+        blocks = self.blocks
+        n = len(blocks)
+        block_gen, block_kill = self.block_transfers()
+        successors = [[succ.id for succ in block.succ] for block in blocks]
+        predecessors = [block.pred for block in blocks]
 
-    def LVA_out(self, cfg_node):
-        if cfg_node.label != "exit":
-            for succ in cfg_node.succ:
-                self.OUT[cfg_node.label] = self.OUT[cfg_node.label].union(self.IN[succ.label])
+        block_IN = [set() for block in blocks]
+        block_OUT = [set() for block in blocks]
+        exits = {block.id for block in blocks if block.label == "exit"}
+        for id in exits:
+            block_OUT[id] = outVars
+        order = []
+        for id in exits:
+            order.extend(reverse_postorder(predecessors, id))
+        reached = bytearray(n)
+        for id in order:
+            reached[id] = 1
+        order.extend(id for id in range(n - 1, -1, -1) if not reached[id])
 
-    def LVA_in(self, cfg_node):
-        self.IN[cfg_node.label] = self.GEN[cfg_node.label].union(self.OUT[cfg_node.label].difference(self.KILL[cfg_node.label]))
+        # the blocks on the worklist (all of them to start with), found
+        # by going through them in order: a block put back on it while
+        # going through them is evaluated in the same iteration if it
+        # comes later in the order, and in the next one otherwise
+        queued = bytearray(b"\x01" * n)
+        pending = n
+        iteration = 0
+        evaluations = 0
+        while pending:
+            iteration += 1
+            for id in order:
+                if not queued[id]:
+                    continue
+                queued[id] = 0
+                pending -= 1
+                evaluations += 1
+                if id not in exits:
+                    succs = successors[id]
+                    out = block_IN[succs[0]] if succs else set()
+                    for succ in succs[1:]:
+                        out = out | block_IN[succ]
+                    block_OUT[id] = out
+                _in = block_gen[id] | (block_OUT[id] - block_kill[id])
+                if _in != block_IN[id]:
+                    block_IN[id] = _in
+                    for pred in predecessors[id]:
+                        if not queued[pred.id]:
+                            queued[pred.id] = 1
+                            pending += 1
+        self.block_IN = block_IN
+        self.block_OUT = block_OUT
+        self.evaluations = evaluations
+        return iteration
+
+    def refine_blocks(self):
+        """
+        Find the LV_in and LV_out sets of every statement (in the lists
+        self.live_in and self.live_out, by node id) from the sets of its
+        basic block, in one backward pass over each block.
+        """
+        self.live_in = [None] * len(self.cfg.nodes)
+        self.live_out = [None] * len(self.cfg.nodes)
+        for block in self.blocks:
+            live = self.block_OUT[block.id]
+            for node in reversed(block.nodes):
+                self.live_out[node.id] = live
+                live = self.gen_sets[node.id] | (live - self.kill_sets[node.id])
+                self.live_in[node.id] = live
 
     def kill(self, cfg_node):
         kill = set()
@@ -132,20 +371,8 @@ class Optimizer:
 
     def gen(self, cfg_node):
         gen = set()
-        ops = ["=", "<", ">", "<=", ">=", "and", "add", "sub", "mult", "or"]
-        def get_gen_var(ast, gen):
-            if ast.type == "assign":
-                get_gen_var(ast.children[1], gen)
-            elif ast.type == "not":
-                get_gen_var(ast.children[0], gen)
-            elif ast.type in ops:
-                get_gen_var(ast.children[0], gen)
-                get_gen_var(ast.children[1], gen)
-            elif ast.type == "var":
-                gen.add(ast.value)
-        
         if cfg_node.ast:
-            get_gen_var(cfg_node.ast, gen)
+            gen = _UsedVariables().visit(cfg_node.ast).used
         return gen
     
     def eliminate_dead_code(self):
@@ -157,49 +384,59 @@ class Optimizer:
         of Engineering a Compiler - 3rd Edition
         """
 
-        print(f"Number of nodes before: {len(self.cfg.nodes)}")
-        # Dead assignments in the CFG
-        dead = set()
-        nodes = [node for node in self.cfg.nodes]
-        for node in nodes:
+        report = self.report
+        if report:
+            report(f"Number of nodes before: {len(self.cfg.nodes)}")
+        # Dead assignments in the CFG, removed in one batch
+        dead = []
+        for node in self.cfg.nodes:
             if node.type not in ["entry", "exit"]:
                 if node.ast.type == "assign":
                     var = node.ast.children[0].value
-                    if var not in self.OUT[node.label]:
-                        dead.add(f"label_{node.label}: {node.content}")
-                        self.cfg.remove_node(node)
+                    if var not in self.live_out[node.id]:
+                        dead.append(node)
                 elif node.ast.type == "skip":
-                    dead.add(f"label_{node.label}: {node.content}")
-                    self.cfg.remove_node(node)
+                    dead.append(node)
+        self.cfg.remove_nodes(dead)
                 
-        print(f"Number of nodes after: {len(self.cfg.nodes)}")
-        print(f"Dead Nodes: {dead}\n")
+        if report:
+            report(f"Number of nodes after: {len(self.cfg.nodes)}")
+            dead = {f"label_{node.label}: {node.content}" for node in dead}
+            report(f"Dead Nodes: {dead}\n")
     
-    def create_interference_graph(self):
+    def create_interference_graph(self, coloring=None):
         """
         Function for creating the interference graph
         to help with assigning registers.
+
+        Args:
+            coloring: A coloring of the graph found before (by
+                variable), to use instead of coloring it again.
         """
         # Create the interference graph for variables
         self.interference_graph = InterferenceGraph()
         self.interference_graph.addNode("output")
+        # Sets equal to one added before add nothing new (many nodes
+        # share their sets), so each distinct set is only added once
+        seen = set()
         for node in self.cfg.nodes:
-            _in = self.IN[node.label]
-            _out = self.OUT[node.label]
-            for var1 in _in:
-                self.interference_graph.addNode(var1)
-                for var2 in _in:
-                    if var1 != var2:
-                        self.interference_graph.addEdge(var1, var2)
-            
-            for var1 in _out:
-                self.interference_graph.addNode(var1)
-                for var2 in _out:
-                    if var1 != var2:
-                        self.interference_graph.addEdge(var1, var2)
+            for live in [self.IN[node.label], self.OUT[node.label]]:
+                key = frozenset(live)
+                if key in seen:
+                    continue
+                seen.add(key)
+                for var1 in live:
+                    self.interference_graph.addNode(var1)
+                    for var2 in live:
+                        if var1 != var2:
+                            self.interference_graph.addEdge(var1, var2)
         
-        print(f"Interference Graph nodes: {self.interference_graph.nodes}")
-        print(f"Interference Graph edges: {self.interference_graph.edges}")
+        if self.report:
+            self.report(f"Interference Graph nodes: {self.interference_graph.nodes}")
+            self.report(f"Interference Graph edges: {self.interference_graph.edges}")
 
-        self.interference_graph.greedyColor()
+        if coloring is None:
+            self.interference_graph.greedyColor(self.report)
+        else:
+            self.interference_graph.coloring = dict(coloring)
     
\ No newline at end of file
@@ -8,7 +8,9 @@ description:  Implements a Parser class for parsing a WHILE language
               Created for CS 554 (Compiler Construction) at UNM.
 """
 
+from collections import deque
 from trees import Tree, TreeNode
+from scanner import TokenBuffer, kind_codes
 
 # ======================== #
 #    Useful constants      #
@@ -85,47 +87,159 @@ pt_type_to_value = {
     '<':'<', '>':'>', '<=':'<=', '>=':'>=', '=':'='
 }
 
+'''
+Tables for the precedence-climbing expression parser (see
+Parser._climb()). For arithmetic and for boolean expressions, the
+operators dict maps an operator's token value to its precedence level,
+the type of the PT and AST node it builds, and the token type to
+consume; the levels dict gives the PT node that wraps an expression at
+each level. Higher levels bind more tightly, and a primary (a factor)
+sits one level above the highest operator.
+'''
+arith_operators = {
+    '+':(1, ADD, OP_A), '-':(1, SUB, OP_A), '*':(2, MULT, OP_A)
+}
+arith_levels = {1:ARITHEXPR, 2:ARITHTERM}
+bool_operators = {
+    'or':(1, OR, OR), 'and':(2, AND, AND)
+}
+bool_levels = {1:BOOLEXPR, 2:BOOLTERM}
+
+class TokenWindow:
+    '''
+    TokenWindow(tokens, depth) lets the Parser index into a stream of
+    Tokens (such as the generator returned by Tokenize) as if it were
+    a list, while only holding the most recently read depth tokens in
+    a ring buffer. Tokens are pulled from the stream on demand, so the
+    memory used for the token stream stays constant however long the
+    program is. The Parser never looks further back than the token
+    before the current one, nor further ahead than the token after
+    it, so the default depth of 4 leaves room to spare.
+    '''
+
+    def __init__(self, tokens, depth=4):
+        self.stream = iter(tokens)
+        self.buffer = deque(maxlen=depth)
+        # number of tokens read from the stream so far; the buffer
+        # holds the tokens with indices [count - len(buffer), count)
+        self.count = 0
+
+    def has(self, index):
+        '''
+        True if the stream has a token at the given index, reading
+        ahead from the stream as far as needed to find out.
+        '''
+        while self.count <= index:
+            token = next(self.stream, None)
+            if token is None:
+                return False
+            self.buffer.append(token)
+            self.count += 1
+        return True
+
+    def __getitem__(self, index):
+        if not self.has(index):
+            raise IndexError("token index out of range")
+        offset = index - (self.count - len(self.buffer))
+        if offset < 0:
+            raise IndexError(f"token {index} is no longer buffered")
+        return self.buffer[offset]
+
 class Parser:
     '''
     Define and establish methods for a parser of a sequence of tokens
     produced by a separate scanner or lexer. Parser(tokens) takes as
     input a sequence of Token objects, each consisting of a length-4
-    NamedTuple of the form (type, value, line, column) and returns both
+    NamedTuple of the form (type, value, start, index) and returns both
     a parse tree AND an abstract syntax tree, by consuming the tokens
     one by one and using recursive functions to match the tokens
     against grammar rules.
     '''
 
-    def __init__(self, tokens):
+    def __init__(self, tokens, line_index=None, context=None):
         '''
         Initiate a parser using a command like:
-        my_parser = Parser(tokens)
-        '''
+        my_parser = Parser(tokens, LineIndex(code))
+        where tokens is a list of Tokens, a TokenBuffer, or any other
+        iterable of Tokens (such as the Tokenize generator), which is
+        then read through a bounded TokenWindow. The optional LineIndex
+        is only used to report line and column numbers in error
+        messages (a TokenBuffer supplies its own). Given a
+        CompilationContext (see context.py), the TreeNodes get their
+        ids from it, and variable names are interned in it.
+        '''
+        self.context = context
+        if context is not None:
+            context.passes['parser'] = self
         self.stack = []
+        if not isinstance(tokens, (list, tuple, TokenBuffer)):
+            tokens = TokenWindow(tokens)
         self.tokens = tokens
+        if line_index is None and isinstance(tokens, TokenBuffer):
+            line_index = tokens.line_index
+        self.line_index = line_index
+        # With a TokenBuffer, token types are compared directly against
+        # the buffer's column of small-int kind codes, and Token views
+        # are only created when a token's value or location is needed.
+        self.kinds = tokens.kinds if isinstance(tokens, TokenBuffer) else None
         self.current_pos = 0
         self.current_token_index = 0
-        self.current_token = self.tokens[0] if self.tokens else None
         # At the top level, the program parse tree (PT) and program
         # abstract syntax tree (AST) will each be a nested tuple of
         # statements, each statement being a collection of nested
         # tuples (essentially sub-trees). The AST is a simplified
         # (abstracted) version of the PT, generated in parallel with
         # the generation of the PT.
-        self.program_pt  = TreeNode()
-        self.program_ast = TreeNode()
+        self.program_pt  = self._tree_node()
+        self.program_ast = self._tree_node()
+        # When build_pt is False (see parse()), _pt_node() returns None
+        # in place of each parse tree node and only the AST is built.
+        self.build_pt = True
+        # With an AstArena (see parse()), the AST is built into it.
+        self.arena = None
+
+    def _line(self, token):
+        '''
+        The line number of a token, resolved from its offset only when
+        an error message needs it ('?' if no LineIndex is available).
+        '''
+        if self.line_index is None:
+            return '?'
+        return self.line_index.line(token.start)
+
+    def _column(self, token):
+        '''
+        The column number of a token, resolved like _line().
+        '''
+        if self.line_index is None:
+            return '?'
+        return self.line_index.position(token.start)[1]
+
+    def _has(self, index):
+        '''
+        True if there is a token at the given index.
+        '''
+        if isinstance(self.tokens, TokenWindow):
+            return self.tokens.has(index)
+        return index < len(self.tokens)
+
+    @property
+    def current_token(self):
+        '''
+        The token at the current_token_index, or None once all of the
+        tokens have been consumed.
+        '''
+        if self._has(self.current_token_index):
+            return self.tokens[self.current_token_index]
+        return None
 
     def _advance(self):
         '''
         A utility function to move the current token pointer by
-        one token, updating the current_token_index and the
-        current_token.
+        one token, updating the current_token_index (and with it
+        the current_token).
         '''
         self.current_token_index += 1
-        if self.current_token_index < len(self.tokens):
-            self.current_token = self.tokens[self.current_token_index]
-        else:
-            self.current_token = None
 
     def consume(self, expected_type):
         '''
@@ -133,10 +247,15 @@ class Parser:
         the expected_type, consume (and return) the token and advance
         to the next token by calling the _advance() helper fxn.
         '''
-        if self.current_pos >= len(self.tokens):
+        if not self._has(self.current_token_index):
             raise SyntaxError("Unexpected end of input.")
         token = self.current_token
-        if token.type == expected_type:
+        if self.kinds is not None:
+            matched = (self.kinds[self.current_token_index]
+                       == kind_codes.get(expected_type))
+        else:
+            matched = token.type == expected_type
+        if matched:
             # self.current_pos += 1
             self._advance()
             return token
@@ -144,7 +263,7 @@ class Parser:
             raise SyntaxError(
                     f"In Parser.consume(), expected token type "
                     f"{expected_type} but got {token.type} on "
-                    f"line {token.line}.")
+                    f"line {self._line(token)}.")
 
     def peek(self, expected_type):
         '''
@@ -152,7 +271,10 @@ class Parser:
         comparing it to the expected_type; this can be important for
         context-checking and deciding how to process the current token.
         '''
-        if self.current_token_index < len(self.tokens):
+        if self._has(self.current_token_index):
+            if self.kinds is not None:
+                return (self.kinds[self.current_token_index]
+                        == kind_codes.get(expected_type))
             return self.current_token.type == expected_type
         return False
 
@@ -162,32 +284,68 @@ class Parser:
         one) without consuming it, comparing it to the expected_type.
         Used for context checking.
         '''
-        if self.current_token_index < (len(self.tokens) - 1):
+        if self._has(self.current_token_index + 1):
+            if self.kinds is not None:
+                return (self.kinds[self.current_token_index + 1]
+                        == kind_codes.get(expected_type))
             return (self.tokens[self.current_token_index + 1].type
                     == expected_type)
         return False
 
-    def parse(self):
+    def _pt_node(self, **kwargs):
+        '''
+        A TreeNode for the parse tree (PT), or None when the Parser is
+        only building the AST.
+        '''
+        if self.build_pt:
+            return self._tree_node(**kwargs)
+        return None
+
+    def _ast_node(self, **kwargs):
+        '''
+        A node for the abstract syntax tree (AST): a TreeNode, or a
+        view of a new node in self.arena if the AST is built into an
+        AstArena.
+        '''
+        if self.arena is None:
+            return self._tree_node(**kwargs)
+        return self.arena.add(**kwargs)
+
+    def _tree_node(self, **kwargs):
+        '''
+        A new TreeNode, made by the CompilationContext if there is one.
+        '''
+        if self.context is None:
+            return TreeNode(**kwargs)
+        return self.context.tree_node(**kwargs)
+
+    def parse(self, build_pt=True, arena=None):
         '''
         Top-level method to start the parsing process, assuming
         the Parser has been initialized with an appropriate list of
         tokens associated with a program consisting of a sequence
-        of statements.
+        of statements. With build_pt=False only the AST is built,
+        and the returned parse tree is an empty Tree; the parse tree
+        can be rebuilt later from the same tokens with
+        build_parse_tree(). Given an AstArena, the AST is built into
+        the arena and its nodes are AstNode views (see trees.py).
         '''
 
+        self.build_pt = build_pt
+        self.arena = arena
         pt_stmts, ast_stmts = self.statement_seq()
-        self.program_pt = TreeNode(
+        self.program_pt = self._pt_node(
                 type=PROG, value=pt_type_to_value[PROG],
                 children=[pt_stmts]
         )
         self.program_ast = ast_stmts
 
-        if self.current_token_index < len(self.tokens) - 1:
+        if self._has(self.current_token_index + 1):
             # parsing ended prematurely, possibly due to an
             # unexpected token or a missing sequencing token ';'
             _last_token = self.tokens[self.current_token_index]
             _value = _last_token.value
-            _line = _last_token.line
+            _line = self._line(_last_token)
             raise SyntaxError(
                     "Parsing ended prematurely, possibly due to an "
                     "unexpected token or missing seq token ';'. "
@@ -212,73 +370,125 @@ class Parser:
         an effectively 'empty sequence' must consist of one or more
         'skip' statements (this is also how the general if-then-else
         structure is used to produce just the if-then component).
+        A sequence s1; s2; s3 is returned right-nested, as
+        seq(s1, seq(s2, s3)).
         '''
-        pt_statement_block = TreeNode(
-                type=SEQ, value=pt_type_to_value[SEQ]
-        )
-        ast_statement_block = TreeNode(
-                type=SEQ, value=ast_type_to_value[SEQ]
-        )
-
-        # Check for empty program
-        if not self.tokens:
-            raise SyntaxError("Empty program is not allowed. "
-                              "Use 'skip' for an empty program.")
-
-        # Begin with the very first statement.
-        # Process the first statement in the sequence.
-        pt_stmt, ast_stmt = self.statement()
-        if pt_stmt:
-            pt_statement_block.children.append(pt_stmt)
-            ast_statement_block.children.append(ast_stmt)
-        else:
-            _last_token = self.tokens[self.current_token_index]
-            _value = _last_token.value
-            _line = _last_token.line
-            raise SyntaxError(
-                    "Parser.statement() method encountered a problematic "
-                    f"statement on line {_line}. Last token processed "
-                    f"was '{_value}' on line {_line}.")
+        return self._statements(single=False)
 
-        if self.peek(SEQ):
-
-            # Process subsequent statement(s) if we see seq op ';'
-            while self.peek(SEQ):
-                self.consume(SEQ)
-                pt_stmt, ast_stmt = self.statement_seq()
-                if pt_stmt:
-                    pt_statement_block.children.append(pt_stmt)
-                    ast_statement_block.children.append(ast_stmt)
+    def statement(self):
+        '''
+        Parsing of a single statement, which might be an if-then-else
+        or a while-do statement with nested blocks of statements.
+        '''
+        return self._statements(single=True)
+
+    def _statements(self, single):
+        '''
+        The statement-level parsing behind statement_seq() and
+        statement(). Rather than recursing for every ';' and for every
+        nested block, the if and while statements whose blocks are
+        still being parsed are kept on an explicit stack, so neither
+        the length of a program nor the depth of its nesting is limited
+        by Python's recursion limit. The statements parsed so far in
+        the innermost open block are kept in the list 'entries', and
+        are only linked into a right-nested sequence once the block
+        ends (see _close_block()).
+        '''
+        # each stack item is (compound, entries, pt_seq, ast_seq), where
+        # compound is the open if/while statement (see begin_if_stmt()),
+        # entries are the statements before it in the enclosing block,
+        # and pt_seq, ast_seq are the SEQ nodes made for it there
+        stack = []
+        entries = []
+        while True:
+            # The SEQ nodes to hold this statement and any that follow
+            # it in the block (unused if it is the block's last one).
+            # (An arena has no use for nodes that end up unused, so its
+            # SEQ nodes are only made in _close_block().)
+            pt_seq = self._pt_node(type=SEQ, value=pt_type_to_value[SEQ])
+            ast_seq = None
+            if self.arena is None:
+                ast_seq = self._tree_node(type=SEQ,
+                                          value=ast_type_to_value[SEQ])
+
+            # Check for empty program
+            if self.current_token_index == 0 and self.current_token is None:
+                raise SyntaxError("Empty program is not allowed. "
+                                  "Use 'skip' for an empty program.")
+
+            # Open an if or while statement and go on to parse the first
+            # statement of its block, or parse a simple statement.
+            if self.peek(IF):
+                stack.append((self.begin_if_stmt(), entries,
+                              pt_seq, ast_seq))
+                entries = []
+                continue
+            if self.peek(WHILE):
+                stack.append((self.begin_while_stmt(), entries,
+                              pt_seq, ast_seq))
+                entries = []
+                continue
+            pt_stmt, ast_stmt = self._simple_statement()
+
+            # Close as many blocks and compound statements as end here.
+            while True:
+                entries.append((pt_seq, ast_seq, pt_stmt, ast_stmt))
+                if single and not stack:
+                    return (pt_stmt, ast_stmt)
+                if self.peek(SEQ):
+                    # Process subsequent statement(s) if we see seq op ';'
+                    self.consume(SEQ)
+                    break
+                pt_block, ast_block = self._close_block(entries)
+                if not stack:
+                    return (pt_block, ast_block)
+                compound, entries, pt_seq, ast_seq = stack.pop()
+                compound.append((pt_block, ast_block))
+                if compound[0] == IF and len(compound) == 5:
+                    # the THEN block is done, so go on to the ELSE block
+                    self.end_then_block(compound)
+                    stack.append((compound, entries, pt_seq, ast_seq))
+                    entries = []
+                    break
+                if compound[0] == IF:
+                    pt_stmt, ast_stmt = self.finish_if_stmt(compound)
                 else:
-                    _last_token = self.tokens[self.current_token_index]
-                    _value = _last_token.value
-                    _line = _last_token.line
-                    raise SyntaxError(
-                        "Parser.statement() discovered a missing or "
-                        f"problematic statement on line {_line}. "
-                        "Last token processed "
-                        f"was '{_value}' on line {_line}."
-                    )
-        else:
-
-            # The supposed sequence actually consisted of just a
-            # single statement, so treat it as a statement instead
-            # of a sequence
-            pt_statement_block = pt_statement_block.children[0]
-            ast_statement_block = ast_statement_block.children[0]
+                    pt_stmt, ast_stmt = self.finish_while_stmt(compound)
+                pt_stmt = self._pt_node(
+                        type=STMT, value=pt_type_to_value[STMT],
+                        children=[pt_stmt]
+                )
 
-        return (pt_statement_block, ast_statement_block)
+    def _close_block(self, entries):
+        '''
+        Link the (pt_seq, ast_seq, pt_stmt, ast_stmt) entries of a
+        finished block into the right-nested sequence
+        seq(s1, seq(s2, ... seq(s_n-1, s_n))), or just s1 if the
+        supposed sequence actually consisted of a single statement.
+        '''
+        _, _, pt_block, ast_block = entries[-1]
+        for pt_seq, ast_seq, pt_stmt, ast_stmt in reversed(entries[:-1]):
+            if self.build_pt:
+                pt_seq.children.extend([pt_stmt, pt_block])
+                pt_block = pt_seq
+            if ast_seq is None:
+                ast_seq = self._ast_node(type=SEQ,
+                                         value=ast_type_to_value[SEQ])
+            ast_seq.children = [ast_stmt, ast_block]
+            ast_block = ast_seq
+        return (pt_block, ast_block)
 
-    def statement(self):
+    def _simple_statement(self):
         '''
-        Pursue different parsing method(s) based on current statement.
+        Parsing of a statement that contains no block of statements,
+        i.e. an assignment or a skip statement.
         '''
         if self.current_token is None:
             # possibly consumed all code while expecting more
             # e.g. when a seq of commands incorrectly ends with ';'
             _prev_token = self.tokens[self.current_token_index-1]
             _value = _prev_token.value
-            _line  = _prev_token.line
+            _line  = self._line(_prev_token)
             raise SyntaxError(
                 "Token expected but None found. "
                 " Last token successfully processed "
@@ -287,40 +497,24 @@ class Parser:
             )
 
         # assignment (e.g., x := 3 + 2 * y)
-        if self.current_token.type == VAR and self.peek_ahead(ASSIGN):
+        if self.peek(VAR) and self.peek_ahead(ASSIGN):
             pt_result, ast_result = self.parse_assignment_stmt()
-            pt_result = TreeNode(
-                    type=STMT, value=pt_type_to_value[STMT],
-                    children=[pt_result]
-            )
-            return (pt_result, ast_result)
-
         # skip (e.g., if x > 0 then x := x + 1 else skip)
-        if self.peek(SKIP):
+        elif self.peek(SKIP):
             pt_result, ast_result = self.parse_skip_stmt()
-            pt_result = TreeNode(
-                    type=STMT, value=pt_type_to_value[STMT],
-                    children=[pt_result]
-            )
-            return (pt_result, ast_result)
-
-        # if-then-else (if x < y then x := 0 else y := 0)
-        if self.current_token.type == IF:
-            pt_result, ast_result = self.parse_if_stmt()
-            pt_result = TreeNode(
-                    type=STMT, value=pt_type_to_value[STMT],
-                    children=[pt_result]
-            )
-            return (pt_result, ast_result)
-
-        # while-do (while x < 10 do x := x + 1)
-        if self.peek(WHILE):
-            pt_result, ast_result = self.parse_while_stmt()
-            pt_result = TreeNode(
-                    type=STMT, value=pt_type_to_value[STMT],
-                    children=[pt_result]
-            )
-            return (pt_result, ast_result)
+        else:
+            _last_token = self.current_token
+            _value = _last_token.value
+            _line = self._line(_last_token)
+            raise SyntaxError(
+                    "Parser.statement() method encountered a problematic "
+                    f"statement on line {_line}. Last token processed "
+                    f"was '{_value}' on line {_line}.")
+        pt_result = self._pt_node(
+                type=STMT, value=pt_type_to_value[STMT],
+                children=[pt_result]
+        )
+        return (pt_result, ast_result)
 
     def parse_assignment_stmt(self):
         '''
@@ -331,11 +525,11 @@ class Parser:
         pt_left, ast_left = self.expr()
         token = self.consume(ASSIGN)
         pt_right, ast_right = self.expr()
-        pt_result = TreeNode(
+        pt_result = self._pt_node(
                 type=ASSIGN, value=pt_type_to_value[ASSIGN],
                 children = [pt_left, pt_right]
         )
-        ast_result = TreeNode(
+        ast_result = self._ast_node(
                 type=ASSIGN, value=ast_type_to_value[ASSIGN],
                 index = token.index,
                 children = [ast_left, ast_right]
@@ -358,15 +552,15 @@ class Parser:
         '''
         token = self.consume(SKIP)   # discard 'skip' token
 
-        pt_result = TreeNode(
+        pt_result = self._pt_node(
                 type=SKIP, value=pt_type_to_value[SKIP]
         )
-        ast_result = TreeNode(
+        ast_result = self._ast_node(
                 type=SKIP, value=ast_type_to_value[SKIP], index=token.index
         )
         return (pt_result, ast_result)
 
-    def parse_if_stmt(self):
+    def begin_if_stmt(self):
         '''
         Parsing of if-then-else statements like this:
             if x > 0 then
@@ -378,23 +572,31 @@ class Parser:
         where the 'else' block could be a simple 'skip' command.
         Method assumes caller has already verified that the statement
         to be parsed is indeed an if-then-else statement.
+        This parses the statement up to its THEN block, and returns
+        the list [IF, if_token, pt_condition, ast_condition] to which
+        the caller appends the parsed blocks, calling end_then_block()
+        after the THEN block and finish_if_stmt() after the ELSE block.
         '''
-
         if_token = self.consume(IF)                   # discard 'if'
         # recursively parse boolean condition
         pt_condition, ast_condition = self.bool_expr()
         self.consume(THEN)                 # discard 'then'
+        return [IF, if_token, pt_condition, ast_condition]
 
-        # recursively parse the true block stmts
-        pt_true_block, ast_true_block = self.statement_seq()
+    def end_then_block(self, compound):
+        '''
+        Check the THEN block of an if-then-else statement and move on
+        to its ELSE block.
+        '''
+        pt_true_block, ast_true_block = compound[4]
 
         # raise an error if true_block is empty
-        if (len(pt_true_block.children) == 0):
+        if pt_true_block is not None and len(pt_true_block.children) == 0:
             # empty block of statements, but that's not allowed
             _last_token = self.tokens[self.current_token_index]
             _value = _last_token.value
-            _line = _last_token.line
-            _col  = _last_token.column
+            _line = self._line(_last_token)
+            _col  = self._column(_last_token)
             raise SyntaxError(
                     "Parsing ended prematurely, possibly due to an "
                     "empty THEN block in an IF statement. "
@@ -405,16 +607,22 @@ class Parser:
 
         self.consume(ELSE)                 # discard 'else'
 
-        # recursively parse the else block stmts
-        pt_else_block, ast_else_block = self.statement_seq()
+    def finish_if_stmt(self, compound):
+        '''
+        Check the ELSE block of an if-then-else statement and return
+        the statement's PT and AST.
+        '''
+        (_, if_token, pt_condition, ast_condition,
+            (pt_true_block, ast_true_block),
+            (pt_else_block, ast_else_block)) = compound
 
         # raise an error if else_block is empty
-        if (len(pt_else_block.children) == 0):
+        if pt_else_block is not None and len(pt_else_block.children) == 0:
             # empty block of statements, but that's not allowed
             _last_token = self.tokens[self.current_token_index]
             _value = _last_token.value
-            _line = _last_token.line
-            _col  = _last_token.column
+            _line = self._line(_last_token)
+            _col  = self._column(_last_token)
             raise SyntaxError(
                     "Parsing ended prematurely, possibly due to an "
                     "empty ELSE block in an IF statement. "
@@ -427,25 +635,25 @@ class Parser:
 
         # Should not get this far if user tried to leave an empty
         # block for the THEN block or ELSE block in an IF stmt.
-        pt_result = TreeNode(
+        pt_result = self._pt_node(
                 type=IF, value=pt_type_to_value[IF],
                 children=[
                         pt_condition,
-                        TreeNode(type=THEN, value=pt_type_to_value[THEN]),
+                        self._pt_node(type=THEN, value=pt_type_to_value[THEN]),
                         pt_true_block,
-                        TreeNode(type=ELSE, value=pt_type_to_value[ELSE]),
+                        self._pt_node(type=ELSE, value=pt_type_to_value[ELSE]),
                         pt_else_block,
-                        TreeNode(type=FI, value=pt_type_to_value[FI])
+                        self._pt_node(type=FI, value=pt_type_to_value[FI])
                 ]
         )
-        ast_result = TreeNode(
+        ast_result = self._ast_node(
                     type=IF, value=ast_type_to_value[IF],
                     index=if_token.index,
                     children=[ast_condition, ast_true_block, ast_else_block]
         )
         return (pt_result, ast_result)
 
-    def parse_while_stmt(self):
+    def begin_while_stmt(self):
         '''
         Parsing of while loops like this:
             while x > 0 do
@@ -454,22 +662,32 @@ class Parser:
             od
         Method assumes caller has already verified that the
         statement to be parsed is indeed a while-do statement.
+        Like begin_if_stmt(), this parses the statement up to its DO
+        block and returns [WHILE, while_token, pt_condition,
+        ast_condition], to be completed by finish_while_stmt().
         '''
 
         while_token = self.consume(WHILE)            # discard 'while'
         # Recursively parse boolean condition
         pt_condition, ast_condition = self.bool_expr()
         self.consume(DO)               # discard 'do'
+        return [WHILE, while_token, pt_condition, ast_condition]
 
-        # Recursively parse and return the while block of stmts
-        pt_while_block, ast_while_block = self.statement_seq()
+    def finish_while_stmt(self, compound):
+        '''
+        Check the DO block of a while-do statement and return the
+        statement's PT and AST.
+        '''
+        (_, while_token, pt_condition, ast_condition,
+            (pt_while_block, ast_while_block)) = compound
 
         # raise an error if while_block is empty
-        if (len(pt_while_block.children) == 0):
+        if (pt_while_block is not None
+                and len(pt_while_block.children) == 0):
             # empty block of statements, but that's not allowed
             _last_token = self.tokens[self.current_token_index]
             _value = _last_token.value
-            _line = _last_token.line
+            _line = self._line(_last_token)
             raise SyntaxError(
                     "Parsing ended prematurely, possibly due to an "
                     "empty DO block in an WHILE statement. "
@@ -480,16 +698,16 @@ class Parser:
 
         # Should not get this far if user tried to leave an empty
         # block for the DO block in the WHILE stmt.
-        pt_result = TreeNode(
+        pt_result = self._pt_node(
                 type=WHILE, value=pt_type_to_value[WHILE],
                 children=[
                         pt_condition,
-                        TreeNode(type=DO, value=pt_type_to_value[DO]),
+                        self._pt_node(type=DO, value=pt_type_to_value[DO]),
                         pt_while_block,
-                        TreeNode(type=OD, value=pt_type_to_value[OD])
+                        self._pt_node(type=OD, value=pt_type_to_value[OD])
                 ]
         )
-        ast_result = TreeNode(
+        ast_result = self._ast_node(
                 type=WHILE, value=ast_type_to_value[WHILE],
                 index=while_token.index,
                 children=[ast_condition, ast_while_block]
@@ -501,6 +719,8 @@ class Parser:
         Handles either an arithmetic expression (e.g. x + 2 * y)
         or a boolean expression (e.g. x >= y).
         '''
+        if self.current_token is None:
+            raise SyntaxError("Unexpected end of input.")
         # distinguish boolean vs arithmetic expressions
         if (self.current_token.type in [LBRAC, NOT, AND, OR]):
             pt_result, ast_result = self.bool_expr()
@@ -509,94 +729,103 @@ class Parser:
         return (pt_result, ast_result)
 
     # ====================================== #
-    # arithmetic expressions and components  #
-    # SEE: arith_expr, term, factor          #
+    # arithmetic and boolean expressions     #
+    # SEE: _climb, factor, bool_factor       #
     # ====================================== #
 
-    def arith_expr(self):
+    def _climb(self, operators, levels, primary):
+        '''
+        A table-driven precedence-climbing (operator precedence)
+        parser for a chain of primaries joined by binary operators,
+        such as x + 2 * y - z or [b1] and [b2] or [b3], where the
+        operators and levels tables (see arith_operators) give each
+        operator's precedence and the primary() method parses one
+        operand. All operators are left-associative.
+        The operands and the operators waiting for their right operand
+        are kept on two stacks in a single loop, so a chain of any
+        length uses no recursion. An operator is applied (reduced) as
+        soon as an operator with the same or lower level follows it.
+        The PT matches that of the usual grammar, e.g.
+            arith_expr -> arith_expr + arith_term | arith_term
+            arith_term -> arith_term * factor | factor
+        with an ARITHEXPR or ARITHTERM node over each operator node and
+        over each operand that skips a level.
+        '''
+        top = len(levels) + 1          # the level of a primary
+        pt_result, ast_result = primary()
+        operator = self._operator(operators)
+        if operator is None:
+            # a lone primary (the most common case) needs no stacks
+            return (self._wrap(pt_result, top, 1, levels), ast_result)
+        operands = [(pt_result, ast_result, top)]
+        pending = []
+        while operator is not None:
+            level, op_type, token_type = operator
+            while pending and pending[-1][0] >= level:
+                self._reduce(operands, pending, levels)
+            pending.append((level, op_type, self.consume(token_type)))
+            pt_result, ast_result = primary()
+            operands.append((pt_result, ast_result, top))
+            operator = self._operator(operators)
+        while pending:
+            self._reduce(operands, pending, levels)
+        pt_result, ast_result, level = operands[0]
+        return (self._wrap(pt_result, level, 1, levels), ast_result)
+
+    def _operator(self, operators):
+        '''
+        The entry of operators for the current token, or None if it is
+        not one of those operators (or there are no tokens left).
         '''
-        For a sum or difference expression such as x + 2 * y (which
-        then consists of arithmetic terms and factors).
-        '''
-        pt_result, ast_result = self.term()
-
-        if self.current_token:
-            if (self.current_token.value in ['+', '-']):
-                op_token = self.current_token
-                if op_token.value == '+':
-                    op_a_token = self.consume(OP_A)
-                    pt_right, ast_right = self.term()
-                    pt_result = TreeNode(
-                            type=ARITHEXPR, value=pt_type_to_value[ARITHEXPR],
-                            children=[
-                                TreeNode(
-                                type=ADD, value=pt_type_to_value[ADD],
-                                children=[pt_result, pt_right]
-                                )
-                            ]
-                    )
-                    ast_result = TreeNode(
-                            type=ADD, value=ast_type_to_value[ADD],
-                            index=op_a_token.index,
-                            children=[ast_result, ast_right]
-                    )
-                else:
-                    # subtraction expression
-                    op_a_token = self.consume(OP_A)
-                    pt_right, ast_right = self.term()
-                    pt_result = TreeNode(
-                            type=ARITHEXPR, value=pt_type_to_value[ARITHEXPR],
-                            children=[
-                                TreeNode(
-                                type=SUB, value=pt_type_to_value[SUB],
-                                children=[pt_result, pt_right]
-                                )
-                            ]
-                    )
-                    ast_result = TreeNode(
-                            type=SUB, value=ast_type_to_value[SUB],
-                            index=op_a_token.index,
-                            children=[ast_result, ast_right]
-                    )
-            else:
-                pt_result = TreeNode(
-                        type=ARITHEXPR, value=pt_type_to_value[ARITHEXPR],
-                        children=[pt_result]
-                )
-                ast_result = ast_result
+        token = self.current_token
+        return None if token is None else operators.get(token.value)
 
-        return (pt_result, ast_result)
+    def _reduce(self, operands, pending, levels):
+        '''
+        Apply the most recent pending operator to the top two operands
+        for _climb(), replacing them with a (pt, ast, level) operand.
+        '''
+        level, op_type, op_token = pending.pop()
+        pt_right, ast_right, right_level = operands.pop()
+        pt_left, ast_left, left_level = operands.pop()
+        pt_result = self._pt_node(
+                type=levels[level], value=pt_type_to_value[levels[level]],
+                children=[self._pt_node(
+                        type=op_type, value=pt_type_to_value[op_type],
+                        children=[
+                            self._wrap(pt_left, left_level, level + 1,
+                                       levels),
+                            self._wrap(pt_right, right_level, level + 1,
+                                       levels)
+                        ]
+                )]
+        )
+        ast_result = self._ast_node(
+                type=op_type, value=ast_type_to_value[op_type],
+                index=op_token.index,
+                children=[ast_left, ast_right]
+        )
+        operands.append((pt_result, ast_result, level))
 
-    def term(self):
-        '''
-        For a participant (term) in a sum or difference expression.
-        For example, in the expression 'x + 2 * y,'
-        the 'x' and the '2 * y' are both terms.
-        '''
-        pt_result, ast_result = self.factor()
-        if self.current_token:
-            if (self.current_token.value == '*'):
-                op_token = self.consume(OP_A)
-                pt_right, ast_right = self.factor()
-                pt_result = TreeNode(
-                        type=ARITHTERM, value=pt_type_to_value[ARITHTERM],
-                        children=[TreeNode(
-                                  type=MULT, value=pt_type_to_value[MULT],
-                                  children=[pt_result, pt_right]
-                        )]
-                )
-                ast_result = TreeNode(
-                        type=MULT, value=ast_type_to_value[MULT],
-                        index=op_token.index,
-                        children=[ast_result, ast_right]
-                )
-            else:
-                pt_result = TreeNode(
-                        type=ARITHTERM, value=pt_type_to_value[ARITHTERM],
-                        children=[pt_result]
-                )
-                ast_result = ast_result
-        return (pt_result, ast_result)
+    def _wrap(self, pt_node, level, target, levels):
+        '''
+        Wrap the PT of an expression at the given level in the PT nodes
+        of each lower level down to the target level.
+        '''
+        while level > target:
+            level -= 1
+            pt_node = self._pt_node(
+                    type=levels[level], value=pt_type_to_value[levels[level]],
+                    children=[pt_node]
+            )
+        return pt_node
+
+    def arith_expr(self):
+        '''
+        For an arithmetic expression such as x + 2 * y - z, which then
+        consists of arithmetic terms and factors.
+        '''
+        return self._climb(arith_operators, arith_levels, self.factor)
 
     def factor(self):
         '''
@@ -605,27 +834,30 @@ class Parser:
         '''
         if self.peek(INT):
             token = self.consume(INT)
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                     type=ARITHFACT, value=pt_type_to_value[ARITHFACT],
-                    children=[TreeNode(type=INT, value=pt_type_to_value[INT],
+                    children=[self._pt_node(
+                              type=INT, value=pt_type_to_value[INT],
                               children=[
-                                  TreeNode(type=INT, value=int(token.value))
+                                  self._pt_node(type=INT,
+                                                value=int(token.value))
                               ])]
             )
-            ast_result = TreeNode(
+            ast_result = self._ast_node(
                     type=INT, value=int(token.value), index=token.index
             )
             return (pt_result, ast_result)
         elif self.peek(VAR):
             token = self.consume(VAR)
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                     type=ARITHFACT, value=pt_type_to_value[ARITHFACT],
-                    children=[TreeNode(type=VAR, value=pt_type_to_value[VAR],
+                    children=[self._pt_node(
+                              type=VAR, value=pt_type_to_value[VAR],
                               children=[
-                                  TreeNode(type=VAR, value=token.value)
+                                  self._pt_node(type=VAR, value=token.value)
                               ])]
             )
-            ast_result = TreeNode(
+            ast_result = self._ast_node(
                     type=VAR, value=token.value, index=token.index
             )
             return (pt_result, ast_result)
@@ -634,100 +866,43 @@ class Parser:
             # recursively parse and return inner expr
             pt_result, ast_result = self.expr()
             self.consume(RPAR)    # consume and discard ')'
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                     type=ARITHFACT, value=pt_type_to_value[ARITHFACT],
                     children=[
-                            TreeNode(type=LPAR, value=pt_type_to_value[LPAR]),
+                            self._pt_node(type=LPAR,
+                                          value=pt_type_to_value[LPAR]),
                             pt_result,
-                            TreeNode(type=RPAR, value=pt_type_to_value[RPAR])
+                            self._pt_node(type=RPAR,
+                                          value=pt_type_to_value[RPAR])
                     ]
             )
             return (pt_result, ast_result)
+        elif self.current_token is None:
+            raise SyntaxError("Unexpected end of input.")
         else:
             _value = self.current_token.value
-            _line  = self.current_token.line
+            _line  = self._line(self.current_token)
             raise SyntaxError(
                     "In Parser.factor(), encountered unexpected token "
                     f"'{_value}' on line {_line}.")
 
-    # ====================================== #
-    # boolean expressions and components     #
-    # SEE: bool_expr, bool_term, bool_factor #
-    # ====================================== #
-
     def bool_expr(self):
         '''
-        Primarily for a boolean OR, which has the lowest precedence
-        in the precedence order [] > NOT > AND > OR.
+        For a boolean expression, with the precedence order
+        [] > NOT > AND > OR.
         b1 OR b2 is analogous to arithmetic expression;
         b1 AND b2 is analogous to arithmetic term;
         NOT[b], [b] are analogous to arithmetic factor.
         '''
-        pt_result, ast_result = self.bool_term()
-        if (self.current_token):
-            if (self.current_token.value == OR):
-                or_token = self.consume(OR)
-                pt_right, ast_right = self.bool_term()
-                pt_result = TreeNode(
-                        type=BOOLEXPR, value=pt_type_to_value[BOOLEXPR],
-                        children=[
-                                TreeNode(
-                                        type=OR, value=pt_type_to_value[OR],
-                                        children=[pt_result, pt_right]
-                                )
-                        ]
-                )
-                ast_result = TreeNode(
-                        type=OR, value=ast_type_to_value[OR],
-                        index=or_token.index,
-                        children=[ast_result, ast_right]
-                )
-            else:
-                pt_result = TreeNode(
-                        type=BOOLEXPR, value=pt_type_to_value[BOOLEXPR],
-                        children=[pt_result]
-                )
-                ast_result = ast_result
-        return (pt_result, ast_result)
-
-    def bool_term(self):
-        '''
-        For a boolean AND, whose components then might themselves be
-        bool_expr, bool_term, or bool_factor.
-        '''
-        pt_result, ast_result = self.bool_factor()
-        if self.current_token:
-            if self.peek(AND):
-                and_token = self.consume(AND)
-                pt_right, ast_right = self.bool_factor()
-                pt_result = TreeNode(
-                        type=BOOLTERM, value=pt_type_to_value[BOOLTERM],
-                        children=[
-                            TreeNode(
-                                    type=AND, value=pt_type_to_value[AND],
-                                    children=[pt_result, pt_right]
-                            )
-                        ]
-                )
-                ast_result = TreeNode(
-                        type=AND, value=ast_type_to_value[AND],
-                        index=and_token.index,
-                        children=[ast_result, ast_right])
-            else:
-                pt_result = TreeNode(
-                        type=BOOLTERM, value=pt_type_to_value[BOOLTERM],
-                        children=[pt_result]
-                )
-                ast_result = ast_result
-        return (pt_result, ast_result)
+        return self._climb(bool_operators, bool_levels, self.bool_factor)
 
     def bool_factor(self):
         '''
         For parsing a boolean of the form [b] (i.e. a boolean in
-        square brackets) or a NOT[b]. Such a factor might be an
-        element of a bool_term (an AND) or a bool_expr (an OR), and
-        the b itself might then be a bool_expr, bool_term, or
-        bool_factor.
+        square brackets) or a NOT[b], a boolean constant, or a
+        relational expression such as x < y. Such a factor might be an
+        operand of an AND or an OR, and the b itself might then be any
+        boolean expression.
         '''
         if self.peek(NOT):
             not_token = self.consume(NOT)
@@ -735,18 +910,19 @@ class Parser:
             # recursively parse and return inner expr
             pt_result, ast_result = self.bool_expr()
             self.consume(RBRAC)        # discard ]
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                     type=BOOLFACT, value=pt_type_to_value[BOOLFACT],
-                    children=[TreeNode(type=NOT, value=pt_type_to_value[NOT],
+                    children=[self._pt_node(
+                              type=NOT, value=pt_type_to_value[NOT],
                               children=[
-                                  TreeNode(type=LBRAC,
-                                           value=pt_type_to_value[LBRAC]),
+                                  self._pt_node(type=LBRAC,
+                                                value=pt_type_to_value[LBRAC]),
                                   pt_result,
-                                  TreeNode(type=RBRAC,
-                                           value=pt_type_to_value[RBRAC])
+                                  self._pt_node(type=RBRAC,
+                                                value=pt_type_to_value[RBRAC])
                               ])]
             )
-            ast_result = TreeNode(
+            ast_result = self._ast_node(
                     type=NOT, value=ast_type_to_value[NOT],
                     index=not_token.index,
                     children = [ast_result]
@@ -757,32 +933,32 @@ class Parser:
             # recursively parse and return inner expr
             pt_result, ast_result = self.bool_expr()
             self.consume(RBRAC)        # discard ]
-            pt_result = TreeNode(type=BOOLFACT,
-                                 value=pt_type_to_value[BOOLFACT],
+            pt_result = self._pt_node(type=BOOLFACT,
+                                      value=pt_type_to_value[BOOLFACT],
                           children=[
-                              TreeNode(type=LBRAC,
-                                       value=pt_type_to_value[LBRAC]),
+                              self._pt_node(type=LBRAC,
+                                            value=pt_type_to_value[LBRAC]),
                               pt_result,
-                              TreeNode(type=RBRAC,
-                                       value=pt_type_to_value[RBRAC])
+                              self._pt_node(type=RBRAC,
+                                            value=pt_type_to_value[RBRAC])
                           ])
             return (pt_result, ast_result)
         elif self.peek(TRUE):
             true_token = self.consume(TRUE)
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                     type=TRUE, value=pt_type_to_value[TRUE]
             )
-            ast_result = TreeNode(
+            ast_result = self._ast_node(
                     type=TRUE, value=ast_type_to_value[TRUE],
                     index=true_token.index
             )
             return (pt_result, ast_result)
         elif self.peek(FALSE):
             false_token = self.consume(FALSE)
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                     type=FALSE, value=pt_type_to_value[FALSE]
             )
-            ast_result = TreeNode(
+            ast_result = self._ast_node(
                     type=FALSE, value=ast_type_to_value[FALSE],
                     index=false_token.index
             )
@@ -790,16 +966,28 @@ class Parser:
         else:
             # we must have a relational expression such as x < y
             pt_left, ast_left = self.arith_expr()
-            op = self.consume(OP_R).value
+            op_token = self.consume(OP_R)
+            op = op_token.value
             pt_right, ast_right = self.arith_expr()
 
-            pt_result = TreeNode(
+            pt_result = self._pt_node(
                    type=BOOLFACT, value=pt_type_to_value[BOOLFACT],
-                   children=[TreeNode(type=op, value=pt_type_to_value[op],
-                                      children=[pt_left, pt_right])]
+                   children=[self._pt_node(type=op,
+                                           value=pt_type_to_value[op],
+                                           children=[pt_left, pt_right])]
             )
-            ast_result = TreeNode(
+            ast_result = self._ast_node(
                     type=op, value=ast_type_to_value[op],
-                    index=op.index,
+                    index=op_token.index,
                     children=[ast_left, ast_right])
             return (pt_result, ast_result)
+
+def build_parse_tree(tokens, line_index=None, context=None):
+    '''
+    Rebuild the parse tree (PT) for a program that was parsed with
+    Parser.parse(build_pt=False), by parsing its tokens again (as a
+    list, TokenBuffer, or a fresh Tokenize generator). The PT keeps
+    the parentheses, brackets, and keywords that the AST drops, so
+    it cannot be recovered from the AST alone.
+    '''
+    return Parser(tokens, line_index, context).parse()[0]
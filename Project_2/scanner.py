@@ -1,4 +1,9 @@
 from typing import NamedTuple
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import os
 import re
 
 # Much of the scanner/tokenization code was adapted from the
@@ -7,63 +12,410 @@ import re
 
 class Token(NamedTuple):
     '''
-    Token(type, value, line, column) represents a token generated in
+    Token(type, value, start, index) represents a token generated in
     in the process of scanning the text of a program file, specifying
     the type (such as an operation, parenthesis, etc), its value (for
     example, the actual string or integer value), and its location
-    (line and column number). 
+    as offsets into the text (start is the offset of its first
+    character and index is the offset just past its last character).
+    Line and column numbers are not stored; when they are needed
+    (e.g. for an error message) use a LineIndex to resolve an offset.
     '''
     type: str
     value: str
-    line: int
-    column: int
+    start: int
     index: int
 
-def Tokenize(code):
+class LineIndex:
+    '''
+    LineIndex(code) records the offset at which each line of the code
+    text starts, so that an offset into the text can be converted to a
+    (line, column) location on demand by bisection, instead of keeping
+    track of line numbers for every token while scanning. Lines are
+    numbered from 1 and columns from 0.
+    '''
+
+    def __init__(self, code):
+        self.line_starts = array('q', [0])
+        self.line_starts.extend(
+                mo.end() for mo in re.finditer('\n', code))
+
+    def line(self, offset):
+        '''
+        The line number containing the given offset.
+        '''
+        return bisect_right(self.line_starts, offset)
+
+    def position(self, offset):
+        '''
+        The (line, column) location of the given offset.
+        '''
+        line = bisect_right(self.line_starts, offset)
+        return (line, offset - self.line_starts[line - 1])
+
+# Reserved Keywords
+keywords = {"true", "false", "not", "skip", "if", "then", "else",
+            "fi", "while", "do", "od", "and", "or"}
+# Regular Expressions identifying Tokens in our Language
+token_specification = [
+    ("ignore",     r"--.*|\s+"),                      # ignore line comments and white space
+    ("comment",    r"\{-"),                           # start of a block comment (see skip_comment)
+    ("lpar",       r"\("),                            # Right parenthesis
+    ("rpar",       r"\)"),                            # Left parenthesis
+    ("lbrac",      r"\["),                            # Right bracket
+    ("rbrac",      r"\]"),                            # Left bracket
+    ("int",        r"0|([1-9])\d*"),                  # Integer
+    ("var",        r"[A-Za-z](\w|'|_)*"),             # Variables
+    ("assign",     r":="),                            # Assignment
+    ("seq",        r";"),                             # Command sequencing
+    ("op_a",       r'[+\-*]'),                        # Arithmetic operators
+    ("op_r",       r'<=|>=|=|<|>'),                   # Binary relational operators
+    ("mismatch",   r'.'),                             # Any other character
+]
+# create the 'master' regex once, rather than on every call:
+tok_regex = re.compile(
+        '|'.join('(?P<%s>%s)' % pair for pair in token_specification))
+
+# Small-int codes for every token type that can reach the parser,
+# used to store token types compactly in a TokenBuffer.
+token_kinds = ["lpar", "rpar", "lbrac", "rbrac", "int", "var", "assign",
+               "seq", "op_a", "op_r"] + sorted(keywords)
+kind_codes = {kind: code for code, kind in enumerate(token_kinds)}
+
+def Tokenize(code, engine='re', pos=0):
     '''
     tokenize(code) uses regular expressions to categorize elements
     of supplied code text and yield associated Tokens consisting of
     ordered tuples specifying the type, value, and location of the
     tokenized elements.
+    With engine='dfa', the scanning is done by the table-driven DFA
+    compiled from the same token_specification (see dfa_scanner.py)
+    instead of the 'master' regex; both yield identical Tokens.
+    Scanning starts at offset pos, which should be the start of a
+    token or of ignored text (such as the end of a previous token).
+    '''
+    if engine == 'dfa':
+        for kind, start, end in _dfa_lexemes(code, pos):
+            value = code[start:end]
+            if kind == 'int':
+                value = int(value)
+            yield Token(kind, value, start, end)
+        return
+    while pos is not None:
+        resume, pos = pos, None
+        for mo in tok_regex.finditer(code, resume):
+            kind = mo.lastgroup
+            if kind == 'ignore':
+                continue
+            elif kind == 'comment':
+                # skip the whole (possibly nested) block comment,
+                # then resume scanning just after it
+                pos = skip_comment(code, mo.start())
+                break
+            value = mo.group()
+            if kind == 'int':
+                value = int(value)
+            elif kind == 'var' and value in keywords:
+                kind = value
+            elif kind == 'mismatch':
+                _mismatch(code, mo.start())
+            yield Token(kind, value, mo.start(), mo.end())
+
+def skip_comment(code, start):
+    '''
+    Given the offset of a '{-' opening a block comment, return the
+    offset just past the '-}' that closes it. Block comments nest, so
+    {- a {- b -} c -} is a single comment. The delimiters are found
+    with str.find (each part of the comment is searched only once), so
+    skipping a comment takes time linear in its length, with no
+    per-character work in Python and no backtracking. An unclosed
+    comment raises the usual RuntimeError for its opening '{'.
+    '''
+    # the text may also be bytes (see _split_points)
+    open_, close = ('{-', '-}') if isinstance(code, str) else (b'{-', b'-}')
+    depth = 1
+    pos = start + 2
+    next_open = code.find(open_, pos)
+    next_close = code.find(close, pos)
+    while True:
+        if next_close < 0:
+            _mismatch(code, start)
+        if 0 <= next_open < next_close:
+            depth += 1
+            pos = next_open + 2
+        else:
+            depth -= 1
+            pos = next_close + 2
+            if depth == 0:
+                return pos
+        # only search again for a delimiter we have moved past
+        if 0 <= next_open < pos:
+            next_open = code.find(open_, pos)
+        if next_close < pos:
+            next_close = code.find(close, pos)
+
+def _dfa_lexemes(code, pos=0):
+    # imported here since dfa_scanner itself imports this module
+    from dfa_scanner import scanner_dfa
+    return scanner_dfa().lexemes(code, pos)
+
+def _mismatch(code, start):
+    '''
+    Raise the RuntimeError for the unexpected character at offset
+    start, working out its line number only now that it is needed.
+    '''
+    if not isinstance(code, str):
+        raise RuntimeError(f'unexpected character at byte {start}')
+    line_num = code.count('\n', 0, start) + 1
+    raise RuntimeError(f'{code[start]!r} unexpected on line {line_num}')
+
+class TokenBuffer:
+    '''
+    TokenBuffer(code, engine='re') scans the text of a program file
+    exactly as Tokenize(code, engine) does, but instead of creating one Token per lexeme
+    it stores the tokens in parallel typed columns:
+
+        kinds    array('i')  small-int code of the token type
+                             (see token_kinds and kind_codes)
+        starts   array('q')  offset of the first character of the token
+        ends     array('q')  offset just past the token (Token.index)
+        values   array('q')  value of an integer literal (0 otherwise)
+
+    String values (variable names, operators, keywords) are not stored
+    at all, since they are just slices of the original code. A Token
+    is only created when one is asked for, e.g. tokens[i] or by
+    iterating over the buffer, so a TokenBuffer can be handed to the
+    Parser in place of a list of Tokens. Line and column numbers come
+    from the buffer's line_index, which is only built if it is used.
     '''
-    # Reserved Keywords
-    keywords = {"true", "false", "not", "skip", "if", "then", "else",
-                "fi", "while", "do", "od", "and", "or"}
-    # Regular Expressions identifying Tokens in our Language
-    token_specification = [
-        ("ignore",     r"(--.*|\{-(.|\n|\r)*?-\})|\s+"),  # ignore comments and white space
-        ("lpar",       r"\("),                            # Right parenthesis
-        ("rpar",       r"\)"),                            # Left parenthesis
-        ("lbrac",      r"\["),                            # Right bracket
-        ("rbrac",      r"\]"),                            # Left bracket
-        ("int",        r"0|([1-9])\d*"),                  # Integer
-        ("var",        r"[A-Za-z](\w|'|_)*"),             # Variables
-        ("assign",     r":="),                            # Assignment
-        ("seq",        r";"),                             # Command sequencing
-        ("op_a",       r'[+\-*]'),                        # Arithmetic operators
-        ("op_r",       r'<=|>=|=|<|>'),                   # Binary relational operators
-        ("newline",    r'\n'),                            # Line endings
-        ("mismatch",   r'.'),                             # Any other character
-    ]
-    # create the 'master' regex:
-    tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
-    line_num = 1
-    line_start = 0
-    for mo in re.finditer(tok_regex, code):
-        kind = mo.lastgroup
-        value = mo.group()
-        column = mo.start() - line_start
-        index = mo.end()
+
+    def __init__(self, code, engine='re'):
+        self.code = code
+        self.kinds = array('i')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.values = array('q')
+        self._line_index = None
+        # integer literals too large for a 64-bit column,
+        # keyed by token position
+        self.big_ints = {}
+
+        # bind the column appends once, outside of the scanning loop
+        add_kind = self.kinds.append
+        add_start = self.starts.append
+        add_end = self.ends.append
+        add_value = self.values.append
+
+        if engine == 'dfa':
+            for kind, start, end in _dfa_lexemes(code):
+                value = 0
+                if kind == 'int':
+                    value = self._int_value(code[start:end])
+                add_kind(kind_codes[kind])
+                add_start(start)
+                add_end(end)
+                add_value(value)
+            return
+
+        pos = 0
+        while pos is not None:
+            resume, pos = pos, None
+            for mo in tok_regex.finditer(code, resume):
+                kind = mo.lastgroup
+                if kind == 'ignore':
+                    continue
+                elif kind == 'comment':
+                    pos = skip_comment(code, mo.start())
+                    break
+                elif kind == 'mismatch':
+                    _mismatch(code, mo.start())
+                start, end = mo.span()
+                value = 0
+                if kind == 'int':
+                    value = self._int_value(mo.group())
+                elif kind == 'var':
+                    text = mo.group()
+                    if text in keywords:
+                        kind = text
+                add_kind(kind_codes[kind])
+                add_start(start)
+                add_end(end)
+                add_value(value)
+
+    def _int_value(self, text):
+        '''
+        The value to store in the values column for an integer literal
+        (integers too large for the column are kept in big_ints).
+        '''
+        value = int(text)
+        if not -2**63 <= value < 2**63:
+            self.big_ints[len(self.kinds)] = value
+            value = 0
+        return value
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def line_index(self):
+        '''
+        The LineIndex of the scanned code, built on first use.
+        '''
+        if self._line_index is None:
+            self._line_index = LineIndex(self.code)
+        return self._line_index
+
+    def __getitem__(self, i):
+        '''
+        Return a Token view of the i-th token (negative positions count
+        from the end, as for a list).
+        '''
+        if i < 0:
+            i += len(self.kinds)
+        if not 0 <= i < len(self.kinds):
+            raise IndexError("TokenBuffer index out of range")
+        kind = token_kinds[self.kinds[i]]
         if kind == 'int':
-            value = int(value)
-        elif kind == 'var' and value in keywords:
-            kind = value
-        elif kind == 'newline':
-            line_start = mo.end()
-            line_num += 1
-            continue
-        elif kind == 'ignore':
-            continue
-        elif kind == 'mismatch':
-            raise RuntimeError(f'{value!r} unexpected on line {line_num}')
-        yield Token(kind, value, line_num, column, index)
+            value = self.big_ints.get(i, self.values[i])
+        else:
+            value = self.code[self.starts[i]:self.ends[i]]
+        return Token(kind, value, self.starts[i], self.ends[i])
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    @classmethod
+    def _from_columns(cls, code, kinds, starts, ends, values, big_ints):
+        '''
+        A TokenBuffer over code with the given (already scanned) columns.
+        '''
+        tokens = cls.__new__(cls)
+        tokens.code = code
+        tokens.kinds = kinds
+        tokens.starts = starts
+        tokens.ends = ends
+        tokens.values = values
+        tokens.big_ints = big_ints
+        tokens._line_index = None
+        return tokens
+
+# ================================== #
+#  Parallel tokenization of a file   #
+# ================================== #
+
+def TokenizeFile(filename, jobs=None, engine='re', chunk_size=2**20):
+    '''
+    TokenizeFile(filename, jobs) scans a (large) program file into a
+    TokenBuffer identical to TokenBuffer(code, engine) for the text of
+    the file, but does the scanning in a pool of jobs processes
+    (os.cpu_count() by default). The file is memory-mapped and split
+    into chunks of roughly chunk_size bytes at newlines that are not
+    inside a block comment (no token or comment other than a block
+    comment spans a newline), each worker maps and scans its own
+    chunk, and the chunks' token columns are then stitched back
+    together with their offsets shifted into place. If any chunk fails
+    to scan, the whole file is scanned again sequentially so that the
+    RuntimeError raised is exactly the sequential one.
+    '''
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # an empty file cannot be memory-mapped
+            return TokenBuffer("", engine)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            chunks = _split_points(data, chunk_size)
+            # decode the chunks here as well, both for the code text the
+            # buffer refers to and for the offset (in characters) of each
+            pieces = [_decode(data[start:end]) for start, end in chunks]
+
+    code = ''.join(pieces)
+    if jobs == 1 or len(chunks) == 1:
+        return TokenBuffer(code, engine)
+
+    char_bases = []
+    base = 0
+    for piece in pieces:
+        char_bases.append(base)
+        base += len(piece)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(
+                _tokenize_chunk,
+                [filename] * len(chunks), [start for start, _ in chunks],
+                [end for _, end in chunks], char_bases,
+                [engine] * len(chunks)))
+
+    if any(result is None for result in results):
+        return TokenBuffer(code, engine)
+
+    kinds, starts, ends = array('i'), array('q'), array('q')
+    values, big_ints = array('q'), {}
+    for chunk_kinds, chunk_starts, chunk_ends, chunk_values, chunk_big in results:
+        for i, value in chunk_big.items():
+            big_ints[len(kinds) + i] = value
+        kinds.extend(chunk_kinds)
+        starts.extend(chunk_starts)
+        ends.extend(chunk_ends)
+        values.extend(chunk_values)
+    return TokenBuffer._from_columns(code, kinds, starts, ends, values, big_ints)
+
+def _decode(data):
+    '''
+    Decode bytes of a program file the way open(filename, 'r') does
+    (UTF-8, with universal newlines).
+    '''
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def _split_points(data, chunk_size):
+    '''
+    Split the bytes of a program file into (start, end) chunks of
+    roughly chunk_size bytes, each ending just after a newline that is
+    not inside a block comment (a '--' line comment always ends at the
+    newline, so its newline is a safe place to split).
+    '''
+    comment_starts = re.compile(rb'\{-|--')
+    chunks = []
+    start = 0
+    # everything before pos is known to be outside of any comment
+    pos = 0
+    while True:
+        split = data.find(b'\n', max(pos, start + chunk_size))
+        if split < 0:
+            break
+        mo = comment_starts.search(data, pos, split)
+        if mo is None:
+            chunks.append((start, split + 1))
+            start = pos = split + 1
+        elif mo.group() == b'--':
+            pos = data.find(b'\n', mo.end())
+        else:
+            try:
+                pos = skip_comment(data, mo.start())
+            except RuntimeError:
+                # unclosed comment: no more safe places to split
+                break
+    chunks.append((start, len(data)))
+    return chunks
+
+def _tokenize_chunk(filename, start, end, char_base, engine):
+    '''
+    Worker for TokenizeFile: map the file, scan bytes start:end of it
+    and return the TokenBuffer columns with offsets shifted by
+    char_base (the chunk's offset in characters), or None if the
+    chunk contains a scanning error.
+    '''
+    with open(filename, 'rb') as f, \
+         mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        code = _decode(data[start:end])
+    try:
+        tokens = TokenBuffer(code, engine)
+    except RuntimeError:
+        return None
+    if char_base:
+        tokens.starts = array('q', [s + char_base for s in tokens.starts])
+        tokens.ends = array('q', [e + char_base for e in tokens.ends])
+    return (tokens.kinds, tokens.starts, tokens.ends, tokens.values,
+            tokens.big_ints)
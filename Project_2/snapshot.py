@@ -0,0 +1,280 @@
+"""
+filename:     snapshot.py
+description:  A JSON-lines snapshot format for control flow graphs
+              (CFGs) and their live variable analysis: the nodes and
+              edges, references to the nodes of the AST they came from,
+              and optionally the IN/OUT/GEN/KILL sets as bitsets, which
+              load back into CFG and Optimizer objects without scanning,
+              parsing or analyzing the program again, and which can be
+              compared across compiler versions. Created for CS 554
+              (Compiler Construction) at UNM.
+"""
+
+import json
+import os
+
+from artifacts import write_file
+from cfg import CFG, CFG_Node
+from optimizer import Optimizer
+from traversal import preorder
+from trees import AstNode, TreeNode
+
+# The format of a snapshot: a header line, then one line per CFG node
+# in the order of CFG.nodes (so each node's id is its line number, from
+# 0), each line a JSON object. The header gives the number of nodes,
+# the kind of AST the nodes refer to ("arena" handles or TreeNode
+# "tree" ids) and its size, and, if the analysis was saved, the table
+# of variables the sets are bitsets over (bit i for variables[i], as a
+# hexadecimal string) and the coloring of the interference graph.
+# A node line has its label, type, content, successors and
+# predecessors (by id, in order), and either the id of its AST node
+# ("ast") or, for an AST node that is not in the tree (e.g. the copies
+# made by SSA, see ssa.py), the nodes of that AST inline ("tree", in
+# preorder, as [type, value, label, number of children]).
+# Bump FORMAT_VERSION whenever the layout changes.
+FORMAT_MAGIC = 'WCFG'
+FORMAT_VERSION = 1
+
+# the sets of the analysis, by their key in a node line
+_set_names = [('in', 'IN'), ('out', 'OUT'), ('gen', 'GEN'), ('kill', 'KILL')]
+
+def _tree_index(root):
+    '''
+    The kind of the AST at root ("arena" or "tree"), its size, and a
+    function giving the id of one of its nodes (or None for a node not
+    in it).
+    '''
+    if isinstance(root, AstNode):
+        arena = root.arena
+        def reference(node):
+            if isinstance(node, AstNode) and node.arena is arena:
+                return node.handle
+            return None
+        return "arena", len(arena), reference
+    nodes = {}
+    for node in preorder(root):
+        nodes[id(node)] = node.id
+    return "tree", len(nodes), lambda node: nodes.get(id(node))
+
+def _inline_tree(ast):
+    '''
+    The nodes of the AST at ast in preorder, each as [type, value,
+    label, number of children].
+    '''
+    return [[node.type, node.value, node.l, len(node.children)]
+            for node in preorder(ast)]
+
+def _tree_from_inline(nodes, tree_node):
+    '''
+    Rebuild the AST saved by _inline_tree() (with new nodes made by
+    tree_node(), e.g. TreeNode) and return its root.
+    '''
+    # the nodes waiting for children, with the number still missing
+    root = None
+    stack = []
+    for type, value, label, count in nodes:
+        node = tree_node(type=type, value=value, l=label, children=[])
+        if stack:
+            parent, missing = stack[-1]
+            parent.children.append(node)
+            if missing == 1:
+                stack.pop()
+            else:
+                stack[-1] = (parent, missing - 1)
+        else:
+            root = node
+        if count:
+            stack.append((node, count))
+    return root
+
+def snapshot_lines(cfg, optimizer=None):
+    '''
+    Generate the lines of the snapshot of cfg (with the live variable
+    sets of optimizer, if given, which must be the Optimizer of cfg as
+    it is now), one at a time, e.g. for ArtifactWriter.write_file.
+    '''
+    kind, size, reference = _tree_index(cfg.entry.ast)
+    header = {'format': FORMAT_MAGIC, 'version': FORMAT_VERSION,
+              'nodes': len(cfg.nodes), 'ast': kind, 'ast_nodes': size}
+    if optimizer is not None:
+        names = set()
+        for _, attribute in _set_names:
+            sets = getattr(optimizer, attribute)
+            for node in cfg.nodes:
+                names |= sets[node.label]
+        variables = sorted(names)
+        bits = {var: 1 << i for i, var in enumerate(variables)}
+        header['variables'] = variables
+        header['coloring'] = optimizer.interference_graph.coloring
+    yield json.dumps(header, separators=(',', ':'))
+
+    for node in cfg.nodes:
+        record = {'label': node.label, 'type': node.type,
+                  'content': node.content,
+                  'succ': [succ.id for succ in node.succ],
+                  'pred': [pred.id for pred in node.pred]}
+        if node.ast is not None:
+            ast = reference(node.ast)
+            if ast is None:
+                record['tree'] = _inline_tree(node.ast)
+            else:
+                record['ast'] = ast
+        if optimizer is not None:
+            for key, attribute in _set_names:
+                mask = 0
+                for var in getattr(optimizer, attribute)[node.label]:
+                    mask |= bits[var]
+                record[key] = format(mask, 'x')
+        yield json.dumps(record, separators=(',', ':'))
+
+def save_cfg(filename, cfg, optimizer=None):
+    '''
+    Write the snapshot of cfg (and of the analysis of optimizer, if
+    given) to filename. The file is written under a temporary name and
+    then renamed, so a reader never sees a partly written file.
+    '''
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    write_file(temporary, snapshot_lines(cfg, optimizer))
+    os.replace(temporary, filename)
+
+def read_snapshot(filename, intern=None):
+    '''
+    Read the snapshot in filename, without the AST: return its header
+    and the list of its node lines (dicts as described above), with
+    the bitsets decoded into sets of variable names (interned by
+    intern(), if given; equal sets are the same set object, so they
+    must not be changed in place). Return None if there is no such
+    file, or if it is not a complete snapshot of this version of the
+    format.
+    '''
+    try:
+        with open(filename) as f:
+            header = json.loads(f.readline())
+            records = [json.loads(line) for line in f]
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(header, dict) or header.get('format') != FORMAT_MAGIC
+            or header.get('version') != FORMAT_VERSION
+            or header.get('nodes') != len(records)):
+        return None
+    variables = header.get('variables')
+    if variables is not None:
+        if intern is not None:
+            variables = [intern(var) for var in variables]
+        decoded = {}
+        for record in records:
+            for key, _ in _set_names:
+                mask = record[key]
+                if mask not in decoded:
+                    bits = int(mask, 16)
+                    decoded[mask] = {var for i, var in enumerate(variables)
+                                     if bits >> i & 1}
+                record[key] = decoded[mask]
+    return header, records
+
+def load_cfg(filename, ast, context=None):
+    '''
+    Load the snapshot in filename as a CFG of the AST at ast (the root
+    of the same tree the snapshot was saved from, e.g. loaded with
+    astcache.load_ast(), or the same TreeNodes), and, if the analysis
+    was saved with it, an Optimizer with its sets (see
+    Optimizer.from_sets()). Return (cfg, optimizer), with optimizer
+    None if there was no analysis, or None if the snapshot cannot be
+    read (see read_snapshot()) or was saved from another tree (one of
+    another kind or size, or other TreeNodes; an arena of the same
+    size is taken to be the same tree).
+
+    Args:
+        filename: the snapshot file (see save_cfg())
+        ast: the root of the AST
+        context: optional CompilationContext (see context.py) the CFG
+            and Optimizer are recorded in, which also makes the nodes
+            of inline trees and interns the variable names
+    '''
+    intern = None if context is None else context.intern
+    snapshot = read_snapshot(filename, intern)
+    if snapshot is None:
+        return None
+    header, records = snapshot
+    kind, size, _ = _tree_index(ast)
+    if header['ast'] != kind or header['ast_nodes'] != size:
+        return None
+    if kind == "arena":
+        arena = ast.arena
+        resolve = lambda handle: AstNode(arena, handle)
+    else:
+        resolve = {node.id: node for node in preorder(ast)}.get
+    tree_node = TreeNode if context is None else context.tree_node
+
+    nodes = []
+    for record in records:
+        if 'ast' in record:
+            node_ast = resolve(record['ast'])
+            if node_ast is None:
+                # not the tree the snapshot was saved from
+                return None
+        elif 'tree' in record:
+            node_ast = _tree_from_inline(record['tree'], tree_node)
+        else:
+            node_ast = None
+        nodes.append(CFG_Node(label=record['label'], ast=node_ast,
+                              type=record['type'], content=record['content']))
+    for node, record in zip(nodes, records):
+        node.succ = [nodes[i] for i in record['succ']]
+        node.pred = [nodes[i] for i in record['pred']]
+    cfg = CFG.from_nodes(nodes, context)
+
+    if 'variables' not in header:
+        return cfg, None
+    sets = {attribute: {record['label']: record[key] for record in records}
+            for key, attribute in _set_names}
+    coloring = header['coloring']
+    if intern is not None:
+        coloring = {intern(var): color for var, color in coloring.items()}
+    optimizer = Optimizer.from_sets(cfg, sets['IN'], sets['OUT'], sets['GEN'],
+                                    sets['KILL'], coloring, context=context)
+    return cfg, optimizer
+
+def diff_snapshots(old, new):
+    '''
+    The differences between two snapshot files (e.g. of the same
+    program compiled by two versions of the compiler), matching their
+    nodes by label: a line for each node only in one of them ("-" or
+    "+"), and for each node in both whose content, successors or sets
+    differ ("~"). Raise ValueError if either file is not a snapshot.
+    '''
+    snapshots = [read_snapshot(filename) for filename in [old, new]]
+    for filename, snapshot in zip([old, new], snapshots):
+        if snapshot is None:
+            raise ValueError(f"'{filename}' is not a CFG snapshot")
+    (old_header, old_records), (new_header, new_records) = snapshots
+    old_nodes = {record['label']: record for record in old_records}
+    new_nodes = {record['label']: record for record in new_records}
+    has_sets = 'variables' in old_header and 'variables' in new_header
+
+    lines = []
+    for record in old_records:
+        if record['label'] not in new_nodes:
+            lines.append(f"- label_{record['label']}: {record['content']}")
+    for record in new_records:
+        label = record['label']
+        if label not in old_nodes:
+            lines.append(f"+ label_{label}: {record['content']}")
+            continue
+        before = old_nodes[label]
+        if before['content'] != record['content']:
+            lines.append(f"~ label_{label}: {before['content']} -> "
+                         f"{record['content']}")
+        old_succ = [old_records[i]['label'] for i in before['succ']]
+        new_succ = [new_records[i]['label'] for i in record['succ']]
+        if old_succ != new_succ:
+            lines.append(f"~ label_{label}: successors {old_succ} -> "
+                         f"{new_succ}")
+        if has_sets:
+            for key, attribute in _set_names:
+                removed = before[key] - record[key]
+                added = record[key] - before[key]
+                if removed or added:
+                    lines.append(f"~ label_{label}: {attribute} "
+                                 f"-{sorted(removed)} +{sorted(added)}")
+    return lines
@@ -0,0 +1,365 @@
+"""
+filename:     ssa.py
+description:  Static single assignment (SSA) form of a CFG: placement of
+              phi-functions at the dominance frontiers of the
+              definitions, renaming of the variables into versions,
+              pruning of the dead phi-functions, and translation back
+              out of SSA form, with the parallel copies of the
+              phi-functions sequentialized into ordinary assignments
+              the code generator handles. Created for CS 554 (Compiler
+              Construction) at UNM.
+"""
+
+from traversal import Rewriter, preorder
+from trees import TreeNode, ASSIGN, VAR
+from cfg import CFG_Node
+
+def used_variables(ast):
+    '''
+    The names of the variables a statement or condition uses (reads),
+    in the order they appear.
+    '''
+    if ast.type == ASSIGN:
+        ast = ast.children[1]
+    return [node.value for node in preorder(ast) if node.type == VAR]
+
+def sequentialize(copies, temp):
+    '''
+    Turn a parallel copy (all its sources read before any destination
+    is written) into a list of ordinary copies with the same effect,
+    using the algorithm of Boissinot et al. ("Revisiting Out-of-SSA
+    Translation for Correctness, Code Quality, and Efficiency"): a copy
+    is made as soon as its destination is no longer needed as a
+    source, and the cycles left (e.g. a swap) are broken by saving one
+    of their variables in temp.
+
+    Args:
+        copies: list of (destination, source) pairs, with distinct
+            destinations
+        temp: name of a variable that is free to overwrite
+
+    Returns: list of (destination, source) pairs, to copy in order
+    '''
+    copies = [(dest, source) for dest, source in copies if dest != source]
+    ready = []
+    todo = []
+    # where the original value of each source is now, and the source
+    # of each destination
+    location = {}
+    source_of = {}
+    for dest, source in copies:
+        location[dest] = None
+        source_of.setdefault(source, None)
+    for dest, source in copies:
+        location[source] = source
+        source_of[dest] = source
+        todo.append(dest)
+    for dest, source in copies:
+        if location[dest] is None:
+            ready.append(dest)
+    result = []
+    while todo:
+        while ready:
+            dest = ready.pop()
+            source = source_of[dest]
+            current = location[source]
+            result.append((dest, current))
+            location[source] = dest
+            if source == current and source_of[source] is not None:
+                ready.append(source)
+        dest = todo.pop()
+        if dest != location[source_of[dest]]:
+            # dest is on a cycle of copies not made yet
+            result.append((temp, dest))
+            location[dest] = temp
+            ready.append(dest)
+    return result
+
+class Phi:
+    '''
+    A phi-function target := phi(args) at the start of a join node of
+    the CFG in SSA form: target is the version of var defined there,
+    and args[i] the version of var that reaches it along the edge from
+    its i-th predecessor.
+    '''
+
+    def __init__(self, var, count):
+        self.var = var
+        self.target = None
+        self.args = [None] * count
+
+    def __str__(self):
+        return f"{self.target} := phi({', '.join(self.args)})"
+
+class _Renamer(Rewriter):
+    '''
+    The Rewriter behind SSA renaming, which copies an expression with
+    each variable replaced by its current version (see SSA._rename()),
+    leaving the original tree (which may be shared) alone.
+    '''
+
+    def __init__(self, ssa, node):
+        self.ssa = ssa
+        self.node = node
+
+    def rewrite_var(self, node, results):
+        name = self.ssa._current(node.value)
+        self.ssa.uses.setdefault(name, []).append(self.node)
+        return self.ssa._tree_node(type=VAR, value=name)
+
+    def rewrite_default(self, node, results):
+        return self.ssa._tree_node(type=node.type, value=node.value,
+                                   l=node.l, children=results)
+
+class SSA:
+    '''
+    SSA(cfg, outVars={'output'}, context=None) puts the CFG in SSA form,
+    in place: every assignment defines a new version of its variable
+    (x.1, x.2, ..., which cannot clash with the names in a program),
+    every use reads the one version that reaches it, and join nodes
+    start with phi-functions (see Phi, kept in self.phis by node)
+    choosing a version by the edge control came in by. The values the
+    variables have on entry are their version 0, the variable itself.
+
+    The phi-functions are placed semi-pruned: only for the variables
+    used in a basic block other than the one assigning them (and the
+    variables of outVars, which the exit node uses), at the iterated
+    dominance frontier of their assignments. After renaming, the ones
+    whose targets are never used (but by other such phi-functions) are
+    removed, which leaves the phi-functions of pruned SSA form: one
+    choosing version 0 of a variable along an edge then only remains if
+    the variable is live on entry, so that destruct() never copies an
+    undefined variable (which would make it live on entry).
+
+    Each version has one definition (self.definitions, the node of its
+    assignment or phi-function) and a list of uses (self.uses), so
+    analyses can follow the versions instead of iterating over sets of
+    variables. destruct() translates the CFG back into ordinary
+    assignments for the Optimizer and the code generator:
+
+        ssa = SSA(cfg, context=context)
+        ...
+        ssa.destruct()
+        optimizer = Optimizer(cfg, context=context)
+
+    Args:
+        cfg: the CFG (see cfg.py)
+        outVars: the variables live on exit, whose last versions are
+            copied back to them by destruct()
+        context: optional CompilationContext (see context.py) giving
+            the ids and labels of new nodes, and interning the names
+    '''
+
+    def __init__(self, cfg, outVars={'output'}, context=None):
+        self.cfg = cfg
+        self.context = context
+        self._tree_node = TreeNode
+        self._intern = lambda name: name
+        if context is not None:
+            context.passes['ssa'] = self
+            self._tree_node = context.tree_node
+            self._intern = context.intern
+        self.outVars = {self._intern(var) for var in outVars}
+        self.phis = {}
+        self.definitions = {}
+        self.uses = {}
+        self.versions = {}
+        self.exit_names = {}
+        self.copies = 0
+        self._stacks = {}
+        self._next_label = None
+        self._place_phis()
+        self._rename()
+        self._prune_phis()
+
+    def _place_phis(self):
+        '''
+        Place the (semi-pruned) phi-functions, at the iterated dominance
+        frontiers of the assignments of each variable.
+        '''
+        global_vars = set(self.outVars)
+        assignments = {}
+        for block in self.cfg.basic_blocks():
+            assigned = set()
+            for node in block.nodes:
+                if node.type in ["entry", "exit"]:
+                    continue
+                for var in used_variables(node.ast):
+                    if var not in assigned:
+                        global_vars.add(var)
+                if node.ast.type == ASSIGN:
+                    var = node.ast.children[0].value
+                    assigned.add(var)
+                    assignments.setdefault(var, []).append(node.id)
+
+        nodes = self.cfg.nodes
+        frontiers = self.cfg.dominators().frontiers
+        for var in sorted(global_vars & assignments.keys()):
+            placed = set()
+            work = list(assignments[var])
+            seen = set(work)
+            while work:
+                for f in frontiers.get(work.pop(), ()):
+                    if f not in placed:
+                        placed.add(f)
+                        node = nodes[f]
+                        self.phis.setdefault(node, []).append(
+                                Phi(var, len(node.pred)))
+                        if f not in seen:
+                            seen.add(f)
+                            work.append(f)
+
+    def _current(self, var):
+        stack = self._stacks.get(var)
+        return stack[-1] if stack else var
+
+    def _new_version(self, var, node):
+        version = self.versions.get(var, 0) + 1
+        self.versions[var] = version
+        name = self._intern(f"{var}.{version}")
+        self._stacks.setdefault(var, []).append(name)
+        self.definitions[name] = node
+        return name
+
+    def _rename(self):
+        '''
+        Rename the variables into versions, walking the dominator tree
+        (with an explicit stack) with a stack of the versions of each
+        variable defined on the way down.
+        '''
+        cfg = self.cfg
+        dominators = cfg.dominators()
+        work = [(cfg.entry, None)]
+        while work:
+            node, defined = work.pop()
+            if defined is not None:
+                # leaving node: its versions go out of scope
+                for var in defined:
+                    self._stacks[var].pop()
+                continue
+            defined = []
+            for phi in self.phis.get(node, ()):
+                phi.target = self._new_version(phi.var, node)
+                defined.append(phi.var)
+            if node.type == "condition":
+                kind = node.content.split(" ", 1)[0]
+                node.ast = _Renamer(self, node).rewrite(node.ast)
+                node.content = f"{kind} {cfg.cfg_content_from_ast(node.ast)}"
+            elif node.type == "other" and node.ast.type == ASSIGN:
+                var = node.ast.children[0].value
+                value = _Renamer(self, node).rewrite(node.ast.children[1])
+                target = self._tree_node(type=VAR,
+                                         value=self._new_version(var, node))
+                defined.append(var)
+                node.ast = self._tree_node(type=ASSIGN, value=node.ast.value,
+                                           l=node.ast.l,
+                                           children=[target, value])
+                node.content = cfg.cfg_content_from_ast(node.ast)
+            elif node is cfg.exit:
+                self.exit_names = {var: self._current(var)
+                                   for var in self.outVars}
+            for succ in node.succ:
+                for i, pred in enumerate(succ.pred):
+                    if pred is node:
+                        for phi in self.phis.get(succ, ()):
+                            name = self._current(phi.var)
+                            phi.args[i] = name
+                            self.uses.setdefault(name, []).append(succ)
+            work.append((node, defined))
+            work.extend((child, None)
+                        for child in reversed(dominators.children(node)))
+
+    def _prune_phis(self):
+        '''
+        Remove the dead phi-functions: those whose targets are not used
+        by a statement, a condition, the exit node (the versions of
+        outVars there) or a phi-function that is not dead itself.
+        '''
+        phi_of = {phi.target: (node, phi) for node, phis in self.phis.items()
+                  for phi in phis}
+        # the uses of each version by phi-functions (see _rename())
+        phi_uses = {}
+        for _, phi in phi_of.values():
+            for name in phi.args:
+                phi_uses[name] = phi_uses.get(name, 0) + 1
+        live = set()
+        work = [name for name in phi_of
+                if len(self.uses.get(name, ())) > phi_uses.get(name, 0)]
+        work.extend(name for name in self.exit_names.values()
+                    if name in phi_of)
+        while work:
+            name = work.pop()
+            if name in live:
+                continue
+            live.add(name)
+            work.extend(arg for arg in phi_of[name][1].args if arg in phi_of)
+
+        for name, (node, phi) in phi_of.items():
+            if name in live:
+                continue
+            self.phis[node].remove(phi)
+            if not self.phis[node]:
+                del self.phis[node]
+            del self.definitions[name]
+            self.uses.pop(name, None)
+            for arg in phi.args:
+                uses = self.uses.get(arg)
+                if uses is not None:
+                    uses.remove(node)
+
+    def _copy_node(self, dest, source):
+        '''
+        A new CFG node for the copy dest := source, with a new label.
+        '''
+        if self.context is not None:
+            label = self.context.num_labels
+            self.context.num_labels += 1
+        else:
+            if self._next_label is None:
+                self._next_label = 1 + max(
+                        [-1] + [node.label for node in self.cfg.nodes
+                                if isinstance(node.label, int)])
+            label = self._next_label
+            self._next_label += 1
+        tree_node = self._tree_node
+        ast = tree_node(type=ASSIGN, value=":=", l=label,
+                        children=[tree_node(type=VAR, value=dest),
+                                  tree_node(type=VAR, value=source)])
+        return CFG_Node(label=label, ast=ast, type="other",
+                        content=f"{dest} := {source}")
+
+    def destruct(self):
+        '''
+        Translate the CFG out of SSA form: the phi-functions of each
+        join node become a parallel copy on each of its incoming edges
+        (from the argument for that edge to the target), sequentialized
+        into a chain of new assignment nodes (see sequentialize()); on
+        the edges into the exit node, the last versions of the
+        variables of outVars are copied back to them. The versions
+        stay as they are (the Optimizer's interference graph then lets
+        versions that do not interfere share a register).
+
+        Returns: the number of copies inserted
+        '''
+        cfg = self.cfg
+        temp = self._intern("swap.0")
+        insertions = []
+        for node in cfg.nodes:
+            phis = self.phis.get(node, [])
+            if not phis and node is not cfg.exit:
+                continue
+            for i, pred in enumerate(node.pred):
+                if node is cfg.exit:
+                    # the versions the phi-functions would choose
+                    chosen = {phi.target: phi.args[i] for phi in phis}
+                    copies = [(var, chosen.get(name, name)) for var, name
+                              in sorted(self.exit_names.items())]
+                else:
+                    copies = [(phi.target, phi.args[i]) for phi in phis]
+                chain = [self._copy_node(dest, source) for dest, source
+                         in sequentialize(copies, temp)]
+                if chain:
+                    insertions.append((pred, pred.succ.index(node), chain))
+        self.copies = cfg.insert_nodes(insertions)
+        self.phis = {}
+        return self.copies
@@ -0,0 +1,878 @@
+"""
+filename:     benchmarks.py
+description:  Timing benchmarks for the WHILE compiler front end and
+              analyses, run by hand (pytest does not collect them):
+
+                  python tests/benchmarks.py            # all benchmarks
+                  python tests/benchmarks.py comments   # just one
+
+              Created for CS 554 (Compiler Construction) at UNM.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scanner import Tokenize, TokenBuffer, TokenizeFile
+from parser import Parser, ast_type_to_value, pt_type_to_value
+from parser import ADD, AND, ARITHEXPR, ARITHTERM, BOOLEXPR, BOOLTERM
+from parser import MULT, OP_A, OR, SUB
+from trees import AstArena, decorate_ast, insert_labels, label_points
+from trees import write_labels
+from traversal import Visitor, Rewriter, preorder
+from hashcons import ExpressionTable
+from incremental import IncrementalParser
+from astcache import cache_file, load_ast, save_ast
+from cfg import CFG
+from optimizer import Optimizer
+from ssa import SSA
+from snapshot import diff_snapshots, load_cfg, save_cfg
+from codegen import RISC_V_CodeGenerator
+
+def timed(fxn, repeat=3):
+    '''
+    Best wall-clock time (in seconds) of repeat calls to fxn().
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fxn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_comments():
+    '''
+    Scanning programs dominated by large {- ... -} comment blocks, with
+    the dedicated comment-skipping path, for both engines, and (for
+    comparison) with the lazy comment regex the scanner used before.
+    '''
+    old_comment = re.compile(r"\{-(.|\n|\r)*?-\}")
+    line = "x := x + 1; while x < 10 do skip od\n"
+    nested_line = "x := x + 1; {- y := 0 -} while x < 10 do skip od\n"
+    for megabytes in [1, 10]:
+        body = line * (megabytes * 2**20 // len(line))
+        code = "x := 0;\n{-\n" + body + "-}\ny := x"
+        body = nested_line * (megabytes * 2**20 // len(nested_line))
+        nested = "x := 0;\n{-\n" + body + "-}\ny := x"
+        print(f"{megabytes:>3} MB comment block:")
+        print(f"    re engine:            "
+              f"{timed(lambda: list(Tokenize(code))):8.4f} s")
+        print(f"    re engine (nested):   "
+              f"{timed(lambda: list(Tokenize(nested))):8.4f} s")
+        print(f"    dfa engine:           "
+              f"{timed(lambda: list(Tokenize(code, 'dfa'))):8.4f} s")
+        print(f"    old lazy regex:       "
+              f"{timed(lambda: old_comment.search(code), repeat=1):8.4f} s "
+              f"(comment only)")
+
+def bench_parallel():
+    '''
+    Scanning a large generated program sequentially into a TokenBuffer
+    and in parallel chunks with TokenizeFile.
+    '''
+    statement = ("x := x + 2 * y; {- note -}\n"
+                 "while x < 100 do x := x - 1 od;\n")
+    code = statement * 100000 + "skip"
+    with tempfile.NamedTemporaryFile('w', suffix='.while', delete=False) as f:
+        f.write(code)
+    try:
+        print(f"{len(code) / 2**20:.1f} MB program:")
+        print(f"    sequential TokenBuffer: "
+              f"{timed(lambda: TokenBuffer(code)):8.4f} s")
+        for jobs in [2, 4, 8]:
+            print(f"    TokenizeFile, {jobs} jobs: "
+                  f"{timed(lambda: TokenizeFile(f.name, jobs)):8.4f} s")
+    finally:
+        os.remove(f.name)
+
+def bench_parse():
+    '''
+    Parsing a list of tokens into both a parse tree and an AST, and
+    into just the AST.
+    '''
+    statement = ("if [x < 10] and [not [y = 0]] then x := (x + 1) * y "
+                 "else while x > 0 do x := x - 1 od fi")
+    code = ";\n".join([statement] * 100)
+    tokens = list(Tokenize(code))
+    print(f"{len(tokens)} tokens, parsed 20 times:")
+    def parse(build_pt):
+        for _ in range(20):
+            Parser(tokens).parse(build_pt)
+    print(f"    PT and AST:     {timed(lambda: parse(True)):8.4f} s")
+    print(f"    AST only:       {timed(lambda: parse(False)):8.4f} s")
+
+class _RecursiveParser(Parser):
+    '''
+    The Parser with the recursive-descent expression methods it had
+    before the precedence-climbing loop (Parser._climb()), which accept
+    one operator per level (so no chains), to compare against.
+    '''
+
+    def _binary(self, level, op_type, pt_left, ast_left, right):
+        op_token = self.consume(OP_A if op_type in [ADD, SUB, MULT]
+                                else op_type)
+        pt_right, ast_right = right()
+        pt_result = self._pt_node(
+                type=level, value=pt_type_to_value[level],
+                children=[self._pt_node(type=op_type,
+                                        value=pt_type_to_value[op_type],
+                                        children=[pt_left, pt_right])])
+        ast_result = self._ast_node(type=op_type,
+                                    value=ast_type_to_value[op_type],
+                                    index=op_token.index,
+                                    children=[ast_left, ast_right])
+        return (pt_result, ast_result)
+
+    def _single(self, level, pt_result, ast_result):
+        return (self._pt_node(type=level, value=pt_type_to_value[level],
+                              children=[pt_result]), ast_result)
+
+    def arith_expr(self):
+        pt_result, ast_result = self.term()
+        if self.current_token and self.current_token.value in ['+', '-']:
+            op_type = ADD if self.current_token.value == '+' else SUB
+            return self._binary(ARITHEXPR, op_type, pt_result, ast_result,
+                                self.term)
+        return self._single(ARITHEXPR, pt_result, ast_result)
+
+    def term(self):
+        pt_result, ast_result = self.factor()
+        if self.current_token and self.current_token.value == '*':
+            return self._binary(ARITHTERM, MULT, pt_result, ast_result,
+                                self.factor)
+        return self._single(ARITHTERM, pt_result, ast_result)
+
+    def bool_expr(self):
+        pt_result, ast_result = self.bool_term()
+        if self.current_token and self.current_token.value == OR:
+            return self._binary(BOOLEXPR, OR, pt_result, ast_result,
+                                self.bool_term)
+        return self._single(BOOLEXPR, pt_result, ast_result)
+
+    def bool_term(self):
+        pt_result, ast_result = self.bool_factor()
+        if self.current_token and self.peek(AND):
+            return self._binary(BOOLTERM, AND, pt_result, ast_result,
+                                self.bool_factor)
+        return self._single(BOOLTERM, pt_result, ast_result)
+
+def bench_expressions():
+    '''
+    Parsing expression-heavy programs: nested single-operator
+    expressions, with the precedence-climbing loop and with the
+    recursive-descent methods it replaced, and long left-associative
+    operator chains (which only the loop parses).
+    '''
+    statement = ("x := ((a + b) * (c - d)) * ((e + 1) * (f - 2)); "
+                 "if [[x < y] and [y < z]] or [not [x = 0]] "
+                 "then y := (y - 1) * 2 else z := (z + 1) * (y - x) fi")
+    code = ";\n".join([statement] * 100)
+    tokens = list(Tokenize(code))
+    assert (repr(_RecursiveParser(tokens).parse()[1].root)
+            == repr(Parser(tokens).parse()[1].root))
+    print(f"{len(tokens)} tokens of nested expressions, parsed 10 times:")
+    for name, parser in [("precedence climbing", Parser),
+                         ("recursive descent", _RecursiveParser)]:
+        def parse():
+            for _ in range(10):
+                parser(tokens).parse()
+        print(f"    {name:<20} {timed(parse):8.4f} s")
+    for n in [1000, 10000, 100000]:
+        code = "x := " + " + ".join(f"y * {i}" for i in range(n))
+        tokens = list(Tokenize(code))
+        print(f"    chain of {n:>6} terms: "
+              f"{timed(lambda: Parser(tokens).parse()):8.4f} s")
+
+def bench_incremental():
+    '''
+    A one-character edit in the middle of programs of growing size,
+    applied incrementally, compared to scanning and parsing again.
+    '''
+    statement = ("while x < 10 do x := x + 1; "
+                 "if [x = 5] then y := y * 2 else skip fi od")
+    for n in [100, 1000, 10000]:
+        code = ";\n".join([statement] * n)
+        front_end = IncrementalParser(code)
+        middle = code.index("10", len(code) // 2)
+        edits = iter(["11", "10"] * 3)
+        def edit():
+            front_end.edit(middle, middle + 2, next(edits))
+        print(f"{n:>6} statements:  full parse "
+              f"{timed(lambda: IncrementalParser(code), repeat=1):8.4f} s, "
+              f"incremental edit {timed(edit):8.4f} s")
+
+def bench_arena():
+    '''
+    Memory use of the AST of a large program built from TreeNodes and
+    in an AstArena, and the time of full-tree walks over each.
+    '''
+    statement = ("while x < 10 do x := (x + 1) * y; "
+                 "if [x = 5] and [y > 2] then y := y - 2 else skip fi od")
+    code = ";\n".join([statement] * 20000)
+    tokens = list(Tokenize(code))
+    def build(arena):
+        tracemalloc.start()
+        ast = Parser(tokens).parse(build_pt=False, arena=arena)[1].root
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return ast, size
+    tree_ast, tree_size = build(None)
+    arena = AstArena()
+    arena_ast, arena_size = build(arena)
+    def walk(node):
+        stack = [node]
+        while stack:
+            stack.extend(stack.pop().children)
+    def walk_arena():
+        for _ in arena.preorder(arena_ast.handle):
+            pass
+    def scan_arena():
+        for _ in arena.nodes(arena_ast.handle):
+            pass
+    print(f"{len(arena)} AST nodes:")
+    print(f"    TreeNode AST:   {tree_size / 2**20:8.2f} MB")
+    print(f"    AstArena AST:   {arena_size / 2**20:8.2f} MB")
+    print(f"    walk TreeNodes:           {timed(lambda: walk(tree_ast)):8.4f} s")
+    print(f"    walk AstArena (views):    {timed(lambda: walk(arena_ast)):8.4f} s")
+    print(f"    walk AstArena (handles):  {timed(walk_arena):8.4f} s")
+    print(f"    scan AstArena (range):    {timed(scan_arena):8.4f} s")
+    print(f"    decorate_ast, TreeNodes:  "
+          f"{timed(lambda: decorate_ast(tree_ast)):8.4f} s")
+    print(f"    decorate_ast, AstArena:   "
+          f"{timed(lambda: decorate_ast(arena_ast)):8.4f} s")
+
+class _CountingVisitor(Visitor):
+    '''
+    A Visitor with enter and leave handlers for every node type.
+    '''
+    def __init__(self):
+        self.count = 0
+
+    def enter_default(self, node):
+        self.count += 1
+
+    def leave_default(self, node):
+        pass
+
+class _CountingRewriter(Rewriter):
+    '''
+    A Rewriter counting the nodes of a tree.
+    '''
+    def rewrite_default(self, node, results):
+        return 1 + sum(results)
+
+def bench_traversal():
+    '''
+    The cost per node of walking an AST: a bare explicit-stack loop, a
+    recursive walk with string-comparison dispatch (as the passes used
+    to do), the preorder() generator, and Visitor and Rewriter passes.
+    '''
+    statement = ("while x < 10 do x := (x + 1) * y; "
+                 "if [x = 5] and [y > 2] then y := y - 2 else skip fi od")
+    # (short enough for the recursive walk, so each walk is repeated)
+    code = ";\n".join([statement] * 200)
+    ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+    nodes = sum(1 for _ in preorder(ast))
+    repeat = 20
+    ops = ["=", "<", ">", "<=", ">=", "and", "add", "sub", "mult", "or"]
+    def bare():
+        stack = [ast]
+        while stack:
+            stack.extend(stack.pop().children)
+    def recursive(node=ast):
+        if node.type in ops or node.type in ["seq", "while", "if",
+                                             "assign", "not"]:
+            for child in node.children:
+                recursive(child)
+        elif node.type in ["var", "int", "true", "false", "skip"]:
+            pass
+    def generator():
+        for _ in preorder(ast):
+            pass
+    print(f"{nodes} AST nodes, walked {repeat} times, time per node:")
+    for name, fxn in [("bare stack loop", bare),
+                      ("recursive, string dispatch", recursive),
+                      ("preorder() generator", generator),
+                      ("Visitor (enter + leave)",
+                       lambda: _CountingVisitor().visit(ast)),
+                      ("Rewriter", lambda: _CountingRewriter().rewrite(ast))]:
+        def walks():
+            for _ in range(repeat):
+                fxn()
+        per_node = timed(walks) / (repeat * nodes)
+        print(f"    {name + ':':<28} {per_node * 1e9:8.0f} ns")
+
+def bench_frequencies():
+    '''
+    Static frequency estimates: the time to estimate them on large
+    generated CFGs, and on the good_syntax programs with loops, the
+    jumps (taken branches and j) and loads and stores run by the
+    assembly code generated without and with them (laid out, and
+    register-allocated, by frequency), on the same random inputs.
+    '''
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from test_frequency import _execute
+    from frequency import Frequencies
+    statement = ("i := 0; while i < n do j := i; "
+                 "while j > 0 do if j = 3 then s := s + j else t := t + s fi; "
+                 "j := j - 1 od; i := i + 1 od; output := s + t")
+    for n in [1000, 5000, 20000]:
+        ast = Parser(list(Tokenize(";\n".join([statement] * n)))).parse(
+                build_pt=False)[1].root
+        decorate_ast(ast)
+        cfg = CFG(ast)
+        cfg.loops()
+        estimate = timed(lambda: Frequencies(cfg))
+        print(f"{len(cfg.nodes):>7} CFG nodes:  estimate {estimate:8.4f} s")
+
+    rng = random.Random(554)
+    tests = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(tests, "good_syntax",
+                                                  "*.while"))):
+        with open(filename) as f:
+            code = f.read()
+        if "while" not in code.replace(".while", ""):
+            continue
+        totals = []
+        inputs = None
+        for use_frequencies in [False, True]:
+            ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+            decorate_ast(ast)
+            cfg = CFG(ast)
+            optimizer = Optimizer(cfg, report=None)
+            codegen = RISC_V_CodeGenerator("f")
+            with contextlib.redirect_stdout(io.StringIO()):
+                assembly = codegen.generate(
+                        cfg.nodes, optimizer,
+                        cfg.frequencies() if use_frequencies else None)
+            if inputs is None:
+                inputs = [{var: rng.randint(0, 12)
+                           for var in optimizer.IN["entry"]}
+                          for _ in range(5)]
+            counts = {}
+            for values in inputs:
+                _execute(assembly, [values.get(var, 0)
+                                    for var in codegen.variables],
+                         counts=counts)
+            totals.append((counts.get("taken", 0) + counts.get("j", 0),
+                           counts.get("ld", 0) + counts.get("sd", 0)))
+        (jumps, memory), (jumps_f, memory_f) = totals
+        print(f"{os.path.basename(filename):>28}:  jumps {jumps:>7} -> "
+              f"{jumps_f:>7},  loads/stores {memory:>7} -> {memory_f:>7}")
+
+def bench_hashcons():
+    '''
+    The size of the AST of a program full of repeated expressions
+    before and after hash-consing, and the time of comparing two
+    equal expressions structurally and (once interned) by identity.
+    '''
+    statement = ("x := (i + 1) * (n - 1); y := x * y + (i + 1); "
+                 "while i < n do i := i + 1; z := (x * y) - (n - 1) od")
+    code = ";\n".join([statement] * 5000)
+    tokens = list(Tokenize(code))
+    tracemalloc.start()
+    ast = Parser(tokens).parse(build_pt=False)[1].root
+    decorate_ast(ast)
+    before = tracemalloc.get_traced_memory()[0]
+    table = ExpressionTable()
+    ast = table.intern(ast)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = sum(1 for _ in preorder(ast))
+    print(f"{nodes} AST nodes, {table.hits} of them replaced by shared "
+          f"nodes:")
+    print(f"    AST memory:  {before / 2**20:8.2f} MB before, "
+          f"{after / 2**20:8.2f} MB after (with the table)")
+    def equal(a, b):
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            if (a.type != b.type or a.value != b.value
+                    or len(a.children) != len(b.children)):
+                return False
+            stack.extend(zip(a.children, b.children))
+        return True
+    chain = " + ".join(["(i + 1) * (n - 1)"] * 100)
+    table = ExpressionTable()
+    a = Parser(list(Tokenize("x := " + chain))).parse()[1].root.children[1]
+    b = Parser(list(Tokenize("y := " + chain))).parse()[1].root.children[1]
+    def compare():
+        for _ in range(1000):
+            equal(a, b)
+    print(f"    1000 structural comparisons: {timed(compare):8.4f} s")
+    a, b = table.intern(a), table.intern(b)
+    def identity():
+        for _ in range(1000):
+            a is b
+    print(f"    1000 identity comparisons:   {timed(identity):8.4f} s")
+
+def bench_artifacts():
+    '''
+    Whole runs of compiler.py on a large generated program: a plain
+    compile, and compiles emitting every artifact, with the files
+    written directly and by the background writer thread.
+    '''
+    statement = ("while x < 10 do x := (x + 1) * y; "
+                 "if [x = 5] and [y > 2] then y := y - 2 else skip fi od")
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, "generated.while")
+    with open(filename, 'w') as f:
+        f.write(";\n".join([statement] * 2000) + ";\noutput := x + y")
+    compiler = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "compiler.py")
+    def compile(*options):
+        subprocess.run([sys.executable, compiler, filename, *options],
+                       stdout=subprocess.DEVNULL, check=True)
+    try:
+        print(f"compiler.py on a {os.path.getsize(filename) / 2**10:.0f} KB "
+              f"program:")
+        for name, options in [("plain compile", []),
+                              ("--emit all", ["--emit", "all"]),
+                              ("--emit all, background", ["--emit", "all",
+                               "--background-writer"])]:
+            print(f"    {name + ':':<26} "
+                  f"{timed(lambda: compile(*options), repeat=1):8.4f} s")
+    finally:
+        shutil.rmtree(directory)
+
+def bench_blocks():
+    '''
+    Live variable analysis solved per statement and per basic block,
+    on the good_syntax programs and a large generated one: the blocks
+    (or statements) swept, the sweeps, the block visits, the elements
+    in the sets the solver iterates on, and the solving time, plus
+    the labels and jumps in the assembly code.
+    '''
+    tests = os.path.dirname(os.path.abspath(__file__))
+    programs = []
+    for filename in sorted(glob.glob(os.path.join(tests, "good_syntax",
+                                                  "*.while"))):
+        with open(filename) as f:
+            programs.append(f.read())
+    statement = ("a := b + 1; c := a * 2; b := c - a; "
+                 "while b < 100 do b := b + c; c := c - 1; a := a + b od; "
+                 "if a > b then c := a; a := b else c := b; b := a fi")
+    programs.append(";\n".join([statement] * 500) + ";\noutput := a + c")
+    asts = []
+    for code in programs:
+        ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+        decorate_ast(ast)
+        asts.append(ast)
+    for name, blocks in [("per statement", False), ("per basic block", True)]:
+        swept = sweeps = visits = elements = 0
+        def solve():
+            return [Optimizer(CFG(ast), report=None, basic_blocks=blocks)
+                    for ast in asts]
+        for optimizer in solve():
+            swept += len(optimizer.blocks)
+            sweeps += optimizer.iterations
+            visits += optimizer.iterations * len(optimizer.blocks)
+            elements += sum(len(live) for sets in [optimizer.block_IN,
+                                                   optimizer.block_OUT]
+                            for live in sets)
+        print(f"{name}:")
+        print(f"    {swept} blocks, {sweeps} sweeps, {visits} block visits, "
+              f"{elements} set elements")
+        print(f"    CFG + analysis: {timed(solve):8.4f} s")
+    labels = jumps = statements = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for ast in asts:
+            cfg = CFG(ast)
+            optimizer = Optimizer(cfg, report=None)
+            statements += len(cfg.nodes)
+            code = RISC_V_CodeGenerator("f").generate(cfg.nodes, optimizer)
+            for line in code.split("\n"):
+                labels += line.startswith("label_")
+                jumps += line.startswith("    j ")
+    print(f"assembly: {labels} labels for {statements} CFG nodes, "
+          f"{jumps} jumps")
+
+def bench_liveness():
+    '''
+    The worklist liveness solver against sweeping over all the blocks
+    until nothing changes (per basic block and per statement), on the
+    good_syntax programs and large generated ones with nested loops:
+    the iterations, the blocks evaluated, and the time to solve the
+    equations of the optimized CFGs.
+    '''
+    tests = os.path.dirname(os.path.abspath(__file__))
+    good = []
+    for filename in sorted(glob.glob(os.path.join(tests, "good_syntax",
+                                                  "*.while"))):
+        with open(filename) as f:
+            good.append(f.read())
+    flat = ("a := b + 1; c := a * 2; b := c - a; "
+            "while b < 100 do b := b + c; c := c - 1; a := a + b od; "
+            "if a > b then c := a; a := b else c := b; b := a fi")
+    nested = "x0 := x1"
+    for i in range(1, 8):
+        nested = (f"while x{i} < n do x{i} := x{i + 1}; {nested}; "
+                  f"x{i - 1} := x{i} od")
+    chain = "; ".join(f"v{i} := v{i + 1}" for i in range(30))
+    suites = [("good_syntax", good),
+              ("generated (500 loops)",
+               [";\n".join([flat] * 500) + ";\noutput := a + c"]),
+              ("generated (200 7-deep loop nests)",
+               [";\n".join([nested] * 200) + ";\noutput := x0"]),
+              ("generated (100 loops of 30 copies)",
+               [";\n".join([f"while v0 < n do {chain} od"] * 100)
+                + ";\noutput := v0"])]
+    for name, programs in suites:
+        print(f"{name}:")
+        optimizers = []
+        for code in programs:
+            ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+            decorate_ast(ast)
+            optimizers.append(Optimizer(CFG(ast), report=None))
+        for blocks in [True, False]:
+            for solver in ["round-robin", "worklist"]:
+                iterations = evaluations = 0
+                for optimizer in optimizers:
+                    # the equations of the optimized CFG
+                    nodes = optimizer.cfg.nodes
+                    optimizer.gen_sets = [optimizer.gen(node) for node in nodes]
+                    optimizer.kill_sets = [optimizer.kill(node) for node in nodes]
+                    optimizer.blocks = optimizer.cfg.basic_blocks(
+                            single=not blocks)
+                def solve():
+                    for optimizer in optimizers:
+                        if solver == "worklist":
+                            optimizer.solve_worklist({'output'})
+                        else:
+                            optimizer.solve_blocks({'output'})
+                time = timed(solve)
+                for optimizer in optimizers:
+                    if solver == "worklist":
+                        iterations += optimizer.solve_worklist({'output'})
+                    else:
+                        iterations += optimizer.solve_blocks({'output'})
+                    evaluations += optimizer.evaluations
+                print(f"    {'per basic block' if blocks else 'per statement':>15}"
+                      f"  {solver:>11}: {iterations:>5} iterations, "
+                      f"{evaluations:>7} block evaluations, {time:8.4f} s")
+
+def bench_removal():
+    '''
+    Dead code elimination on generated programs whose statements are
+    mostly dead: the CFG nodes removed one at a time (as it was done
+    before there were batches) and in one batch by CFG.remove_nodes(),
+    and the whole Optimizer (analysis and elimination).
+    '''
+    statement = ("x := x + 1; y := x; skip; "
+                 "while x < 10 do skip; z := y od; "
+                 "if y > 2 then skip else z := x fi")
+    for n in [500, 2000]:
+        code = ";\n".join([statement] * n) + ";\noutput := x"
+        ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+        decorate_ast(ast)
+        def dead(cfg):
+            return [node for node in cfg.nodes if node.type == "other"
+                    and node.ast.type == "skip"
+                    or node.ast is not None and node.ast.type == "assign"
+                    and node.ast.children[0].value in ("y", "z")]
+        def one_by_one():
+            cfg = CFG(ast)
+            for node in dead(cfg):
+                cfg.remove_node(node)
+            return cfg
+        def batch():
+            cfg = CFG(ast)
+            cfg.remove_nodes(dead(cfg))
+            return cfg
+        nodes = len(CFG(ast).nodes)
+        left = len(batch().nodes)
+        print(f"{nodes} CFG nodes, {nodes - left} removed:")
+        print(f"    one at a time:  {timed(one_by_one, repeat=1):8.4f} s")
+        print(f"    one batch:      {timed(batch, repeat=1):8.4f} s")
+        print(f"    Optimizer:      "
+              f"{timed(lambda: Optimizer(CFG(ast), report=None), repeat=1):8.4f} s")
+
+def bench_reachability():
+    '''
+    Reachability queries on generated CFGs of loops in sequence: the
+    successors of every node and a "reaches" query for every node and
+    the exit, by searching from each node, and from the index (the
+    time to build it included), and the index with the "reaches"
+    queries alone.
+    '''
+    statement = ("while x < 10 do x := x + 1; "
+                 "if x > 5 then y := y + x else skip fi od; z := y")
+    for n in [100, 400]:
+        code = ";\n".join([statement] * n) + ";\noutput := z"
+        ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+        decorate_ast(ast)
+        cfg = CFG(ast)
+        def search():
+            return sum(len(node.get_all_successors()) + (cfg.exit in
+                       node.get_all_successors()) for node in cfg.nodes)
+        def index():
+            cfg._analyses = {}
+            reachability = cfg.reachability()
+            return sum(len(reachability.successors(node))
+                       + reachability.reaches(node, cfg.exit)
+                       for node in cfg.nodes)
+        def build():
+            cfg._analyses = {}
+            reachability = cfg.reachability()
+            return sum(reachability.reaches(node, cfg.exit)
+                       for node in cfg.nodes)
+        assert search() == index()
+        print(f"{len(cfg.nodes)} CFG nodes:")
+        print(f"    search:                 {timed(search, repeat=1):8.4f} s")
+        print(f"    index:                  {timed(index, repeat=1):8.4f} s")
+        print(f"    index, reaches() only:  {timed(build, repeat=1):8.4f} s")
+
+def bench_dominance():
+    '''
+    Dominators, post-dominators and the loop nesting forest of
+    generated CFGs of about 10k and 100k nodes (nested loops in
+    sequence): the time to build each, and the loops and the deepest
+    nesting found.
+    '''
+    statement = ("while a < 10 do b := 0; "
+                 "while b < a do if b > 3 then c := c + b else skip fi; "
+                 "b := b + 1 od; a := a + 1 od")
+    for n in [1250, 12500]:
+        code = ";\n".join([statement] * n) + ";\noutput := c"
+        ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+        decorate_ast(ast)
+        cfg = CFG(ast)
+        def build(name):
+            cfg._analyses = {}
+            if name != "loops":
+                return getattr(cfg, name)()
+            cfg.dominators()
+            start = time.perf_counter()
+            cfg._analyses.pop("loops", None)
+            cfg.loops()
+            return time.perf_counter() - start
+        print(f"{len(cfg.nodes)} CFG nodes:")
+        for name in ["dominators", "post_dominators"]:
+            print(f"    {name + ':':<18} "
+                  f"{timed(lambda: build(name)):8.4f} s")
+        print(f"    {'loops:':<18} {min(build('loops') for _ in range(3)):8.4f} s")
+        loops = cfg.loops()
+        print(f"    {len(loops.loops)} loops, deepest nesting "
+              f"{max(loops.depth(node) for node in cfg.nodes)}")
+
+def bench_ssa():
+    '''
+    The SSA round trip (construction, and translation back out of SSA
+    form) on the largest good_syntax programs and on large generated
+    ones: the versions, phi-functions and copies, and the time of each
+    step, with the Optimizer run on the CFG before and after.
+    '''
+    tests = os.path.dirname(os.path.abspath(__file__))
+    filenames = sorted(glob.glob(os.path.join(tests, "good_syntax",
+                                              "*.while")),
+                       key=os.path.getsize)[-3:]
+    programs = []
+    for filename in filenames:
+        with open(filename) as f:
+            programs.append((os.path.basename(filename), f.read()))
+    statement = ("i := 0; while i < n do j := i; "
+                 "while j > 0 do if j > 3 then s := s + j else t := t + s fi; "
+                 "j := j - 1 od; i := i + 1 od; output := s + t")
+    for n in [1000, 5000]:
+        programs.append((f"generated ({n} loop nests)",
+                         ";\n".join([statement] * n)))
+    for name, code in programs:
+        ast = Parser(list(Tokenize(code))).parse(build_pt=False)[1].root
+        decorate_ast(ast)
+        def construct():
+            cfg = CFG(ast)
+            cfg.dominators()
+            start = time.perf_counter()
+            ssa = SSA(cfg)
+            return cfg, ssa, time.perf_counter() - start
+        cfg, ssa, _ = construct()
+        phis = sum(len(phis) for phis in ssa.phis.values())
+        copies = ssa.destruct()
+        print(f"{name}: {len(CFG(ast).nodes)} CFG nodes, "
+              f"{len(ssa.definitions)} versions, {phis} phi-functions, "
+              f"{copies} copies")
+        build = min(construct()[2] for _ in range(3))
+        def destruct():
+            cfg, ssa, _ = construct()
+            start = time.perf_counter()
+            ssa.destruct()
+            return time.perf_counter() - start
+        out = min(destruct() for _ in range(3))
+        optimize = timed(lambda: Optimizer(CFG(ast), report=None))
+        def optimize_ssa():
+            cfg, ssa, _ = construct()
+            ssa.destruct()
+            start = time.perf_counter()
+            Optimizer(cfg, report=None)
+            return time.perf_counter() - start
+        after = min(optimize_ssa() for _ in range(3))
+        print(f"    into SSA {build:8.4f} s,  out of SSA {out:8.4f} s,  "
+              f"Optimizer {optimize:8.4f} s before, {after:8.4f} s after")
+
+def bench_snapshot():
+    '''
+    CFG snapshots of large generated programs: building the CFG and
+    running the Optimizer on an AST loaded from the AST cache, against
+    loading the optimized CFG and its sets back from a snapshot; and
+    the time to save a snapshot, its size, and the time to diff two.
+    '''
+    statement = ("i := 0; while i < n do j := i; "
+                 "while j > 0 do if j > 3 then s := s + j else t := t + s fi; "
+                 "j := j - 1 od; i := i + 1 od; output := s + t")
+    directory = tempfile.mkdtemp()
+    try:
+        ast_file = os.path.join(directory, "program.ast")
+        filename = os.path.join(directory, "program.jsonl")
+        for n in [1000, 5000, 20000]:
+            code = ";\n".join([statement] * n)
+            ast = Parser(list(Tokenize(code))).parse(
+                    build_pt=False, arena=AstArena())[1].root
+            decorate_ast(ast)
+            save_ast(ast_file, ast, code)
+            ast = load_ast(ast_file, code)
+            def analyze():
+                cfg = CFG(ast)
+                return cfg, Optimizer(cfg, report=None)
+            cfg, optimizer = analyze()
+            build = timed(analyze)
+            save = timed(lambda: save_cfg(filename, cfg, optimizer))
+            load = timed(lambda: load_cfg(filename, ast))
+            diff = timed(lambda: diff_snapshots(filename, filename))
+            print(f"{len(cfg.nodes):>7} CFG nodes:  build {build:8.4f} s,  "
+                  f"load {load:8.4f} s,  save {save:8.4f} s,  "
+                  f"diff {diff:8.4f} s,  "
+                  f"{os.path.getsize(filename) / 2**20:6.2f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+def bench_cache():
+    '''
+    Cold and warm compiles of a directory of programs (the good_syntax
+    examples and a few large generated ones) with the AST cache: cold,
+    each program is scanned and parsed and its AST saved, and warm, the
+    saved AST is loaded. Both the front end alone and the whole compile
+    (up to the assembly code) are timed.
+    '''
+    directory = tempfile.mkdtemp()
+    cache = os.path.join(directory, "cache")
+    os.makedirs(cache)
+    tests = os.path.dirname(os.path.abspath(__file__))
+    for filename in glob.glob(os.path.join(tests, "good_syntax", "*.while")):
+        shutil.copy(filename, directory)
+    statement = ("while x < 10 do x := (x + 1) * y; "
+                 "if [x = 5] and [y > 2] then y := y - 2 else skip fi od")
+    for n in [1000, 10000]:
+        with open(os.path.join(directory, f"generated{n}.while"), 'w') as f:
+            f.write(";\n".join([statement] * n))
+    programs = []
+    for filename in sorted(glob.glob(os.path.join(directory, "*.while"))):
+        with open(filename) as f:
+            name = os.path.basename(filename).replace(".while", "")
+            programs.append((name, f.read()))
+
+    def front_end(warm):
+        asts = []
+        for name, code in programs:
+            filename = cache_file(cache, name, code)
+            ast = load_ast(filename, code) if warm else None
+            if ast is None:
+                ast = Parser(list(Tokenize(code))).parse(
+                        build_pt=False, arena=AstArena())[1].root
+                save_ast(filename, ast, code)
+            asts.append(ast)
+        return asts
+    def compile(warm):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for ast in front_end(warm):
+                decorate_ast(ast)
+                cfg = CFG(ast)
+                optimizer = Optimizer(cfg)
+                RISC_V_CodeGenerator("f").generate(cfg.nodes, optimizer)
+    try:
+        size = sum(len(code) for _, code in programs)
+        print(f"{len(programs)} programs, {size / 2**20:.2f} MB of source:")
+        print(f"    front end, cold:  {timed(lambda: front_end(False)):8.4f} s")
+        print(f"    front end, warm:  {timed(lambda: front_end(True)):8.4f} s")
+        print(f"    compile, cold:    "
+              f"{timed(lambda: compile(False), repeat=1):8.4f} s")
+        print(f"    compile, warm:    "
+              f"{timed(lambda: compile(True), repeat=1):8.4f} s")
+    finally:
+        shutil.rmtree(directory)
+
+def bench_labels():
+    '''
+    Rendering the labeled code of programs of growing size (parsed into
+    an AstArena): collecting the label points, joining the labeled code
+    into one string, and streaming it to a file. The time per megabyte
+    should stay about the same as the programs grow.
+    '''
+    statement = ("while x < 10 do x := (x + 1) * y; {- step -}\n"
+                 "  if [x = 5] and [y > 2] then y := y - 2 else skip fi od")
+    with tempfile.NamedTemporaryFile(suffix='.while', delete=False) as f:
+        filename = f.name
+    try:
+        for megabytes in [1, 2, 4]:
+            code = ";\n".join([statement]
+                               * (megabytes * 2**20 // (len(statement) + 2)))
+            ast = Parser(list(Tokenize(code))).parse(
+                    build_pt=False, arena=AstArena())[1].root
+            decorate_ast(ast)
+            times = [timed(lambda: label_points(ast)),
+                     timed(lambda: insert_labels(ast, code)),
+                     timed(lambda: write_labels(ast, code, filename))]
+            print(f"{megabytes:>3} MB program:  "
+                  + ",  ".join(f"{name} {time:7.4f} s "
+                               f"({time / megabytes:6.4f} s/MB)"
+                               for name, time in zip(
+                                   ["collect", "join", "stream"], times)))
+    finally:
+        os.remove(filename)
+
+benchmarks = {
+    'arena': bench_arena,
+    'artifacts': bench_artifacts,
+    'blocks': bench_blocks,
+    'cache': bench_cache,
+    'comments': bench_comments,
+    'dominance': bench_dominance,
+    'expressions': bench_expressions,
+    'frequencies': bench_frequencies,
+    'hashcons': bench_hashcons,
+    'incremental': bench_incremental,
+    'labels': bench_labels,
+    'liveness': bench_liveness,
+    'parallel': bench_parallel,
+    'parse': bench_parse,
+    'reachability': bench_reachability,
+    'removal': bench_removal,
+    'snapshot': bench_snapshot,
+    'ssa': bench_ssa,
+    'traversal': bench_traversal,
+}
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("names", nargs="*",
+                           help="benchmarks to run (default: all): "
+                                + ", ".join(benchmarks))
+    args = argparser.parse_args()
+    for name in args.names:
+        if name not in benchmarks:
+            argparser.error(f"unknown benchmark '{name}'")
+    for name in args.names or benchmarks:
+        print(f"\n== {name} ==")
+        benchmarks[name]()
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scanner import Tokenize
+from parser import Parser
+from trees import decorate_ast
+from cfg import CFG
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture(scope="session")
+def good_syntax_programs():
+    """
+    The (filename, code) of every program in the good_syntax directory,
+    in order of filename.
+    """
+    directory = os.path.join(here, "good_syntax")
+    programs = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".while"):
+            with open(os.path.join(directory, filename)) as f:
+                programs.append((filename, f.read()))
+    return tuple(programs)
+
+def _build_ast(code, arena=None, context=None, decorate=True):
+    ast = Parser(list(Tokenize(code)), context=context).parse(
+            arena=arena)[1].root
+    if decorate and context is None:
+        decorate_ast(ast)
+    elif decorate:
+        context.decorate(ast)
+    return ast
+
+@pytest.fixture
+def build_ast():
+    """
+    A function returning the AST of the code of a program (of TreeNodes,
+    or in arena, an AstArena, if given), parsed and decorated in
+    context (a CompilationContext, see context.py) if given, and
+    decorated unless decorate is False.
+    """
+    return _build_ast
+
+def _build_cfg(code):
+    return CFG(_build_ast(code))
+
+@pytest.fixture
+def build_cfg():
+    """
+    A function returning the CFG of the code of a program, built from
+    its decorated AST (of TreeNodes, which cfg.entry.ast is the root of).
+    """
+    return _build_cfg
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trees import generate_dot_from_tree
+from artifacts import ArtifactWriter, write_file
+from optimizer import Optimizer
+
+code = ";\n".join(f"x{i % 3} := x{(i + 1) % 3} + {i}; "
+                  f"while x{i % 3} < 10 do x{i % 3} := x{i % 3} * 2 od"
+                  for i in range(500)) + ";\noutput := x0"
+
+def test_background_writer(tmp_path, build_cfg):
+    """
+    Test that the background writer thread writes the same files as
+    write_file(), including ones of more than one chunk of lines.
+    """
+    cfg = build_cfg(code)
+    ast = cfg.entry.ast
+    artifacts = ArtifactWriter(['ast-dot', 'cfg-dot'], background=True)
+    assert 'ast-dot' in artifacts and 'pt-dot' not in artifacts
+    generate_dot_from_tree(ast, str(tmp_path / "ast.dot"),
+                           artifacts.write_file)
+    cfg.generate_cfg_dot(str(tmp_path / "cfg.dot"), artifacts.write_file)
+    artifacts.write_file(str(tmp_path / "empty.txt"), [])
+    artifacts.close()
+    generate_dot_from_tree(ast, str(tmp_path / "ast_direct.dot"))
+    write_file(str(tmp_path / "cfg_direct.dot"), cfg.dot_lines())
+    ast_dot = (tmp_path / "ast.dot").read_text()
+    assert ast_dot.count("\n") > ArtifactWriter.chunk_lines
+    assert ast_dot == (tmp_path / "ast_direct.dot").read_text()
+    assert ((tmp_path / "cfg.dot").read_text()
+            == (tmp_path / "cfg_direct.dot").read_text())
+    assert (tmp_path / "empty.txt").read_text() == ""
+
+def test_optimizer_report(capsys, build_cfg):
+    """
+    Test that an Optimizer without a report prints nothing, and
+    computes the same live variables and CFG as one with a report.
+    """
+    reported = build_cfg(code)
+    lines = []
+    reported_optimizer = Optimizer(reported, report=lines.append)
+    silent = build_cfg(code)
+    silent_optimizer = Optimizer(silent, report=None)
+    assert capsys.readouterr().out == ""
+    assert any(line.startswith("LV_in(0)") for line in lines)
+    assert silent_optimizer.IN == reported_optimizer.IN
+    assert silent_optimizer.OUT == reported_optimizer.OUT
+    assert ([node.label for node in silent.nodes]
+            == [node.label for node in reported.nodes])
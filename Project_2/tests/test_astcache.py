@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trees import AstArena, decorate_ast, insert_labels
+from astcache import cache_file, load_ast, save_ast, remove_stale
+
+code = ("x := 12345678901234567890; y := x - 1; "
+        "while [x > 0] and [not [y = 0]] do x := x - 1 od; "
+        "if x <= y then skip else y := (x + y) * 2 fi")
+
+def test_round_trip(tmp_path, build_ast):
+    """
+    Test that a saved AST loads back with the same nodes, in a frozen
+    arena that can be decorated and labeled like the original.
+    """
+    ast = build_ast(code, AstArena(), decorate=False)
+    filename = cache_file(str(tmp_path), "prog", code)
+    save_ast(filename, ast, code)
+    loaded = load_ast(filename, code)
+    assert loaded.arena.frozen
+    assert repr(loaded) == repr(ast)
+    assert decorate_ast(loaded) == decorate_ast(ast)
+    assert insert_labels(loaded, code) == insert_labels(ast, code)
+    # changing the structure thaws the arena into arrays
+    loaded.children = list(reversed(loaded.children))
+    assert not loaded.arena.frozen
+    assert loaded.children[1].children[1].value == 12345678901234567890
+
+def test_stale_files(tmp_path, build_ast):
+    """
+    Test that a cache file is only used for the exact text it was saved
+    for, by the same version of the format, and that the files of the
+    earlier texts of a program are removed.
+    """
+    directory = str(tmp_path)
+    old = cache_file(directory, "prog", code)
+    save_ast(old, build_ast(code, AstArena(), decorate=False), code)
+    edited = code.replace("12345", "54321")
+    new = cache_file(directory, "prog", edited)
+    assert new != old
+    assert load_ast(new, edited) is None
+    # the file for one text does not pass for another
+    os.rename(old, new)
+    assert load_ast(new, edited) is None
+    save_ast(old, build_ast(code, AstArena(), decorate=False), code)
+    save_ast(new, build_ast(edited, AstArena(), decorate=False), edited)
+    remove_stale(directory, "prog", new)
+    assert os.listdir(directory) == [os.path.basename(new)]
+    # nor does a file with another version number, or a truncated one
+    with open(new, 'r+b') as f:
+        f.seek(4)
+        f.write(b'\xff')
+    assert load_ast(new, edited) is None
+    save_ast(new, build_ast(edited, AstArena(), decorate=False), edited)
+    with open(new, 'r+b') as f:
+        f.truncate(os.path.getsize(new) - 1)
+    assert load_ast(new, edited) is None
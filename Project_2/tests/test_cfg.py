@@ -0,0 +1,227 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from optimizer import Optimizer
+from codegen import RISC_V_CodeGenerator
+
+code = ("x := a; y := x + 1; "
+        "while y < 10 do y := y * 2; x := x + y od; "
+        "if x > 5 then z := x else z := y; skip fi; "
+        "output := z")
+
+def test_basic_blocks(build_cfg):
+    """
+    Test that straight-line runs of statements (and an if condition
+    after them) form one block, that while conditions and branch
+    targets start blocks, and that the block edges follow the CFG.
+    """
+    blocks = build_cfg(code).basic_blocks()
+    assert [[node.label for node in block.nodes] for block in blocks] == [
+            ["entry"], [0, 1], [2], [3, 4], [5], [6], [7, 8], [9], ["exit"]]
+    assert [[succ.label for succ in block.succ] for block in blocks] == [
+            [0], [2], [3, 5], [2], [6, 7], [9], [9], ["exit"], []]
+    assert [[pred.label for pred in block.pred] for block in blocks] == [
+            [], ["entry"], [0, 3], [2], [2], [5], [5], [6, 7], [9]]
+    assert [block.type for block in blocks] == [
+            "entry", "other", "condition", "other", "condition", "other",
+            "other", "other", "exit"]
+    singles = build_cfg(code).basic_blocks(single=True)
+    assert [block.label for block in singles] == (
+            ["entry"] + list(range(10)) + ["exit"])
+
+def test_block_liveness(build_cfg):
+    """
+    Test that solving liveness per block gives the same sets for every
+    statement as solving it per statement, in no more iterations, and
+    that the assembly only labels the first statement of each block.
+    """
+    by_block = Optimizer(build_cfg(code), report=None)
+    by_statement = Optimizer(build_cfg(code), report=None, basic_blocks=False)
+    assert by_block.IN == by_statement.IN
+    assert by_block.OUT == by_statement.OUT
+    assert by_block.iterations <= by_statement.iterations
+    assert len(by_block.blocks) < len(by_statement.blocks)
+    assert by_block.IN["entry"] == {"a"}
+
+    cfg = build_cfg(code)
+    optimizer = Optimizer(cfg, report=None)
+    assembly = RISC_V_CodeGenerator().generate(cfg.nodes, optimizer)
+    labels = [line[:-1] for line in assembly.split("\n")
+              if line.startswith("label_")]
+    assert labels == [f"label_{block.label}"
+                      for block in cfg.basic_blocks()]
+
+def _random_program(rng, depth=0):
+    """
+    A random program of assignments, ifs and whiles over a few
+    variables.
+    """
+    names = ["a", "b", "c", "d", "output"]
+    statements = []
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.random() if depth < 3 else 0
+        if kind < 0.5:
+            statements.append(f"{rng.choice(names)} := "
+                              f"{rng.choice(names)} + {rng.choice(names)}")
+        elif kind < 0.75:
+            statements.append(f"if {rng.choice(names)} < {rng.choice(names)} "
+                              f"then {_random_program(rng, depth + 1)} "
+                              f"else {_random_program(rng, depth + 1)} fi")
+        else:
+            statements.append(f"while {rng.choice(names)} < "
+                              f"{rng.choice(names)} do "
+                              f"{_random_program(rng, depth + 1)} od")
+    return "; ".join(statements)
+
+def test_worklist_liveness(good_syntax_programs, build_cfg):
+    """
+    Test that the worklist solver gives exactly the same sets as
+    sweeping over all the blocks (per block and per statement), on the
+    good_syntax programs and on random ones, evaluating no more blocks.
+    """
+    programs = [code for _, code in good_syntax_programs]
+    rng = random.Random(554)
+    programs += [_random_program(rng) for _ in range(200)]
+    for program in programs:
+        for blocks in [True, False]:
+            worklist = Optimizer(build_cfg(program), report=None,
+                                 basic_blocks=blocks)
+            sweeps = Optimizer(build_cfg(program), report=None,
+                               basic_blocks=blocks, solver="round-robin")
+            assert worklist.IN == sweeps.IN
+            assert worklist.OUT == sweeps.OUT
+            assert worklist.block_IN == sweeps.block_IN
+            assert worklist.block_OUT == sweeps.block_OUT
+            assert worklist.evaluations <= sweeps.evaluations
+            assert worklist.iterations <= sweeps.iterations
+
+def test_reachability(good_syntax_programs, build_cfg):
+    """
+    Test that the reachability index gives the same nodes as searching
+    the CFG from each node, for every good_syntax program, and that it
+    is rebuilt after nodes are removed.
+    """
+    for filename, code in good_syntax_programs:
+        cfg = build_cfg(code)
+        for removed in [False, True]:
+            reachability = cfg.reachability()
+            assert cfg.reachability() is reachability
+            for node in cfg.nodes:
+                successors = node.get_all_successors()
+                assert (reachability.successors(node)
+                        == sorted(successors, key=lambda node: node.id))
+                assert (set(reachability.predecessors(node))
+                        == set(node.get_all_predecessors()))
+                assert reachability.in_loop(node) == (node in successors)
+                assert all(reachability.reaches(node, succ)
+                           for succ in successors)
+            assert not reachability.reaches(cfg.exit, cfg.entry)
+            if not removed:
+                count = len(cfg.nodes)
+                Optimizer(cfg, report=None)
+                assert ((cfg.reachability() is reachability)
+                        == (len(cfg.nodes) == count))
+
+def _reached(root, neighbors, avoid=None):
+    if root is avoid:
+        return set()
+    reached = {root}
+    stack = [root]
+    while stack:
+        for node in neighbors(stack.pop()):
+            if node is not avoid and node not in reached:
+                reached.add(node)
+                stack.append(node)
+    return reached
+
+def test_dominators(good_syntax_programs, build_cfg):
+    """
+    Test the dominators, post-dominators and dominance frontiers of the
+    good_syntax programs against their definitions: a dominates b when
+    b cannot be reached from the entry without going through a.
+    """
+    for filename, code in good_syntax_programs:
+        cfg = build_cfg(code)
+        for tree, root, neighbors in [
+                (cfg.dominators(), cfg.entry, lambda node: node.succ),
+                (cfg.post_dominators(), cfg.exit, lambda node: node.pred)]:
+            for a in cfg.nodes:
+                reached = _reached(root, neighbors, avoid=a)
+                dominated = {b for b in cfg.nodes if b is a or b not in reached}
+                assert {b for b in cfg.nodes
+                        if tree.dominates(a, b)} == dominated
+            assert tree.idom(root) is None
+            for node in cfg.nodes:
+                if node is not root:
+                    assert tree.dominates(tree.idom(node), node)
+                    assert tree.depth(node) == tree.depth(tree.idom(node)) + 1
+        dominators = cfg.dominators()
+        for a in cfg.nodes:
+            assert set(dominators.frontier(a)) == {
+                    b for b in cfg.nodes
+                    if any(dominators.dominates(a, pred) for pred in b.pred)
+                    and not (dominators.dominates(a, b) and a is not b)}
+
+def test_loops(build_cfg):
+    """
+    Test the loop nesting forest (headers, bodies, exits and depths)
+    of nested and sequential while loops, and that it is rebuilt after
+    nodes are removed.
+    """
+    cfg = build_cfg("x := 0; "
+                    "while x < 10 do "
+                    "    y := 0; "
+                    "    while y < x do "
+                    "        while y < 3 do y := y + 1 od; y := y + 2 "
+                    "    od; "
+                    "    if x > 4 then skip else x := x + 1 fi "
+                    "od; "
+                    "while x > 0 do x := x - 1 od; output := x")
+    loops = cfg.loops()
+    assert cfg.loops() is loops
+    assert [(loop.header.label, loop.depth,
+             [node.label for node in loop.body()],
+             [(a.label, b.label) for a, b in loop.exits()])
+            for loop in loops.loops] == [
+            (1, 1, list(range(1, 10)), [(1, 10)]),
+            (10, 1, [10, 11], [(10, 12)]),
+            (3, 2, [3, 4, 5, 6], [(3, 7)]),
+            (4, 3, [4, 5], [(4, 6)])]
+    assert [loop.header.label for loop in loops.roots] == [1, 10]
+    assert [[child.header.label for child in loop.children]
+            for loop in loops.loops] == [[3], [], [4], []]
+    assert [loops.depth(node) for node in cfg.nodes] == [
+            0, 0, 1, 1, 2, 3, 3, 2, 1, 1, 1, 1, 1, 0, 0]
+    assert loops.loop(cfg.nodes[5]).header.label == 4
+    assert loops.loop(cfg.entry) is None
+    Optimizer(cfg, report=None)
+    assert cfg.loops() is not loops
+    assert [loop.header.label for loop in cfg.loops().loops] == [1, 10, 3, 4]
+
+def _edges(cfg):
+    return [(node.label, [succ.label for succ in node.succ],
+             [pred.label for pred in node.pred]) for node in cfg.nodes]
+
+def test_remove_nodes(build_cfg):
+    """
+    Test that removing a batch of nodes gives the same CFG as removing
+    them one at a time (including the branches and loops they leave
+    empty), and that the nodes left are numbered densely again.
+    """
+    program = ";\n".join("x := 1; skip; while x < 3 do skip; y := x od; "
+                         "if x > 1 then skip else y := 2 fi"
+                         for i in range(50)) + "; output := x"
+    batch = build_cfg(program)
+    one_by_one = build_cfg(program)
+    assert [node.id for node in batch.nodes] == list(range(len(batch.nodes)))
+    dead = [node for node in batch.nodes
+            if node.type == "other" and node.content != "output := x"]
+    assert batch.remove_nodes(dead) > len(dead)
+    for node in [node for node in one_by_one.nodes
+                 if node.type == "other" and node.content != "output := x"]:
+        one_by_one.remove_node(node)
+    assert _edges(batch) == _edges(one_by_one)
+    assert [node.label for node in batch.nodes] == ["entry", 400, "exit"]
+    assert [node.id for node in batch.nodes] == [0, 1, 2]
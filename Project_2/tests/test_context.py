@@ -0,0 +1,58 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scanner import Tokenize
+from parser import Parser
+from trees import dot_lines_from_tree
+from context import CompilationContext
+from cfg import CFG
+from optimizer import Optimizer
+from codegen import RISC_V_CodeGenerator
+
+def _named(programs):
+    """
+    The (name, code) of the programs, named after their files.
+    """
+    return [(filename.replace('.while', '').replace('-', '_'), code)
+            for filename, code in programs]
+
+def _compile(name, code):
+    """
+    Compile a program in a context of its own, returning the lines of
+    the .dot file of its decorated AST and its assembly code.
+    """
+    context = CompilationContext(name, log=None)
+    ast = Parser(list(Tokenize(code)), context=context).parse()[1].root
+    context.decorate(ast)
+    dot = list(dot_lines_from_tree(ast))
+    cfg = CFG(ast, context)
+    optimizer = Optimizer(cfg, report=None, context=context)
+    assembly = RISC_V_CodeGenerator(context=context).generate(cfg.nodes,
+                                                             optimizer)
+    assert context.passes['codegen'].name == name
+    return dot, assembly
+
+def test_independent_compilations(capsys, good_syntax_programs):
+    """
+    Test that a compilation gives the same output (down to node ids)
+    whatever was compiled before it, and prints nothing without a log.
+    """
+    programs = _named(good_syntax_programs)
+    first = [_compile(name, code) for name, code in programs]
+    again = [_compile(name, code) for name, code in reversed(programs)]
+    assert first == list(reversed(again))
+    assert capsys.readouterr().out == ""
+
+def test_concurrent_compilations(good_syntax_programs):
+    """
+    Test that programs compiled concurrently on a thread pool give the
+    same output as when they are compiled one by one.
+    """
+    programs = _named(good_syntax_programs) * 3
+    sequential = [_compile(name, code) for name, code in programs]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        concurrent = list(pool.map(lambda program: _compile(*program),
+                                   programs))
+    assert concurrent == sequential
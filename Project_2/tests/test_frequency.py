@@ -0,0 +1,177 @@
+import math
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from optimizer import Optimizer
+from codegen import RISC_V_CodeGenerator
+from test_ssa import _run
+
+code = ("x := 0; "
+        "while x < 10 do "
+        "    y := 0; "
+        "    while y < x do y := y + 1 od; "
+        "    if x = 3 then z := 1 else z := 2 fi; "
+        "    x := x + 1 "
+        "od; "
+        "output := z")
+
+def _signed(value):
+    value &= (1 << 64) - 1
+    return value - (1 << 64) if value >> 63 else value
+
+def _execute(assembly, array, steps=200000, counts=None):
+    """
+    Run the assembly code (the subset of RISC-V the code generator
+    emits) on the variable array, returning the array afterwards, or
+    None if it takes more than steps instructions. If counts is given
+    (a dict), the instructions run are counted in it by opcode, with
+    branches taken counted as "taken".
+    """
+    lines = [line.split("#")[0].strip() for line in assembly.split("\n")]
+    labels = {line[:-1]: i for i, line in enumerate(lines)
+              if line.endswith(":")}
+    registers = {"x0": 0}
+    array = list(array)
+    stack = {}
+    def load(address):
+        offset, base = address[:-1].split("(")
+        if base == "a0":
+            return array[int(offset) // 8]
+        return stack[int(offset) // 8]
+    def store(address, value):
+        offset, base = address[:-1].split("(")
+        if base == "a0":
+            array[int(offset) // 8] = value
+        else:
+            stack[int(offset) // 8] = value
+    binary = {"add": lambda a, b: a + b, "sub": lambda a, b: a - b,
+              "mul": lambda a, b: a * b, "slt": lambda a, b: int(a < b),
+              "and": lambda a, b: a & b, "or": lambda a, b: a | b}
+    pc = labels[next(label for label in labels if not label.startswith("label_"))]
+    while steps:
+        steps -= 1
+        pc += 1
+        line = lines[pc]
+        if not line or line.endswith(":") or line.startswith("."):
+            continue
+        op, _, rest = line.partition(" ")
+        args = [arg.strip() for arg in rest.split(",")] if rest else []
+        value = lambda reg: registers.get(reg, 0)
+        if counts is not None:
+            counts[op] = counts.get(op, 0) + 1
+        if op == "ret":
+            return array
+        elif op == "ld":
+            registers[args[0]] = load(args[1])
+        elif op == "sd":
+            store(args[1], value(args[0]))
+        elif op == "li":
+            registers[args[0]] = int(args[1])
+        elif op == "mv":
+            registers[args[0]] = value(args[1])
+        elif op in binary:
+            registers[args[0]] = _signed(binary[op](value(args[1]),
+                                                    value(args[2])))
+        elif op == "seqz":
+            registers[args[0]] = int(value(args[1]) == 0)
+        elif op == "xori":
+            registers[args[0]] = value(args[1]) ^ int(args[2])
+        elif op == "addi":
+            registers[args[0]] = value(args[1]) + int(args[2])
+        elif op == "beqz":
+            if value(args[0]) == 0:
+                pc = labels[args[1]]
+                if counts is not None:
+                    counts["taken"] = counts.get("taken", 0) + 1
+        elif op == "bnez":
+            if value(args[0]) != 0:
+                pc = labels[args[1]]
+                if counts is not None:
+                    counts["taken"] = counts.get("taken", 0) + 1
+        elif op == "j":
+            pc = labels[args[0]]
+        else:
+            raise ValueError(f"unknown instruction {line}")
+        registers["x0"] = 0
+    return None
+
+def test_frequencies(build_cfg):
+    """
+    Test the estimated frequencies of nested loops and branches: the
+    loops are assumed to go around 1 / (1 - 0.88) times per entry, and
+    an equality to be false 84% of the time.
+    """
+    cfg = build_cfg(code)
+    frequencies = cfg.frequencies()
+    assert cfg.frequencies() is frequencies
+    expected = [1, 1, 1 / 0.12, 0.88 / 0.12, 0.88 / 0.12 ** 2,
+                0.88 ** 2 / 0.12 ** 2, 0.88 / 0.12, 0.16 * 0.88 / 0.12,
+                0.84 * 0.88 / 0.12, 0.88 / 0.12, 1, 1]
+    assert all(math.isclose(frequencies.frequency(node), freq)
+               for node, freq in zip(cfg.nodes, expected))
+    weights = frequencies.variable_weights()
+    assert weights["y"] > weights["x"] > weights["z"] > weights["output"]
+    assert [block.label for block in frequencies.layout(
+            cfg.basic_blocks())] == ["entry", 0, 1, 2, 3, 4, 5, 7, 8, 6, 9,
+                                     "exit"]
+
+def test_flow_conservation(good_syntax_programs, build_cfg):
+    """
+    Test that on every good_syntax program, the frequency of each node
+    (other than the entry node) is the sum of those of its incoming
+    edges, and that of each node the sum of those of its outgoing edges.
+    """
+    for filename, program in good_syntax_programs:
+        cfg = build_cfg(program)
+        frequencies = cfg.frequencies()
+        for node in cfg.nodes:
+            freq = frequencies.frequency(node)
+            if node is not cfg.entry:
+                incoming = sum(frequencies.edge_frequency(pred,
+                                                          pred.succ.index(node))
+                               for pred in node.pred)
+                assert math.isclose(freq, incoming, rel_tol=1e-9), filename
+            if node is not cfg.exit:
+                outgoing = sum(frequencies.edge_frequency(node, i)
+                               for i in range(len(node.succ)))
+                assert math.isclose(freq, outgoing, rel_tol=1e-9), filename
+
+def test_frequency_codegen(good_syntax_programs, build_cfg):
+    """
+    Test that the assembly code laid out and register-allocated by the
+    estimated frequencies computes the same output as the CFG, for
+    every good_syntax program on random inputs, and that with more
+    variables than s registers, the ones used in loops are not spilled.
+    """
+    rng = random.Random(554)
+    for filename, program in good_syntax_programs:
+        cfg = build_cfg(program)
+        optimizer = Optimizer(cfg, report=None)
+        codegen = RISC_V_CodeGenerator("f")
+        assembly = codegen.generate(cfg.nodes, optimizer, cfg.frequencies())
+        original = build_cfg(program)
+        for _ in range(3):
+            inputs = {var: rng.randint(0, 12) for var in optimizer.IN["entry"]}
+            expected = _run(original, {**{var: 0 for var in codegen.variables},
+                                       **inputs})
+            if expected is None:
+                continue
+            array = _execute(assembly, [inputs.get(var, 0)
+                                        for var in codegen.variables])
+            assert array is not None, filename
+            assert (array[codegen.variables.index("output")]
+                    == expected.get("output", 0)), filename
+
+    program = (";\n".join(f"v{i} := {i}" for i in range(14))
+               + "; while v0 < 1000 do v0 := "
+               + " + ".join(f"v{i}" for i in range(11)) + " od; output := "
+               + " + ".join(f"v{i}" for i in range(14)))
+    cfg = build_cfg(program)
+    optimizer = Optimizer(cfg, report=None)
+    codegen = RISC_V_CodeGenerator("f")
+    codegen.generate(cfg.nodes, optimizer, cfg.frequencies())
+    assert codegen.vars_in_memory
+    assert not set(codegen.vars_in_memory) & {f"v{i}" for i in range(11)}
@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hashcons import ExpressionTable
+from cfg import CFG
+
+def test_equal_expressions_are_shared(build_ast):
+    """
+    Test that structurally equal expressions become the same node,
+    that different ones do not, and that labeled conditions stay apart.
+    """
+    table = ExpressionTable()
+    ast = table.intern(build_ast("x := (i + 1) * y; z := i + 1; "
+                                 "while i < n do i := i + 1 od; "
+                                 "while i < n do w := 1 + i od"))
+    first, rest = ast.children
+    second, rest = rest.children
+    loop1, loop2 = rest.children
+    assert first.children[1].children[0] is second.children[1]
+    assert loop1.children[1].children[1] is second.children[1]
+    assert loop2.children[1].children[1] is not second.children[1]
+    # the conditions are labeled differently, but share their operands
+    assert loop1.children[0] is not loop2.children[0]
+    assert loop1.children[0].l != loop2.children[0].l
+    assert loop1.children[0].children[1] is loop2.children[0].children[1]
+    assert table.hits == 12
+
+def test_digests_are_structural(build_ast):
+    """
+    Test that equal expressions interned by different tables have the
+    same digest, and different ones different digests.
+    """
+    digests = []
+    for code in ["x := a * (b - 2)", "y := a * (b - 2)", "x := a * (b - 3)"]:
+        table = ExpressionTable()
+        ast = table.intern(build_ast(code))
+        digests.append(table.digest(ast.children[1]))
+    assert digests[0] == digests[1] != digests[2]
+
+def test_cfg_unchanged(good_syntax_programs, build_ast):
+    """
+    Test that the CFG of a program is the same after interning.
+    """
+    code = dict(good_syntax_programs)['madprimes.while']
+    def edges(cfg):
+        return [(node.label, node.content, [s.label for s in node.succ])
+                for node in cfg.nodes]
+    table = ExpressionTable()
+    interned = table.intern(build_ast(code))
+    assert table.hits > 0
+    assert edges(CFG(interned)) == edges(CFG(build_ast(code)))
@@ -0,0 +1,114 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scanner import Tokenize, LineIndex
+from parser import Parser
+from trees import decorate_ast
+from incremental import IncrementalParser
+
+def _shape(node):
+    """
+    A nested tuple describing a decorated AST, ignoring node ids.
+    """
+    return (node.type, node.value, node.index, node.l,
+            [_shape(c) for c in node.children])
+
+def _full_parse(code):
+    """
+    The tokens and decorated AST shape from a full parse of code.
+    """
+    tokens = list(Tokenize(code))
+    ast = Parser(tokens, LineIndex(code)).parse()[1].root
+    decorate_ast(ast)
+    return tokens, _shape(ast)
+
+def test_edits_match_full_parse(good_syntax_programs):
+    """
+    Test that the tokens and decorated AST after each of a series of
+    edits match those of a full parse, and that statements away from
+    an edit are reused.
+    """
+    code = dict(good_syntax_programs)['example6-collatz.while']
+    front_end = IncrementalParser(code)
+    edits = [
+        ("steps :=", "count :="),        # rename a variable
+        ("3*n+1", "3 * (n + 1) - 2"),    # rewrite an expression
+        (":= 0", ":= 0 {- start -}"),    # add a comment
+        ("output := steps", "skip; output := steps"),  # add a statement
+        ("(n + 1)", "(n + 1"),           # an invalid edit ...
+        ("(n + 1", "(n + 1)"),           # ... and its undo
+    ]
+    valid = True
+    for old, new in edits:
+        start = code.index(old)
+        if valid:
+            first_statement = front_end.statements[0]
+            last_statement = front_end.statements[-1]
+        code = code[:start] + new + code[start + len(old):]
+        try:
+            expected = _full_parse(code)
+        except SyntaxError:
+            with pytest.raises(SyntaxError):
+                front_end.edit(start, start + len(old), new)
+            valid = False
+            continue
+        front_end.edit(start, start + len(old), new)
+        assert (front_end.tokens, _shape(front_end.ast)) == expected
+        # (after an invalid edit, the program is parsed in full again)
+        if valid and start > first_statement.index:
+            assert front_end.statements[0] is first_statement
+        if old == "steps :=":
+            assert front_end.statements[-1] is last_statement
+        valid = True
+
+def test_edit_in_long_program():
+    """
+    Test inserting and deleting statements in the middle of a long
+    program.
+    """
+    code = ";\n".join(f"x{i} := x{i + 1} * {i}" for i in range(200))
+    front_end = IncrementalParser(code)
+    middle = code.index("x100 :=")
+    front_end.edit(middle, middle, "while y < 3 do y := y + 1 od;\n")
+    code = code[:middle] + "while y < 3 do y := y + 1 od;\n" + code[middle:]
+    assert (front_end.tokens, _shape(front_end.ast)) == _full_parse(code)
+    assert len(front_end.statements) == 201
+    end = code.index("x110 :=")
+    front_end.edit(middle, end, "")
+    code = code[:middle] + code[end:]
+    assert (front_end.tokens, _shape(front_end.ast)) == _full_parse(code)
+    assert len(front_end.statements) == 190
+
+def test_edits_before_reading():
+    """
+    Test a series of edits back and forth in a long program, with the
+    tokens and AST read only after the last one.
+    """
+    code = ";\n".join(f"x{i} := x{i + 1} * {i}" for i in range(200))
+    front_end = IncrementalParser(code)
+    for i, text in [(150, "y"), (20, "(y + 2)"), (180, "3"), (0, "z"),
+                    (199, "(y - 1)")]:
+        start = code.index(f"* {i}") + 2
+        end = start + len(str(i))
+        front_end.edit(start, end, text)
+        code = code[:start] + text + code[end:]
+    assert (front_end.tokens, _shape(front_end.ast)) == _full_parse(code)
+
+def test_truncating_edits():
+    """
+    Test that edits which cut a program off in the middle of a
+    statement raise a SyntaxError, and that the program can then be
+    edited back into a valid one.
+    """
+    code = "x := 1;\ny := (x + 2) * 3;\nz := y"
+    for cut in ["y := (x + 2) * 3;\nz := y", "(x + 2) * 3;\nz := y",
+                "x + 2) * 3;\nz := y", "3;\nz := y"]:
+        front_end = IncrementalParser(code)
+        start = code.index(cut)
+        with pytest.raises(SyntaxError):
+            front_end.edit(start, len(code), "")
+        front_end.edit(start, start, cut)
+        assert (front_end.tokens, _shape(front_end.ast)) == _full_parse(code)
@@ -22,4 +22,183 @@ def test_bad_syntax():
         # Run the compiler.py script and capture output
         result = subprocess.run(['python', 'compiler.py', filepath],
                                 capture_output=True, text=True)
-        assert result.returncode != 0, f"File {filename} should have returned an error but did not."
\ No newline at end of file
+        assert result.returncode != 0, f"File {filename} should have returned an error but did not."
+
+
+def _shape(node):
+    """
+    A nested (type, value, children) tuple describing a tree, ignoring
+    the node ids (which depend on how many nodes were made before).
+    """
+    return (node.type, node.value, [_shape(c) for c in node.children])
+
+def _parse_or_error(tokens, code):
+    """
+    The shapes of the PT and AST produced for tokens, or the text of
+    the error raised while parsing them.
+    """
+    from parser import Parser
+    from scanner import LineIndex
+    try:
+        pt, ast = Parser(tokens, LineIndex(code)).parse()
+    except (SyntaxError, RuntimeError, TypeError) as e:
+        return str(e)
+    return (_shape(pt.root), _shape(ast.root))
+
+def test_streaming_parser_matches_list_parser():
+    """
+    Test that parsing straight from the Tokenize generator gives the
+    same trees (or the same errors) as parsing a list of the tokens.
+    """
+    from scanner import Tokenize
+    here = os.path.dirname(os.path.abspath(__file__))
+    for directory in ['good_syntax', 'bad_syntax']:
+        directory = os.path.join(here, directory)
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.while'):
+                continue
+            with open(os.path.join(directory, filename)) as f:
+                code = f.read()
+            try:
+                tokens = list(Tokenize(code))
+            except RuntimeError:
+                continue
+            expected = _parse_or_error(tokens, code)
+            assert _parse_or_error(Tokenize(code), code) == expected, filename
+
+def test_streaming_parser_buffer_is_bounded():
+    """
+    Test that the parser only holds a few tokens of a streamed program.
+    """
+    from parser import Parser, TokenWindow
+    from scanner import Tokenize
+    code = "x := 0;\n" * 300 + "y := x"
+    parser = Parser(Tokenize(code))
+    assert isinstance(parser.tokens, TokenWindow)
+    high_water = 0
+    peek = parser.peek
+    def watched_peek(expected_type):
+        nonlocal high_water
+        high_water = max(high_water, len(parser.tokens.buffer))
+        return peek(expected_type)
+    parser.peek = watched_peek
+    pt, ast = parser.parse()
+    assert parser.tokens.count == 300 * 4 + 3
+    assert high_water <= 4
+
+def test_ast_only_parse(good_syntax_programs):
+    """
+    Test that parse(build_pt=False) builds the same AST as a full parse
+    and that build_parse_tree() rebuilds the same parse tree.
+    """
+    from parser import Parser, build_parse_tree
+    from scanner import Tokenize
+    programs = dict(good_syntax_programs)
+    for filename in ['example1-factorial.while', 'example6-collatz.while',
+                     'primescounter.while', 'pseudomatrices.while']:
+        code = programs[filename]
+        tokens = list(Tokenize(code))
+        pt, ast = Parser(tokens).parse()
+        empty, ast_only = Parser(tokens).parse(build_pt=False)
+        assert empty.root is None
+        assert _shape(ast_only.root) == _shape(ast.root), filename
+        rebuilt = build_parse_tree(Tokenize(code))
+        assert _shape(rebuilt.root) == _shape(pt.root), filename
+
+def _values(node):
+    """
+    An AST as a nested tuple of node values.
+    """
+    if not node.children:
+        return node.value
+    return (node.value, *[_values(c) for c in node.children])
+
+def test_operator_chains(build_ast):
+    """
+    Test that chains of operators parse with the usual precedence and
+    left associativity.
+    """
+    assert _values(build_ast("x := a - b - c * d * e + f",
+                             decorate=False)) == (
+            ':=', 'x', ('+', ('–', ('–', 'a', 'b'),
+                                  ('*', ('*', 'c', 'd'), 'e')), 'f'))
+    assert _values(build_ast("x := (a + b) * c * (d - e)",
+                             decorate=False)) == (
+            ':=', 'x', ('*', ('*', ('+', 'a', 'b'), 'c'),
+                        ('–', 'd', 'e')))
+    assert _values(build_ast("if [a < b] or [c = d] and [e > f] "
+                             "or not [x <= y] then skip else skip fi",
+                             decorate=False)) == (
+            'IF', ('OR', ('OR', ('<', 'a', 'b'),
+                                ('AND', ('=', 'c', 'd'), ('>', 'e', 'f'))),
+                         ('NOT', ('<=', 'x', 'y'))),
+            'skip', 'skip')
+
+def test_long_operator_chain(build_ast):
+    """
+    Test that a chain of operators much longer than the recursion limit
+    parses into a left-deep AST.
+    """
+    n = 5 * sys.getrecursionlimit()
+    code = "x := " + " + ".join(f"y{i}" for i in range(n))
+    node = build_ast(code, decorate=False).children[1]
+    for i in reversed(range(1, n)):
+        assert node.type == 'add'
+        assert node.children[1].value == f"y{i}"
+        node = node.children[0]
+    assert node.value == "y0"
+
+def test_arena_ast(good_syntax_programs):
+    """
+    Test that an AST built into an AstArena has the same nodes,
+    labels, labeled code and CFG as one built from TreeNodes.
+    """
+    from parser import Parser
+    from scanner import Tokenize
+    from trees import AstArena, decorate_ast, insert_labels
+    from cfg import CFG
+    def labeled(node):
+        return (node.type, node.value, node.index, node.l,
+                [labeled(c) for c in node.children])
+    def edges(cfg):
+        return [(node.label, node.content, [s.label for s in node.succ])
+                for node in cfg.nodes]
+    programs = dict(good_syntax_programs)
+    for filename in ['example1-factorial.while', 'example6-collatz.while',
+                     'primescounter.while', 'pseudomatrices.while']:
+        code = programs[filename]
+        tokens = list(Tokenize(code))
+        ast = Parser(tokens).parse()[1].root
+        arena = AstArena()
+        arena_ast = Parser(tokens).parse(arena=arena)[1].root
+        assert arena.contiguous
+        assert (sorted(arena.nodes(arena_ast.handle))
+                == sorted(arena.preorder(arena_ast.handle))
+                == list(range(len(arena))))
+        assert decorate_ast(arena_ast) == decorate_ast(ast)
+        assert labeled(arena_ast) == labeled(ast), filename
+        assert insert_labels(arena_ast, code) == insert_labels(ast, code)
+        assert edges(CFG(arena_ast)) == edges(CFG(ast))
+
+def test_insert_labels(tmp_path):
+    """
+    Test that the labeled code keeps all of the source, including what
+    follows the last label, and that write_labels() writes the same.
+    """
+    from parser import Parser
+    from scanner import Tokenize
+    from trees import decorate_ast, insert_labels, label_points, write_labels
+    code = ("x := 1; {- loop -}\n"
+            "while x < 10 do x := (x + 1) * 2 od;\n"
+            "if x = 0 then skip else y := (x - 1) fi {- done -}\n")
+    ast = Parser(list(Tokenize(code))).parse()[1].root
+    decorate_ast(ast)
+    labeled = ("x := 1 {- LABEL 0 -}; {- loop -}\n"
+               "while x < 10 {- LABEL 1 -} do x := (x + 1) * 2 {- LABEL 2 -} "
+               "od;\n"
+               "if x = 0 {- LABEL 3 -} then skip {- LABEL 4 -} "
+               "else y := (x - 1 {- LABEL 5 -}) fi {- done -}\n")
+    assert [label for _, label in label_points(ast)] == list(range(6))
+    assert insert_labels(ast, code) == (labeled, len(code))
+    write_labels(ast, code, tmp_path / "labeled.while")
+    assert (tmp_path / "labeled.while").read_text() == labeled
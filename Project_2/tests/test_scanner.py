@@ -3,7 +3,7 @@ import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scanner import Tokenize
+from scanner import Tokenize, TokenBuffer, TokenizeFile, LineIndex
 
 
 def test_bad_syntax():
@@ -60,4 +60,101 @@ def test_good_syntax():
             pass
         except RuntimeError as e:
             pytest.fail(f"File {filename} with content '{content.strip()}' "
-                       f"raised an unexpected RuntimeError: {e}")
\ No newline at end of file
+                       f"raised an unexpected RuntimeError: {e}")
+
+def test_token_buffer_matches_tokenize(good_syntax_programs):
+    """
+    Test that the Token views of a TokenBuffer are identical to the
+    Tokens yielded by Tokenize for every file in the good_syntax
+    directory.
+    """
+    assert len(good_syntax_programs) > 0, "No .while files found in good_syntax directory"
+
+    for filename, content in good_syntax_programs:
+        assert list(TokenBuffer(content)) == list(Tokenize(content)), (
+                f"TokenBuffer and Tokenize disagree on {filename}")
+
+    big = TokenBuffer("x := 92233720358547758070000")
+    assert big[-1].value == 92233720358547758070000
+
+    with pytest.raises(RuntimeError):
+        TokenBuffer("x := 3 # 4")
+
+
+def test_line_index():
+    """
+    Test that LineIndex resolves token offsets to the right (line, column),
+    including after block comments that span several lines.
+    """
+    code = "x := 1;\n{- two\nline comment -}\n  y := x"
+    lines = LineIndex(code)
+    tokens = list(Tokenize(code))
+    assert [lines.position(t.start) for t in tokens if t.type == 'var'] == [
+            (1, 0), (4, 2), (4, 7)]
+
+    with pytest.raises(RuntimeError, match="line 3"):
+        list(Tokenize("x := 1;\n\ny := @"))
+
+
+def test_dfa_engine_matches_re_engine():
+    """
+    Test that the DFA scanning engine produces exactly the same Tokens
+    (or the same RuntimeError) as the regex engine on every file in the
+    bad_syntax and good_syntax directories.
+    """
+    def scan(content, engine):
+        try:
+            return list(Tokenize(content, engine))
+        except RuntimeError as e:
+            return str(e)
+
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    for sub_dir in ['bad_syntax', 'good_syntax']:
+        directory = os.path.join(tests_dir, sub_dir)
+        for filename in os.listdir(directory):
+            if not filename.endswith('.while'):
+                continue
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
+                content = file.read()
+            assert scan(content, 'dfa') == scan(content, 're'), (
+                    f"DFA and regex engines disagree on {sub_dir}/{filename}")
+            if not isinstance(scan(content, 're'), str):
+                assert list(TokenBuffer(content, 'dfa')) == list(Tokenize(content))
+
+
+def test_nested_block_comments():
+    """
+    Test that block comments nest and that an unclosed (or not fully
+    closed) block comment raises a RuntimeError, for both engines.
+    """
+    code = "x := 1; {- a {- b -} c -} y := 2 {--}"
+    for engine in ['re', 'dfa']:
+        assert [t.value for t in Tokenize(code, engine)] == ['x', ':=', 1, ';', 'y', ':=', 2]
+        with pytest.raises(RuntimeError):
+            list(Tokenize("x := 1 {- a {- b -} c", engine))
+
+
+def test_tokenize_file_in_parallel_chunks(tmp_path):
+    """
+    Test that scanning a file in small parallel chunks gives exactly the
+    same TokenBuffer columns as sequential scanning, even with chunk
+    boundaries near multi-line block comments, and for an empty file
+    (which cannot be memory-mapped).
+    """
+    code = ("x := 1;\n{- a\n{- nested\n-} b\n-}\ny := x + 2; -- {- not a comment\n"
+            * 50) + "skip"
+    path = tmp_path / "big.while"
+    path.write_text(code)
+    expected = TokenBuffer(code)
+    for chunk_size in [1, 17, 100]:
+        tokens = TokenizeFile(str(path), jobs=2, chunk_size=chunk_size)
+        assert tokens.kinds == expected.kinds
+        assert tokens.starts == expected.starts
+        assert tokens.ends == expected.ends
+        assert tokens.values == expected.values
+        assert list(tokens) == list(expected)
+
+    empty = tmp_path / "empty.while"
+    empty.write_text("")
+    tokens = TokenizeFile(str(empty), jobs=2)
+    assert list(tokens) == list(TokenBuffer("")) == []
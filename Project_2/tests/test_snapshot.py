@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trees import AstArena, AstNode
+from cfg import CFG
+from optimizer import Optimizer
+from codegen import RISC_V_CodeGenerator
+from context import CompilationContext
+from astcache import load_ast, save_ast
+from ssa import SSA
+from snapshot import diff_snapshots, load_cfg, read_snapshot, save_cfg
+
+def _assembly(cfg, optimizer):
+    return RISC_V_CodeGenerator("f").generate(cfg.nodes, optimizer)
+
+def _same_cfg(cfg, loaded):
+    assert len(loaded.nodes) == len(cfg.nodes)
+    assert loaded.entry is loaded.nodes[0] and loaded.exit is loaded.nodes[-1]
+    for node, copy in zip(cfg.nodes, loaded.nodes):
+        assert (copy.id, copy.label, copy.type, copy.content) == (
+                node.id, node.label, node.type, node.content)
+        assert [succ.id for succ in copy.succ] == [succ.id for succ in node.succ]
+        assert [pred.id for pred in copy.pred] == [pred.id for pred in node.pred]
+
+def test_snapshot_round_trip(good_syntax_programs, build_ast):
+    """
+    Test that the optimized CFG of every good_syntax program (with an
+    AST of TreeNodes, in an AstArena, or loaded from the AST cache)
+    loads back from its snapshot with the same nodes, edges, AST nodes
+    and sets, and the same assembly code.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "cfg.jsonl")
+        ast_file = os.path.join(directory, "program.ast")
+        for name, code in good_syntax_programs:
+            for kind in ["tree", "arena", "cached"]:
+                ast = build_ast(code, None if kind == "tree" else AstArena())
+                cfg = CFG(ast)
+                optimizer = Optimizer(cfg, report=None)
+                save_cfg(filename, cfg, optimizer)
+                if kind == "cached":
+                    save_ast(ast_file, ast, code)
+                    ast = load_ast(ast_file, code)
+                loaded, loaded_optimizer = load_cfg(filename, ast)
+                _same_cfg(cfg, loaded)
+                for node, copy in zip(cfg.nodes, loaded.nodes):
+                    if kind == "tree":
+                        assert copy.ast is node.ast
+                    elif node.ast is not None:
+                        assert isinstance(copy.ast, AstNode)
+                        assert copy.ast.handle == node.ast.handle
+                    for attribute in ["IN", "OUT", "GEN", "KILL"]:
+                        assert (getattr(loaded_optimizer, attribute)[copy.label]
+                                == getattr(optimizer, attribute)[node.label])
+                assert (loaded_optimizer.interference_graph.coloring
+                        == optimizer.interference_graph.coloring)
+                assert (_assembly(loaded, loaded_optimizer)
+                        == _assembly(cfg, optimizer)), (name, kind)
+                assert diff_snapshots(filename, filename) == []
+
+def test_snapshot_ssa(good_syntax_programs, build_ast):
+    """
+    Test that a CFG translated out of SSA form, whose copies have AST
+    nodes that are not in the tree, round-trips (with its names
+    interned in a new CompilationContext) to the same assembly code.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "cfg.jsonl")
+        for name, code in good_syntax_programs:
+            context = CompilationContext(name, log=None)
+            ast = build_ast(code, context=context)
+            cfg = CFG(ast, context)
+            SSA(cfg, context=context).destruct()
+            optimizer = Optimizer(cfg, report=None, context=context)
+            save_cfg(filename, cfg, optimizer)
+            with open(filename) as f:
+                records = [json.loads(line) for line in f][1:]
+            assert any('tree' in record for record in records) == any(
+                    "." in node.content for node in cfg.nodes), name
+            loaded_context = CompilationContext(name, log=None)
+            loaded, loaded_optimizer = load_cfg(filename, ast, loaded_context)
+            _same_cfg(cfg, loaded)
+            assert loaded_context.passes['optimizer'] is loaded_optimizer
+            assert all(var is loaded_context.intern(var)
+                       for var in loaded_optimizer.IN["entry"])
+            assert (_assembly(loaded, loaded_optimizer)
+                    == _assembly(cfg, optimizer)), name
+
+def test_snapshot_errors_and_diff(build_ast, build_cfg):
+    """
+    Test that snapshots of another tree, another format version, or
+    cut short are not loaded, that a CFG saved without its analysis
+    loads without an Optimizer, and the differences found between the
+    snapshots of two versions of a program.
+    """
+    code = "x := 1; y := 2; while x < 5 do x := x + y od; output := x"
+    with tempfile.TemporaryDirectory() as directory:
+        before = os.path.join(directory, "before.jsonl")
+        after = os.path.join(directory, "after.jsonl")
+        ast = build_ast(code)
+        cfg = CFG(ast)
+        save_cfg(before, cfg)
+        loaded, optimizer = load_cfg(before, ast)
+        assert optimizer is None
+        _same_cfg(cfg, loaded)
+        assert load_cfg(before, build_ast(code)) is None
+        assert load_cfg(before, build_ast(code, AstArena())) is None
+        assert load_cfg(before, build_ast(code + "; skip")) is None
+        assert load_cfg(os.path.join(directory, "missing.jsonl"), ast) is None
+
+        with open(before) as f:
+            lines = f.read().split("\n")
+        with open(after, "w") as f:
+            f.write("\n".join(lines[:-1]))
+        assert read_snapshot(after) is None
+        header = json.loads(lines[0])
+        header['version'] += 1
+        with open(after, "w") as f:
+            f.write("\n".join([json.dumps(header)] + lines[1:]))
+        assert read_snapshot(after) is None
+
+        cfg = build_cfg(code)
+        save_cfg(before, cfg, Optimizer(cfg, report=None))
+        cfg = build_cfg(code)
+        save_cfg(after, cfg, Optimizer(cfg, report=None))
+        assert diff_snapshots(before, after) == []
+        cfg = build_cfg(code.replace("x + y", "x + 1"))
+        save_cfg(after, cfg, Optimizer(cfg, report=None))
+        assert diff_snapshots(before, after) == [
+                "- label_1: y := 2",
+                "~ label_0: successors [1] -> [2]",
+                "~ label_2: IN -['y'] +[]",
+                "~ label_2: OUT -['y'] +[]",
+                "~ label_3: x := x + y -> x := x + 1",
+                "~ label_3: IN -['y'] +[]",
+                "~ label_3: OUT -['y'] +[]",
+                "~ label_3: GEN -['y'] +[]"]
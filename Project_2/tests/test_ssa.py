@@ -0,0 +1,152 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssa import SSA, sequentialize, used_variables
+from optimizer import Optimizer
+from codegen import RISC_V_CodeGenerator
+
+operations = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mult": lambda a, b: a * b,
+    "=": lambda a, b: int(a == b),
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "<=": lambda a, b: int(a <= b),
+    ">=": lambda a, b: int(a >= b),
+    "and": lambda a, b: int(bool(a) and bool(b)),
+    "or": lambda a, b: int(bool(a) or bool(b)),
+}
+
+def _evaluate(node, values):
+    if node.type == "int":
+        return node.value
+    if node.type == "var":
+        return values[node.value]
+    if node.type == "true":
+        return 1
+    if node.type == "false":
+        return 0
+    if node.type == "not":
+        return int(not _evaluate(node.children[0], values))
+    left, right = node.children
+    return operations[node.type](_evaluate(left, values),
+                                 _evaluate(right, values))
+
+def _run(cfg, values, steps=20000):
+    """
+    Run the CFG on the given values of its variables, returning their
+    final values, or None if it takes more than steps statements.
+    """
+    values = dict(values)
+    node = cfg.entry.succ[0]
+    while node is not cfg.exit:
+        steps -= 1
+        if steps == 0:
+            return None
+        if node.type == "condition":
+            node = node.succ[0 if _evaluate(node.ast, values) else 1]
+            continue
+        if node.ast.type == "assign":
+            values[node.ast.children[0].value] = _evaluate(
+                    node.ast.children[1], values)
+        node = node.succ[0]
+    return values
+
+def test_sequentialize():
+    """
+    Test that sequentialized parallel copies (with fan-out, chains and
+    cycles) give every destination the old value of its source.
+    """
+    rng = random.Random(554)
+    names = ["a", "b", "c", "d", "e", "f"]
+    for _ in range(2000):
+        dests = rng.sample(names, rng.randint(1, len(names)))
+        copies = [(dest, rng.choice(names)) for dest in dests]
+        values = {name: i for i, name in enumerate(names)}
+        result = dict(values)
+        for dest, source in sequentialize(copies, "temp"):
+            result[dest] = result[source]
+        for dest, source in copies:
+            assert result[dest] == values[source]
+        for name in set(names) - set(dests):
+            assert result[name] == values[name]
+
+def test_ssa_form(good_syntax_programs, build_cfg):
+    """
+    Test that in SSA form every version is assigned once, every use
+    reads a version defined at a node dominating it (or at the join
+    node of its phi-function), and the phi-functions are complete.
+    """
+    for filename, code in good_syntax_programs:
+        cfg = build_cfg(code)
+        ssa = SSA(cfg)
+        dominators = cfg.dominators()
+        assigned = [node.ast.children[0].value for node in cfg.nodes
+                    if node.type == "other" and node.ast.type == "assign"]
+        targets = [phi.target for phis in ssa.phis.values() for phi in phis]
+        assert len(set(assigned + targets)) == len(assigned + targets)
+        for node in cfg.nodes:
+            if node.type in ["condition", "other"]:
+                for name in used_variables(node.ast):
+                    if name in ssa.definitions:
+                        assert dominators.dominates(ssa.definitions[name],
+                                                    node)
+            for phi in ssa.phis.get(node, ()):
+                assert None not in phi.args
+                for pred, name in zip(node.pred, phi.args):
+                    if name in ssa.definitions:
+                        assert dominators.dominates(ssa.definitions[name],
+                                                    pred)
+
+def test_ssa_round_trip(good_syntax_programs, build_cfg):
+    """
+    Test that translating each good_syntax program into SSA form and
+    back out of it (with all its variables live on exit) computes the
+    same values on random inputs, and that the code generator handles
+    the result. (A few programs loop forever on some inputs, and those
+    runs are not compared.)
+    """
+    rng = random.Random(554)
+    compared = 0
+    for filename, code in good_syntax_programs:
+        original = build_cfg(code)
+        names = sorted({name for node in original.nodes
+                        if node.type in ["condition", "other"]
+                        for name in used_variables(node.ast)}
+                       | {node.ast.children[0].value
+                          for node in original.nodes if node.type == "other"
+                          and node.ast.type == "assign"})
+        cfg = build_cfg(code)
+        ssa = SSA(cfg, outVars=set(names) | {"output"})
+        ssa.destruct()
+        assert ssa.phis == {}
+        assert [node.id for node in cfg.nodes] == list(range(len(cfg.nodes)))
+        for _ in range(5):
+            values = {name: rng.randint(0, 12) for name in names}
+            expected = _run(original, values)
+            if expected is None:
+                continue
+            result = _run(cfg, values, steps=100000)
+            assert result is not None, filename
+            assert ({name: result[name] for name in expected}
+                    == expected), filename
+            compared += 1
+        optimizer = Optimizer(cfg, report=None)
+        assert optimizer.IN["entry"] <= set(names) | {"output"}
+        RISC_V_CodeGenerator("f").generate(cfg.nodes, optimizer)
+    assert compared >= 100
+
+def test_ssa_entry_liveness(good_syntax_programs, build_cfg):
+    """
+    Test that the SSA round trip leaves the variables live on entry
+    (the inputs of the generated C driver) of every good_syntax program
+    unchanged: no copy reads a variable where it is undefined.
+    """
+    for filename, code in good_syntax_programs:
+        expected = Optimizer(build_cfg(code), report=None).IN["entry"]
+        cfg = build_cfg(code)
+        SSA(cfg).destruct()
+        assert Optimizer(cfg, report=None).IN["entry"] == expected, filename
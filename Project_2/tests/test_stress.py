@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scanner import TokenBuffer
+from parser import Parser
+from trees import decorate_ast, insert_labels, generate_dot_from_tree
+from cfg import CFG
+
+def _compile_front_end(code, tmp_path):
+    """
+    Run a program through the parser, decorate_ast, insert_labels,
+    generate_dot_from_tree and CFG, returning the AST and CFG.
+    """
+    parse_tree, ast = Parser(TokenBuffer(code)).parse()
+    ast = ast.root
+    repr(parse_tree.root)
+    generate_dot_from_tree(parse_tree.root, str(tmp_path / "pt.dot"))
+    labels = decorate_ast(ast)
+    generate_dot_from_tree(ast, str(tmp_path / "ast.dot"))
+    labeled_code = insert_labels(ast, code)[0]
+    return ast, labels, labeled_code, CFG(ast)
+
+def test_long_program(tmp_path):
+    """
+    Test that a straight-line program much longer than the recursion
+    limit goes through the front end and CFG construction.
+    """
+    n = 20 * sys.getrecursionlimit()
+    code = ";\n".join(f"x{i % 7} := x{i % 5} + {i}" for i in range(n))
+    ast, labels, labeled_code, cfg = _compile_front_end(code, tmp_path)
+    assert labels == n
+    assert labeled_code.count("{- LABEL") == n
+    assert len(cfg.nodes) == n + 2
+    node = cfg.entry
+    for label in range(n):
+        node = node.succ[0]
+        assert node.label == label
+    assert node.succ == [cfg.exit]
+
+def test_deeply_nested_program(tmp_path):
+    """
+    Test that while and if statements nested far deeper than the
+    recursion limit go through the front end and CFG construction.
+    """
+    depth = 2 * sys.getrecursionlimit()
+    code = ""
+    for i in range(depth):
+        if i % 2:
+            code += f"while x < {i} do x := x + 1;\n"
+        else:
+            code += f"if x = {i} then\n"
+    code += "skip"
+    for i in reversed(range(depth)):
+        code += "\nod" if i % 2 else "\nelse skip fi"
+    ast, labels, labeled_code, cfg = _compile_front_end(code, tmp_path)
+    # one label per condition, per x := x + 1, per skip
+    assert labels == depth + depth // 2 + depth // 2 + 1
+    assert len(cfg.nodes) == labels + 2
+    # the innermost loop body leads back to the innermost condition
+    innermost = [node for node in cfg.nodes
+                 if node.content == f"while x < {depth - 1}"][0]
+    body = innermost.succ[0]
+    assert body.content == "x := x + 1"
+    assert body.succ[0].content == "skip"
+    assert body.succ[0].succ == [innermost]
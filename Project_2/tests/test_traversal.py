@@ -0,0 +1,101 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trees import AstArena, TreeNode
+from traversal import Visitor, Rewriter, preorder, postorder
+
+def test_orders(build_ast):
+    """
+    Test the pre-order and post-order generators, on TreeNodes and on
+    an AstArena.
+    """
+    for arena in [None, AstArena()]:
+        ast = build_ast("x := a + b * c; y := 0", arena)
+        assert [n.value for n in preorder(ast)] == [
+                ';', ':=', 'x', '+', 'a', '*', 'b', 'c', ':=', 'y', 0]
+        assert [n.value for n in postorder(ast)] == [
+                'x', 'a', 'b', 'c', '*', '+', ':=', 'y', 0, ':=', ';']
+        assert [(p.value if p else None, n.value)
+                for p, n in preorder(ast, parents=True)][:3] == [
+                (None, ';'), (';', ':='), (':=', 'x')]
+
+class _Printer(Visitor):
+    """
+    A Visitor that writes an expression back out, fully parenthesized.
+    """
+    def __init__(self):
+        self.pieces = []
+
+    def enter_var(self, node):
+        self.pieces.append(str(node.value))
+
+    enter_int = enter_var
+
+    def leave_var(self, node):
+        pass
+
+    leave_int = leave_assign = leave_var
+
+    def enter_assign(self, node):
+        # only the right-hand side
+        return [node.children[1]]
+
+    def enter_default(self, node):
+        self.pieces.append("(")
+
+    def between_default(self, node, i):
+        self.pieces.append(f" {node.value} ")
+
+    def leave_default(self, node):
+        self.pieces.append(")")
+
+    def enter_lt(self, node):
+        self.pieces.append("[")
+
+    def leave_lt(self, node):
+        self.pieces.append("]")
+
+def test_visitor(build_ast):
+    """
+    Test the order of the Visitor handler calls, the methods for
+    symbolic node types, and enter methods that pick the children.
+    """
+    printer = _Printer().visit(build_ast("x := a - b * (c + 1)"))
+    assert "".join(printer.pieces) == "(a – (b * (c + 1)))"
+    printer = _Printer().visit(build_ast("if a < b then skip else skip fi")
+                               .children[0])
+    assert "".join(printer.pieces) == "[a < b]"
+
+class _Folder(Rewriter):
+    """
+    A Rewriter that folds additions and multiplications of constants.
+    """
+    def _fold(self, node, results):
+        left, right = results
+        if left.type == right.type == "int":
+            value = (left.value + right.value if node.type == "add"
+                     else left.value * right.value)
+            return TreeNode(type="int", value=value)
+        return self.rewrite_default(node, results)
+
+    rewrite_add = rewrite_mult = _fold
+
+def test_rewriter(build_ast):
+    """
+    Test a Rewriter that replaces subtrees.
+    """
+    ast = _Folder().rewrite(build_ast("x := y + 2 * (3 + 4)"))
+    assert [n.value for n in preorder(ast)] == [':=', 'x', '+', 'y', 14]
+    ast = _Folder().rewrite(build_ast("x := 1 + 2 * 3"))
+    assert ast.children[1].value == 7
+
+def test_deep_tree(build_ast):
+    """
+    Test the traversals on a tree much deeper than the recursion limit.
+    """
+    n = 5 * sys.getrecursionlimit()
+    ast = build_ast("x := " + " + ".join(["1"] * n))
+    assert len(list(preorder(ast))) == len(list(postorder(ast))) == 2 * n + 1
+    assert "".join(_Printer().visit(ast).pieces).count("+") == n - 1
+    assert _Folder().rewrite(ast).children[1].value == n
@@ -0,0 +1,178 @@
+"""
+filename:     traversal.py
+description:  Iterative traversals of (abstract syntax) trees: pre-order
+              and post-order generators, and Visitor and Rewriter base
+              classes that dispatch on node type through per-class
+              tables. Created for CS 554 (Compiler Construction) at UNM.
+"""
+
+# Node types that cannot be part of a method name, and the names used
+# for them in handler methods (e.g. enter_lt for a '<' node).
+symbol_names = {'=': 'eq', '<': 'lt', '>': 'gt', '<=': 'le', '>=': 'ge'}
+symbol_kinds = {name: symbol for symbol, name in symbol_names.items()}
+
+def preorder(node, parents=False):
+    '''
+    Generate the nodes of the tree at node in pre-order (each node
+    before its children, the children from left to right), using an
+    explicit stack. With parents=True, generate (parent, node) pairs
+    instead, with None as the parent of the root.
+    '''
+    if not parents:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+        return
+    stack = [(None, node)]
+    while stack:
+        parent, node = stack.pop()
+        yield (parent, node)
+        for child in reversed(node.children):
+            stack.append((node, child))
+
+def postorder(node):
+    '''
+    Generate the nodes of the tree at node in post-order (each node
+    after its children, the children from left to right), using an
+    explicit stack.
+    '''
+    stack = [(node, False)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            yield node
+        else:
+            stack.append((node, True))
+            for child in reversed(node.children):
+                stack.append((child, False))
+
+def _dispatch_table(cls, prefix):
+    '''
+    The table {node type: function} of the methods of class cls named
+    prefix + <node type>, plus the entry None: prefix + 'default' (or
+    None if the class has no default method).
+    '''
+    table = {}
+    for name in dir(cls):
+        if name.startswith(prefix) and name != prefix + 'default':
+            kind = name[len(prefix):]
+            table[symbol_kinds.get(kind, kind)] = getattr(cls, name)
+    table[None] = getattr(cls, prefix + 'default', None)
+    return table
+
+class Visitor:
+    '''
+    Visitor is a base class for passes that walk a tree once, in
+    pre-order, with handler methods for each type of node:
+
+        enter_<type>(self, node)       before the node's children
+        between_<type>(self, node, i)  before its child i, for i > 0
+        leave_<type>(self, node)       after its children
+
+    where <type> is the node's type, or its name in symbol_names (e.g.
+    enter_lt for '<' nodes). The methods enter_default, between_default
+    and leave_default, if defined, handle node types that have no
+    method of their own. An enter method can return False to skip the
+    node's children, or a list of the children to visit; if it returns
+    None (as usual), all of them are visited.
+    The walk uses an explicit stack, so it works on trees of any depth,
+    and the methods are looked up once per Visitor class (in tables
+    keyed by node type), not by name for every node.
+    '''
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # one table {node type: (enter, between, leave)}, with the
+        # defaults for the node types without methods of their own
+        tables = [_dispatch_table(cls, prefix)
+                  for prefix in ['enter_', 'between_', 'leave_']]
+        cls._handlers = {kind: tuple(table.get(kind, table[None])
+                                     for table in tables)
+                         for table in tables for kind in table}
+
+    def visit(self, node):
+        '''
+        Walk the tree at node, calling the handler methods, and return
+        self.
+        '''
+        handlers = self._handlers
+        defaults = handlers[None]
+        # The stack holds the nodes still to be entered, and tuples for
+        # the handler calls due after (some of) a node's children:
+        # (handler, node, i) to call a between handler before child i,
+        # and (handler, node) to call a leave handler.
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.__class__ is tuple:
+                node[0](self, *node[1:])
+                continue
+            enter, between, leave = handlers.get(node.type, defaults)
+            children = enter(self, node) if enter else None
+            if leave:
+                stack.append((leave, node))
+            if children is None:
+                children = node.children
+            elif children is False:
+                continue
+            if between and len(children) > 1:
+                for i in range(len(children) - 1, 0, -1):
+                    stack.append(children[i])
+                    stack.append((between, node, i))
+                stack.append(children[0])
+            else:
+                stack.extend(reversed(children))
+        return self
+
+class Rewriter:
+    '''
+    Rewriter is a base class for passes that compute a result for each
+    node of a tree from the results for its children, bottom-up, such
+    as a new (rewritten) tree or a string. Its handler methods are
+
+        rewrite_<type>(self, node, results)
+
+    with <type> named as for a Visitor, and results the list of the
+    results for the node's children. rewrite_default handles the other
+    node types; unless a subclass overrides it, it gives the node
+    itself, with its children replaced (in place) by their results if
+    any of them changed. The tree is walked with an explicit stack, and
+    methods are found through a per-class table, as for a Visitor.
+    '''
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._rewrite = _dispatch_table(cls, 'rewrite_')
+
+    def rewrite_default(self, node, results):
+        if any(result != child
+               for result, child in zip(results, node.children)):
+            node.children = results
+        return node
+
+    def rewrite(self, node):
+        '''
+        Return the result for the tree at node.
+        '''
+        table = self._rewrite
+        default = table[None]
+        results = []
+        stack = [(node, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                count = len(node.children)
+                if count:
+                    children_results = results[-count:]
+                    del results[-count:]
+                else:
+                    children_results = []
+                handler = table.get(node.type, default)
+                results.append(handler(self, node, children_results))
+            else:
+                stack.append((node, True))
+                for child in reversed(node.children):
+                    stack.append((child, False))
+        return results[0]
@@ -1,3 +1,7 @@
+from array import array
+from artifacts import write_file
+from traversal import Visitor, preorder
+
 # ======================== #
 #    Useful constants      #
 # (in alphabetical order)  #
@@ -62,7 +66,8 @@ class TreeNode:
     which can be reset externally using TreeNode._next_id = n to
     reset the initial id number to n. The unique id can be helpful
     in eventually converting a Tree to DOT code in a .dot file for
-    visualization.
+    visualization. A node given an id (e.g. by a CompilationContext,
+    see context.py) leaves the class-level counter alone.
     '''
 
     # Class-level counter for unique IDs
@@ -73,8 +78,9 @@ class TreeNode:
         Initialize a TreeNode with default attributes plus any specific
         values or additional attributes specified by kwarg arguments.
         '''
-        self.id = TreeNode._next_id
-        TreeNode._next_id += 1
+        if 'id' not in kwargs:
+            self.id = TreeNode._next_id
+            TreeNode._next_id += 1
         self.l = None
         self.type = None
         self.value = None
@@ -84,12 +90,295 @@ class TreeNode:
             setattr(self, key, value)
 
     def __repr__(self):
-        # To facilitate printing and debugging.
-        if self.children == []:
-            return f"{self.value}"
-        # elif self.type == 'var':
-        #     return f"{self.value}"
-        return f"({self.value} --> {self.children})"
+        # To facilitate printing and debugging. Built with an explicit
+        # stack of nodes and closing strings (rather than recursively)
+        # so that very deep trees can still be printed.
+        pieces = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+            elif item.children == []:
+                pieces.append(f"{item.value}")
+            else:
+                pieces.append(f"({item.value} --> [")
+                stack.append("])")
+                for i in range(len(item.children) - 1, -1, -1):
+                    stack.append(item.children[i])
+                    if i > 0:
+                        stack.append(", ")
+        return "".join(pieces)
+
+# The node types an AstArena can hold, and their small-int codes
+ast_kinds = [SEQ, ASSIGN, SKIP, IF, WHILE, ADD, SUB, MULT, AND, OR, NOT,
+             TRUE, FALSE, INT, VAR] + OP_R
+ast_kind_codes = {kind: code for code, kind in enumerate(ast_kinds)}
+
+class AstArena:
+    '''
+    AstArena stores the nodes of an abstract syntax tree (AST) in
+    parallel typed columns instead of one TreeNode object per node.
+    A node is just its integer handle, its position in the columns:
+
+        kinds        array('B')  small-int code of the node type
+                                 (see ast_kinds and ast_kind_codes)
+        values       list        the node's value (as in TreeNode)
+        labels       array('i')  decorate_ast label (-1 for None)
+        indexes      array('i')  source offset (-1 for None)
+        child_start  array('i')  position of the node's first child
+                                 in the edges column
+        child_count  array('B')  number of children
+        edges        array('i')  handles of the children of each node,
+                                 stored contiguously
+        first        array('i')  the lowest handle in the node's subtree
+
+    Parser.parse(arena=AstArena()) builds its AST into an arena, and
+    hands back AstNode views of its nodes (see AstNode), which have
+    the same attributes as TreeNodes, so decorate_ast(), CFG and the
+    code generator work on either kind of tree. Walks over the whole
+    tree that only need the columns (see preorder() and decorate())
+    create no node objects at all.
+    The Parser adds each node after all of the nodes below it, so the
+    subtree of a node is the range of handles from first[node] up to
+    the node itself, and a pass that does not care about the order of
+    the nodes can just loop over that range (see nodes()). An arena
+    keeps track of whether this still holds (contiguous), since nodes
+    can be added, or given new children, in any order.
+    An arena loaded from an AST cache file (see astcache.py) starts out
+    frozen: its columns are memoryviews straight over the file, which
+    can be read, and relabeled, but not extended, so the first add() or
+    set_children() copies them into arrays (see thaw()).
+    '''
+
+    # the typed columns and their array type codes
+    columns = [('kinds', 'B'), ('child_count', 'B'), ('labels', 'i'),
+               ('indexes', 'i'), ('child_start', 'i'), ('first', 'i'),
+               ('edges', 'i')]
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.values = []
+        self.labels = array('i')
+        self.indexes = array('i')
+        self.child_start = array('i')
+        self.child_count = array('B')
+        self.edges = array('i')
+        self.first = array('i')
+        self.contiguous = True
+        self.frozen = False
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def thaw(self):
+        '''
+        Copy the columns of a frozen arena into arrays (and its values
+        into a list), so that nodes can be added and relinked.
+        '''
+        for name, code in self.columns:
+            setattr(self, name, array(code, getattr(self, name).tobytes()))
+        self.values = list(self.values)
+        self.frozen = False
+
+    def add(self, type, value=None, index=None, children=()):
+        '''
+        Add a node with the given type, value, source index and
+        children (AstNode views in this arena) and return a view of it.
+        '''
+        if self.frozen:
+            self.thaw()
+        handle = len(self.kinds)
+        self.kinds.append(ast_kind_codes[type])
+        self.values.append(value)
+        self.labels.append(-1)
+        self.indexes.append(-1 if index is None else index)
+        self.child_start.append(len(self.edges))
+        self.child_count.append(0)
+        self.first.append(handle)
+        if children:
+            self.set_children(handle, [child.handle for child in children])
+        return AstNode(self, handle)
+
+    def set_children(self, handle, children):
+        '''
+        Make the nodes with the given handles the children of a node.
+        They are appended to the edges column as a new range (so a node
+        whose children are replaced leaves its old range unused).
+        '''
+        if self.frozen:
+            self.thaw()
+        self.child_start[handle] = len(self.edges)
+        self.child_count[handle] = len(children)
+        self.edges.extend(children)
+        first = self.first
+        first[handle] = handle
+        if handle != len(first) - 1:
+            # the node may already be in the subtree of a later node
+            self.contiguous = False
+        elif children:
+            # the subtrees of the children must fill the handles just
+            # below the node, in order
+            following = children[1:] + [handle]
+            if all(first[b] == a + 1 for a, b in zip(children, following)):
+                first[handle] = first[children[0]]
+            else:
+                self.contiguous = False
+
+    def children(self, handle):
+        '''
+        The handles of the children of a node.
+        '''
+        start = self.child_start[handle]
+        return self.edges[start:start + self.child_count[handle]]
+
+    def nodes(self, handle):
+        '''
+        The handles of the subtree at the given node, in no particular
+        order: just a range of handles if the arena is contiguous.
+        '''
+        if self.contiguous:
+            return range(self.first[handle], handle + 1)
+        return self.preorder(handle)
+
+    def preorder(self, handle):
+        '''
+        Generate the handles of the subtree at the given node, in
+        pre-order, using an explicit stack.
+        '''
+        edges = self.edges
+        child_start = self.child_start
+        child_count = self.child_count
+        stack = [handle]
+        while stack:
+            handle = stack.pop()
+            yield handle
+            start = child_start[handle]
+            stack.extend(reversed(edges[start:start + child_count[handle]]))
+
+    def decorate(self, handle, label=0):
+        '''
+        decorate_ast() for the subtree at the given node, working
+        directly on the columns.
+        '''
+        kinds = self.kinds
+        labels = self.labels
+        edges = self.edges
+        child_start = self.child_start
+        child_count = self.child_count
+        conditional = {ast_kind_codes[WHILE], ast_kind_codes[IF]}
+        statement = {ast_kind_codes[SKIP], ast_kind_codes[ASSIGN]}
+        seq = ast_kind_codes[SEQ]
+        stack = [handle]
+        while stack:
+            handle = stack.pop()
+            kind = kinds[handle]
+            if kind in conditional:
+                start = child_start[handle]
+                labels[edges[start]] = label
+                label = label+1
+                stack.extend(reversed(
+                        edges[start:start + child_count[handle]]))
+            elif kind in statement:
+                labels[handle] = label
+                label = label+1
+            elif kind == seq:
+                start = child_start[handle]
+                stack.extend(reversed(
+                        edges[start:start + child_count[handle]]))
+        return label
+
+    def label_points(self, handle, label=None):
+        '''
+        label_points() for the subtree at the given node, working
+        directly on the columns.
+        '''
+        labels = self.labels
+        indexes = self.indexes
+        edges = self.edges
+        child_start = self.child_start
+        child_count = self.child_count
+        points = []
+        stack = [(handle, label)]
+        while stack:
+            handle, label = stack.pop()
+            if labels[handle] >= 0:
+                label = labels[handle]
+            count = child_count[handle]
+            if count == 0:
+                if label is not None:
+                    points.append((indexes[handle], label))
+            elif label is not None:
+                stack.append((edges[child_start[handle] + count - 1], label))
+            else:
+                start = child_start[handle]
+                stack.extend((child, None) for child in
+                             reversed(edges[start:start + count]))
+        return points
+
+class AstNode:
+    '''
+    AstNode(arena, handle) is a lightweight view of one node of an
+    AstArena, with the attributes of a TreeNode (id, type, value, l,
+    index, and children) read from and written to the arena's columns.
+    Views are created as they are asked for, so two views of the same
+    node are equal (==) but not necessarily the same object.
+    '''
+
+    __slots__ = ('arena', 'handle')
+
+    def __init__(self, arena, handle):
+        self.arena = arena
+        self.handle = handle
+
+    @property
+    def id(self):
+        return self.handle
+
+    @property
+    def type(self):
+        return ast_kinds[self.arena.kinds[self.handle]]
+
+    @property
+    def value(self):
+        return self.arena.values[self.handle]
+
+    @property
+    def l(self):
+        label = self.arena.labels[self.handle]
+        return None if label < 0 else label
+
+    @l.setter
+    def l(self, label):
+        self.arena.labels[self.handle] = -1 if label is None else label
+
+    @property
+    def index(self):
+        index = self.arena.indexes[self.handle]
+        return None if index < 0 else index
+
+    @index.setter
+    def index(self, index):
+        self.arena.indexes[self.handle] = -1 if index is None else index
+
+    @property
+    def children(self):
+        arena = self.arena
+        return [AstNode(arena, child) for child in arena.children(self.handle)]
+
+    @children.setter
+    def children(self, children):
+        self.arena.set_children(self.handle,
+                                [child.handle for child in children])
+
+    def __eq__(self, other):
+        return (isinstance(other, AstNode) and self.arena is other.arena
+                and self.handle == other.handle)
+
+    def __hash__(self):
+        return hash((id(self.arena), self.handle))
+
+    __repr__ = TreeNode.__repr__
 
 class Tree:
     '''
@@ -311,26 +600,68 @@ def convert_nested_tuple_ast_to_tree(nested_tuple):
 
     return current_node
 
+class _Decorator(Visitor):
+    '''
+    The Visitor behind decorate_ast(), which labels the nodes in the
+    order they are entered.
+    '''
+
+    def __init__(self, label):
+        self.label = label
+
+    def enter_while(self, node):
+        node.children[0].l = self.label
+        self.label = self.label+1
+
+    enter_if = enter_while
+
+    def enter_skip(self, node):
+        node.l = self.label
+        self.label = self.label+1
+        return False
+
+    enter_assign = enter_skip
+
+    def enter_seq(self, node):
+        pass
+
+    def enter_default(self, node):
+        # there is nothing to label inside an expression
+        return False
+
 def decorate_ast(node, label=0):
     '''
     Given a Tree (consisting of a tree of TreeNodes), add unique
     labels to assignment nodes, skip nodes, if conditions, and
-    while conditions.
+    while conditions. The nodes are visited in pre-order (by a
+    Visitor, see traversal.py), so long or deeply nested programs
+    are fine.
     '''
-    if node.value in ['WHILE', 'IF']:
-        node.children[0].l = label
-        label = label+1
-        for child in node.children:
-            label = decorate_ast(child, label)
-    elif node.type in [SKIP, ASSIGN]:
-        node.l = label
-        label = label+1
-    elif node.type in [SEQ]:
-        for child in node.children:
-            label = decorate_ast(child, label)
-    return label
+    if isinstance(node, AstNode):
+        return node.arena.decorate(node.handle, label)
+    return _Decorator(label).visit(node).label
+
+def dot_lines_from_tree(root_node):
+    '''
+    Generate the lines of the DOT language description of the tree
+    at root_node (see generate_dot_from_tree()), one at a time.
+    '''
+    yield "digraph Tree {"
+
+    # pre-order traversal, writing the edge from each node's parent
+    # just before the node
+    for parent, node in preorder(root_node, parents=True):
+        if parent is not None:
+            yield f'    "{parent.id}" -> "{node.id}";'
+        if node.l is not None:
+            yield f'    "{node.id}" [label="{node.value}\n{node.l}"];'
+        else:
+            yield f'    "{node.id}" [label="{node.value}"];'
+
+    yield "}"
 
-def generate_dot_from_tree(root_node, filename="tree.dot"):
+def generate_dot_from_tree(root_node, filename="tree.dot", write=write_file,
+                           log=print):
     '''
     Given a Tree (consisting of a tree of TreeNodes), construct the
     DOT language output corresponding to an undirected graph and
@@ -338,43 +669,82 @@ def generate_dot_from_tree(root_node, filename="tree.dot"):
     should be able to be interpreted by Graphviz or an extension in
     VSCode to visualize the graph.
     Labels for the graph visualization are taken from the 'value'
-    attribute of each TreeNode.
+    attribute of each TreeNode. The lines are streamed to the file
+    by write(filename, lines) (e.g. ArtifactWriter.write_file, see
+    artifacts.py) as they are generated, and the message saying so
+    goes to log() (if not None).
     '''
-    
-    dot_content = ["digraph Tree {"]
+    write(filename, dot_lines_from_tree(root_node))
 
-    def _traverse_and_add_nodes(node):
-        if node.l is not None:
-            dot_content.append(f'    "{node.id}" [label="{node.value}\n{node.l}"];')
-        else:
-            dot_content.append(f'    "{node.id}" [label="{node.value}"];')
-        for child in node.children:
-            dot_content.append(f'    "{node.id}" -> "{child.id}";')
-            _traverse_and_add_nodes(child)
+    if log:
+        log(f"DOT file '{filename}' generated successfully!")
 
-    _traverse_and_add_nodes(root_node)
-    dot_content.append("}")
+class _LabelPoints(Visitor):
+    '''
+    The Visitor behind label_points(). Each node inherits the label
+    of the nearest labeled node above it (kept on self.labels), and
+    below a labeled node only the last child is visited, since the
+    label goes after the last token of the node.
+    '''
 
-    with open(filename, "w") as f:
-        f.write("\n".join(dot_content))
+    def __init__(self, label):
+        self.labels = [label]
+        self.points = []
 
-    print(f"DOT file '{filename}' generated successfully!")
+    def enter_default(self, node):
+        label = node.l if node.l is not None else self.labels[-1]
+        self.labels.append(label)
+        if len(node.children) == 0:
+            if label is not None:
+                self.points.append((node.index, label))
+        elif label is not None:
+            return [node.children[-1]]
 
-def insert_labels(node, while_code, label=None, prev_idx=0, output=""):
-    if node.l is not None:
-        label = node.l
+    def leave_default(self, node):
+        self.labels.pop()
 
-    if len(node.children) == 0:
-        if label is not None:
-            output = output + while_code[prev_idx:node.index] + " {- LABEL " + str(label) + " -}"
-            prev_idx = node.index
-        else:
-            output = output + while_code[prev_idx:]
-    else:
-        if label is not None:
-            (output, prev_idx) = insert_labels(node.children[-1], while_code, label, prev_idx, output)
-        else:
-            for child in node.children:
-                (output, prev_idx) = insert_labels(child, while_code, label, prev_idx, output)
+def label_points(node, label=None):
+    '''
+    Given a decorated AST, return the list of (offset, label) pairs,
+    in source order, at which insert_labels() puts a {- LABEL n -}
+    comment: the end of the last token of each labeled statement or
+    condition.
+    '''
+    if isinstance(node, AstNode):
+        return node.arena.label_points(node.handle, label)
+    return _LabelPoints(label).visit(node).points
 
-    return (output, prev_idx)
+def render_labels(while_code, points, write, prev_idx=0):
+    '''
+    Pass the labeled code for the given label points (see
+    label_points()) to write(), piece by piece, copying while_code
+    from prev_idx on, in one pass over the code.
+    '''
+    for index, label in points:
+        write(while_code[prev_idx:index])
+        write(" {- LABEL " + str(label) + " -}")
+        prev_idx = index
+    write(while_code[prev_idx:])
+
+def insert_labels(node, while_code, label=None, prev_idx=0, output=""):
+    '''
+    Given a decorated AST and the source code it came from, return
+    (labeled_code, prev_idx), where labeled_code is output followed
+    by the code from prev_idx on with a {- LABEL n -} comment after
+    each labeled statement or condition, and prev_idx is the source
+    offset up to which code was copied (the end of the code). The
+    label points are collected in one traversal and the code rendered
+    in one pass, joined once.
+    '''
+    pieces = [output]
+    render_labels(while_code, label_points(node, label), pieces.append,
+                  prev_idx)
+    return ("".join(pieces), len(while_code))
+
+def write_labels(node, while_code, filename):
+    '''
+    Write the labeled code of insert_labels() to the named file, as it
+    is rendered, without building it as one string.
+    '''
+    with open(filename, "w") as f:
+        render_labels(while_code, label_points(node), f.write)